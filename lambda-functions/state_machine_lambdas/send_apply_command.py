@@ -129,6 +129,7 @@ def __get_command_text(event: dict) -> str:
     tags_text = __get_tags_text(event)
 
     base_command = f"""python3 -m terraform_runner --action=apply \
+    --operation={event[OPERATION_KEY]} \
     --provisioned-product-descriptor={f'{event[AWS_ACCOUNT_ID_KEY]}/{event[PROVISIONED_PRODUCT_ID_KEY]}'} \
     --launch-role={event[LAUNCH_ROLE_ARN_KEY]} \
     --artifact-path={event[ARTIFACT_PATH_KEY]} \
@@ -75,6 +75,7 @@ class TestSendApplyCommand(TestCase):
 
         # The indents here are weird because it needs to match the actual command including whitespace.
         expected_command_text = f"""runuser -l ec2-user -c 'python3 -m terraform_runner --action=apply \
+    --operation={mocked_event['operation']} \
     --provisioned-product-descriptor={mocked_event['awsAccountId'] + '/' + mocked_event['provisionedProductId']} \
     --launch-role={mocked_event['launchRoleArn']} \
     --artifact-path={mocked_event['artifactPath']} \
@@ -144,6 +145,7 @@ class TestSendApplyCommand(TestCase):
 
         # The indents here are weird because it needs to match the actual command including whitespace.
         expected_command_text = f"""runuser -l ec2-user -c 'python3 -m terraform_runner --action=apply \
+    --operation={mocked_event['operation']} \
     --provisioned-product-descriptor={mocked_event['awsAccountId'] + '/' + mocked_event['provisionedProductId']} \
     --launch-role={mocked_event['launchRoleArn']} \
     --artifact-path={mocked_event['artifactPath']} \
@@ -218,6 +220,7 @@ class TestSendApplyCommand(TestCase):
 
         # The indents here are weird because it needs to match the actual command including whitespace.
         expected_command_text = f"""runuser -l ec2-user -c 'python3 -m terraform_runner --action=apply \
+    --operation={mocked_event['operation']} \
     --provisioned-product-descriptor={mocked_event['awsAccountId'] + '/' + mocked_event['provisionedProductId']} \
     --launch-role={mocked_event['launchRoleArn']} \
     --artifact-path={mocked_event['artifactPath']} \
@@ -0,0 +1,159 @@
+"""Compares the artifact download modes of terraform_runner against a local S3 stand-in.
+
+Run from the wrapper-scripts directory:
+
+    python3 -m benchmarks.artifact_download_benchmark [--large-size-mb 128] [--bandwidth-mbps 0] [--iterations 3]
+
+The small artifacts are the samples in sample-provisioning-artifacts. The large artifact is generated with a mix of
+compressible and random files. A per-request bandwidth limit makes the stand-in behave like a network transfer, which
+is where overlapping extraction with the download and concurrent ranged requests pay off.
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import tarfile
+import tempfile
+import time
+from glob import glob
+from unittest.mock import Mock, patch
+
+from terraform_runner.artifact_manager import download_artifact, DOWNLOAD_MODES
+
+# Constants
+SAMPLE_ARTIFACTS_PATTERN = os.path.join(os.path.dirname(__file__), '..', '..', 'sample-provisioning-artifacts', '*.tar.gz')
+BYTES_PER_MB = 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+SYNTHETIC_FILE_SIZE = 4 * BYTES_PER_MB
+ARTIFACT_BUCKET = 'benchmark-bucket'
+
+
+class ThrottledReader(io.RawIOBase):
+    """A file-like S3 object body that reads from a local file at a limited rate"""
+
+    def __init__(self, path, bandwidth_bytes_per_second, start=0, length=None):
+        self.__file_handle = open(path, 'rb')
+        self.__file_handle.seek(start)
+        self.__remaining = os.path.getsize(path) - start if length is None else length
+        self.__bandwidth_bytes_per_second = bandwidth_bytes_per_second
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.__file_handle.read(min(len(buffer), CHUNK_SIZE, self.__remaining))
+        self.__remaining -= len(data)
+        if self.__bandwidth_bytes_per_second:
+            time.sleep(len(data) / self.__bandwidth_bytes_per_second)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.__file_handle.close()
+        super().close()
+
+
+class LocalS3(object):
+    """Serves the objects that terraform_runner downloads from local files.
+    The bandwidth limit applies to each request, like the per-connection throughput of S3.
+    """
+
+    def __init__(self, objects, bandwidth_bytes_per_second):
+        self.__objects = objects
+        self.__bandwidth_bytes_per_second = bandwidth_bytes_per_second
+
+    def head_object(self, Bucket, Key, **kwargs):
+        return {'ContentLength': os.path.getsize(self.__objects[Key]), 'ETag': self.__get_etag(Key)}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, VersionId=None, **kwargs):
+        # The objects are not versioned, so like S3 only the ETag can be matched
+        if IfMatch is not None and IfMatch != self.__get_etag(Key):
+            raise RuntimeError(f'PreconditionFailed: {Key} does not match {IfMatch}')
+        if VersionId not in (None, 'null'):
+            raise RuntimeError(f'NoSuchVersion: {Key} has no version {VersionId}')
+        if Range:
+            start, end = (int(value) for value in Range[len('bytes='):].split('-'))
+            return {'Body': ThrottledReader(self.__objects[Key], self.__bandwidth_bytes_per_second, start, end - start + 1)}
+        return {'Body': ThrottledReader(self.__objects[Key], self.__bandwidth_bytes_per_second)}
+
+    def __get_etag(self, key):
+        file_status = os.stat(self.__objects[key])
+        return f'"{file_status.st_size:x}-{file_status.st_mtime_ns:x}"'
+
+    def download_file(self, bucket, key, file_name, ExtraArgs=None, Callback=None):
+        with ThrottledReader(self.__objects[key], self.__bandwidth_bytes_per_second) as source:
+            with open(file_name, 'wb') as destination:
+                shutil.copyfileobj(source, destination, CHUNK_SIZE)
+        if Callback:
+            Callback(os.path.getsize(file_name))
+
+
+def create_synthetic_artifact(path, size_bytes):
+    """Writes a tar.gz with a root module and enough files to reach roughly the requested uncompressed size"""
+    with tarfile.open(path, 'w:gz') as tar_file:
+        content = b'variable "name" {}\n'
+        member = tarfile.TarInfo('main.tf')
+        member.size = len(content)
+        tar_file.addfile(member, io.BytesIO(content))
+
+        written = 0
+        index = 0
+        while written < size_bytes:
+            # Alternate random data, which does not compress, with repetitive data, which compresses well
+            if index % 2:
+                content = os.urandom(SYNTHETIC_FILE_SIZE)
+            else:
+                content = (b'resource "null_resource" "r%d" {}\n' % index) * (SYNTHETIC_FILE_SIZE // 40)
+            member = tarfile.TarInfo(f'vendor/file-{index}.bin')
+            member.size = len(content)
+            tar_file.addfile(member, io.BytesIO(content))
+            written += len(content)
+            index += 1
+
+
+def run_benchmark(name, artifact_file, download_mode, iterations, bandwidth_bytes_per_second, part_size, max_workers):
+    s3 = LocalS3({name: artifact_file}, bandwidth_bytes_per_second)
+    sts = Mock()
+    sts.assume_role.return_value = {'Credentials': {'AccessKeyId': '', 'SecretAccessKey': '', 'SessionToken': ''}}
+
+    durations = []
+    with patch('terraform_runner.artifact_manager.boto3.client',
+               side_effect=lambda service, **kwargs: sts if service == 'sts' else s3):
+        for _ in range(iterations):
+            with tempfile.TemporaryDirectory() as workspace_dir:
+                start_time = time.monotonic()
+                download_artifact('benchmark-launch-role', f's3://{ARTIFACT_BUCKET}/{name}', workspace_dir,
+                                  download_mode=download_mode, part_size=part_size, max_workers=max_workers)
+                durations.append(time.monotonic() - start_time)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--large-size-mb', type=int, default=128,
+                        help='Uncompressed size of the synthetic large artifact in MB')
+    parser.add_argument('--bandwidth-mbps', type=float, default=0,
+                        help='Simulated download bandwidth in MB per second. 0 is unlimited.')
+    parser.add_argument('--iterations', type=int, default=3, help='Runs per artifact and mode. The median is reported.')
+    parser.add_argument('--part-size-mb', type=int, default=16, help='Part size of the parallel download mode')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent requests of the parallel download mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as artifacts_dir:
+        artifacts = {os.path.basename(path): path for path in glob(SAMPLE_ARTIFACTS_PATTERN)}
+        large_artifact = os.path.join(artifacts_dir, 'synthetic-large.tar.gz')
+        create_synthetic_artifact(large_artifact, args.large_size_mb * BYTES_PER_MB)
+        artifacts[os.path.basename(large_artifact)] = large_artifact
+
+        bandwidth_bytes_per_second = args.bandwidth_mbps * BYTES_PER_MB
+        print(f'{"artifact":<32} {"compressed MB":>14} ' + ' '.join(f'{mode + " s":>10}' for mode in DOWNLOAD_MODES))
+        for name, path in sorted(artifacts.items()):
+            results = [run_benchmark(name, path, mode, args.iterations, bandwidth_bytes_per_second,
+                                     args.part_size_mb * BYTES_PER_MB, args.workers) for mode in DOWNLOAD_MODES]
+            print(f'{name:<32} {os.path.getsize(path) / BYTES_PER_MB:>14.2f} '
+                  + ' '.join(f'{result:>10.3f}' for result in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Compares the decompression backends terraform_runner uses to extract artifacts.
+
+Run from the wrapper-scripts directory:
+
+    python3 -m benchmarks.artifact_extract_benchmark [--large-size-mb 500] [--iterations 3]
+
+Every artifact is extracted in file mode from a local S3 stand-in without a bandwidth limit, so the times are
+dominated by decompression and writing the files. Each tar.gz artifact is measured with the Python gzip module and
+with pigz, and again after recompressing it as tar.zst. Backends whose command is not installed are reported as n/a.
+"""
+import argparse
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+from glob import glob
+from unittest.mock import patch
+
+from benchmarks.artifact_download_benchmark import create_synthetic_artifact, run_benchmark, BYTES_PER_MB, \
+    SAMPLE_ARTIFACTS_PATTERN
+from terraform_runner.artifact_manager import DOWNLOAD_MODE_FILE
+
+# Constants
+BACKENDS = ['gzip module', 'pigz', 'zstd']
+ZSTD_COMPRESSION_LEVEL = '-3'
+
+
+def recompress_as_zstd(gzip_file, zstd_file):
+    # The file descriptor of a gzip file object is the compressed file, so the decompressed data is piped to zstd
+    process = subprocess.Popen(['zstd', '-q', '-f', ZSTD_COMPRESSION_LEVEL, '-o', zstd_file], stdin=subprocess.PIPE)
+    with gzip.open(gzip_file, 'rb') as source:
+        shutil.copyfileobj(source, process.stdin, BYTES_PER_MB)
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f'zstd could not compress {gzip_file}')
+
+
+def measure(name, path, iterations, decompression_commands=None):
+    if decompression_commands is None:
+        return run_benchmark(name, path, DOWNLOAD_MODE_FILE, iterations, 0, 0, 0)
+    with patch('terraform_runner.artifact_manager.DECOMPRESSION_COMMANDS', decompression_commands):
+        return run_benchmark(name, path, DOWNLOAD_MODE_FILE, iterations, 0, 0, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--large-size-mb', type=int, default=500,
+                        help='Uncompressed size of the synthetic large artifact in MB')
+    parser.add_argument('--iterations', type=int, default=3, help='Runs per artifact and backend. The median is reported.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as artifacts_dir:
+        artifacts = {os.path.basename(path): path for path in glob(SAMPLE_ARTIFACTS_PATTERN)}
+        large_artifact = os.path.join(artifacts_dir, 'synthetic-large.tar.gz')
+        create_synthetic_artifact(large_artifact, args.large_size_mb * BYTES_PER_MB)
+        artifacts[os.path.basename(large_artifact)] = large_artifact
+
+        print(f'{"artifact":<32} {"gz MB":>8} {"zst MB":>8} ' + ' '.join(f'{backend + " s":>14}' for backend in BACKENDS))
+        for name, path in sorted(artifacts.items()):
+            results = [measure(name, path, args.iterations, decompression_commands=[])]
+            results.append(measure(name, path, args.iterations) if shutil.which('pigz') else None)
+
+            zstd_size = None
+            if shutil.which('zstd'):
+                zstd_name = name.replace('.tar.gz', '.tar.zst')
+                zstd_path = os.path.join(artifacts_dir, zstd_name)
+                recompress_as_zstd(path, zstd_path)
+                zstd_size = os.path.getsize(zstd_path) / BYTES_PER_MB
+                results.append(measure(zstd_name, zstd_path, args.iterations))
+            else:
+                results.append(None)
+
+            zstd_column = f'{zstd_size:>8.2f}' if zstd_size is not None else f'{"n/a":>8}'
+            print(f'{name:<32} {os.path.getsize(path) / BYTES_PER_MB:>8.2f} {zstd_column} '
+                  + ' '.join(f'{result:>14.3f}' if result is not None else f'{"n/a":>14}' for result in results))
+
+
+if __name__ == '__main__':
+    main()
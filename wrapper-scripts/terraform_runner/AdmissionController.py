@@ -0,0 +1,110 @@
+import os
+import time
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import try_open_held_lock
+from terraform_runner.host_resources import get_available_memory, get_disk_usage
+
+# Constants
+SLOT_FILE_NAME_FORMAT = 'slot-{}.lock'
+POLL_INTERVAL_SECONDS = 2
+
+
+class AdmissionController:
+
+    def __init__(self, log: CustomLogger, slots_directory: str, max_slots: int, memory_per_run_bytes: int,
+                 disk_per_run_bytes: int, disk_path: str):
+        """Limits how many runs execute at the same time on the host. Every run holds the lock of one slot file, so
+        slots held by runs that crash are released by the kernel.
+
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        slots_directory: str
+            The host-wide directory of the slot lock files
+        max_slots: int
+            The most runs allowed at once, usually derived from the CPU count
+        memory_per_run_bytes: int
+            The available memory a new run needs. Fewer slots are offered while memory is short.
+        disk_per_run_bytes: int
+            The free disk space a new run needs. Fewer slots are offered while disk space is short.
+        disk_path: str
+            The directory the runs write their workspaces to
+        """
+        self.__log = log
+        self.__slots_directory = slots_directory
+        self.__max_slots = max_slots
+        self.__memory_per_run_bytes = memory_per_run_bytes
+        self.__disk_per_run_bytes = disk_per_run_bytes
+        self.__disk_path = disk_path
+        self.__slot_file_descriptor = None
+
+    def acquire_slot(self, timeout_seconds: float):
+        """Waits until the host can take another run and holds a slot for it until release_slot is called.
+        Raises RuntimeError when no slot frees up before the timeout.
+        """
+        start_time = time.monotonic()
+        while True:
+            held_count, slot_file_descriptor = self.__try_acquire_slot()
+            if slot_file_descriptor is not None:
+                self.__slot_file_descriptor = slot_file_descriptor
+                self.__log.info(f'Admitted to run after waiting {time.monotonic() - start_time:.1f} seconds. '
+                                f'{held_count + 1} runs are active on this host.')
+                return
+
+            waited_seconds = time.monotonic() - start_time
+            if waited_seconds >= timeout_seconds:
+                raise RuntimeError(f'Timed out after {waited_seconds:.0f} seconds waiting for capacity to run on this '
+                                   f'host. {held_count} runs are active.')
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    def release_slot(self):
+        if self.__slot_file_descriptor is not None:
+            os.close(self.__slot_file_descriptor)
+            self.__slot_file_descriptor = None
+
+    def get_active_run_count(self) -> int:
+        """Returns the number of runs holding a slot on the host, including this one"""
+        held_count = 0
+        for slot in range(self.__max_slots):
+            slot_file_descriptor = try_open_held_lock(self.__get_slot_file(slot))
+            if slot_file_descriptor is None:
+                held_count += 1
+            else:
+                os.close(slot_file_descriptor)
+        return held_count
+
+    def __try_acquire_slot(self):
+        # Returns the number of slots held by other runs, and the file descriptor of a free slot when the host has
+        # room for one more run
+        held_count = 0
+        free_slot_file_descriptor = None
+        for slot in range(self.__max_slots):
+            slot_file_descriptor = try_open_held_lock(self.__get_slot_file(slot))
+            if slot_file_descriptor is None:
+                held_count += 1
+            elif free_slot_file_descriptor is None:
+                free_slot_file_descriptor = slot_file_descriptor
+            else:
+                os.close(slot_file_descriptor)
+
+        if free_slot_file_descriptor is not None and held_count >= self.__get_capacity(held_count):
+            os.close(free_slot_file_descriptor)
+            free_slot_file_descriptor = None
+        return held_count, free_slot_file_descriptor
+
+    def __get_capacity(self, held_count):
+        # Memory and disk already used by active runs are gone from what is available, so the runs that the remaining
+        # resources can take are added to the active ones. One run is always allowed on an idle host.
+        capacity = self.__max_slots
+        available_memory = get_available_memory()
+        if available_memory is not None and self.__memory_per_run_bytes > 0:
+            capacity = min(capacity, held_count + available_memory // self.__memory_per_run_bytes)
+        if self.__disk_per_run_bytes > 0:
+            free_disk = get_disk_usage(self.__disk_path).free
+            capacity = min(capacity, held_count + free_disk // self.__disk_per_run_bytes)
+        return max(capacity, 1)
+
+    def __get_slot_file(self, slot):
+        return os.path.join(self.__slots_directory, SLOT_FILE_NAME_FORMAT.format(slot))
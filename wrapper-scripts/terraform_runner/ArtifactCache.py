@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import downgrade_held_lock, open_held_lock, try_acquire_lock
+
+# Constants
+ARTIFACT_FILE_NAME = 'artifact'
+METADATA_FILE_NAME = 'metadata.json'
+LOCKS_DIRECTORY_NAME = 'locks'
+ENTRIES_DIRECTORY_NAME = 'entries'
+TEMPORARY_FILE_SUFFIX = '.tmp'
+
+# S3 response keys
+ETAG_KEY = 'ETag'
+VERSION_ID_KEY = 'VersionId'
+CONTENT_LENGTH_KEY = 'ContentLength'
+
+
+class ArtifactCache:
+
+    def __init__(self, log: CustomLogger, cache_directory: str, max_size_bytes: int):
+        """
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        cache_directory: str
+            The host-local directory where downloaded artifacts are kept between runs
+        max_size_bytes: int
+            The disk budget for cached artifacts. Least recently used artifacts are evicted beyond it.
+        """
+        self.__log = log
+        self.__cache_directory = cache_directory
+        self.__max_size_bytes = max_size_bytes
+        self.__held_lock_file_descriptors = {}
+        self.__hit_count = 0
+        self.__miss_count = 0
+        self.__bytes_downloaded = 0
+        self.__bytes_saved = 0
+
+    def get_artifact(self, s3, bucket: str, key: str, downloader=None) -> str:
+        """Returns the path of a local copy of an S3 object, downloading it only when the cached copy is missing or stale.
+
+        The cached copy is revalidated against the object's current ETag and VersionId. Concurrent runs asking for
+        the same object wait for a single download. The returned file stays protected from eviction until close is called.
+
+        Parameters:
+
+        s3: S3.Client
+            The client used to revalidate and download the object
+        bucket: str
+            The bucket of the object
+        key: str
+            The key of the object
+        downloader: callable
+            Called as downloader(s3, bucket, key, destination, extra_args) to download the object.
+            Default is None, which uses S3.Client.download_file.
+        """
+        entry_id = hashlib.sha256(f'{bucket}/{key}'.encode()).hexdigest()
+        entry_directory = os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME, entry_id)
+        artifact_file = os.path.join(entry_directory, ARTIFACT_FILE_NAME)
+        metadata_file = os.path.join(entry_directory, METADATA_FILE_NAME)
+
+        # This run already validated the entry and holds it, so it cannot have changed
+        if entry_id in self.__held_lock_file_descriptors:
+            self.__hit_count += 1
+            return artifact_file
+
+        # Hold the entry lock exclusively while checking and downloading so concurrent runs download only once
+        lock_file_descriptor = open_held_lock(self.__get_lock_file(entry_id))
+        self.__held_lock_file_descriptors[entry_id] = lock_file_descriptor
+
+        head_response = s3.head_object(Bucket=bucket, Key=key)
+        current_metadata = {
+            'bucket': bucket,
+            'key': key,
+            'etag': head_response.get(ETAG_KEY),
+            'version_id': head_response.get(VERSION_ID_KEY),
+            'size': head_response.get(CONTENT_LENGTH_KEY)
+        }
+
+        if self.__is_fresh(artifact_file, metadata_file, current_metadata):
+            self.__hit_count += 1
+            self.__bytes_saved += current_metadata['size'] or 0
+            os.utime(metadata_file)
+            self.__log.info(f'Artifact cache hit for s3://{bucket}/{key}, skipped downloading {current_metadata["size"]} bytes')
+        else:
+            self.__miss_count += 1
+            self.__download(s3, downloader, entry_directory, artifact_file, metadata_file, current_metadata)
+
+        # Other runs may read the entry concurrently, but it cannot be replaced or evicted while the shared lock is held
+        downgrade_held_lock(lock_file_descriptor)
+        self.__evict()
+        return artifact_file
+
+    def close(self):
+        """Releases the locks on all artifacts returned by this object, allowing them to be evicted"""
+        for file_descriptor in self.__held_lock_file_descriptors.values():
+            os.close(file_descriptor)
+        self.__held_lock_file_descriptors = {}
+
+    def get_hit_count(self) -> int:
+        return self.__hit_count
+
+    def get_miss_count(self) -> int:
+        return self.__miss_count
+
+    def get_bytes_downloaded(self) -> int:
+        return self.__bytes_downloaded
+
+    def log_statistics(self):
+        """Logs the hit and miss counters of this run"""
+        self.__log.info(f'Artifact cache statistics: hits={self.__hit_count} misses={self.__miss_count} '
+                        f'bytes_downloaded={self.__bytes_downloaded} bytes_saved={self.__bytes_saved}')
+
+    def __get_lock_file(self, entry_id):
+        # Lock files live outside the entry directories so that eviction never removes a lock someone is waiting on
+        return os.path.join(self.__cache_directory, LOCKS_DIRECTORY_NAME, f'{entry_id}.lock')
+
+    def __is_fresh(self, artifact_file, metadata_file, current_metadata):
+        if not os.path.isfile(artifact_file) or not os.path.isfile(metadata_file):
+            return False
+        try:
+            with open(metadata_file, 'r') as json_file:
+                cached_metadata = json.load(json_file)
+        except (OSError, ValueError):
+            return False
+
+        if current_metadata['version_id']:
+            return cached_metadata.get('version_id') == current_metadata['version_id']
+        return cached_metadata.get('etag') == current_metadata['etag']
+
+    def __download(self, s3, downloader, entry_directory, artifact_file, metadata_file, current_metadata):
+        os.makedirs(entry_directory, exist_ok=True)
+        temporary_file = f'{artifact_file}{TEMPORARY_FILE_SUFFIX}'
+
+        # Pin the download to the revalidated object so a concurrent upload cannot be cached under the wrong validator.
+        # S3.Client.download_file does not accept IfMatch, so without a version ID the ETag is checked again afterwards.
+        if current_metadata['version_id']:
+            extra_args = {VERSION_ID_KEY: current_metadata['version_id']}
+        else:
+            extra_args = {}
+
+        start_time = time.monotonic()
+        if downloader:
+            downloader(s3, current_metadata['bucket'], current_metadata['key'], temporary_file, extra_args)
+        else:
+            s3.download_file(current_metadata['bucket'], current_metadata['key'], temporary_file, ExtraArgs=extra_args)
+        elapsed_seconds = time.monotonic() - start_time
+
+        if not current_metadata['version_id']:
+            etag = s3.head_object(Bucket=current_metadata['bucket'], Key=current_metadata['key']).get(ETAG_KEY)
+            if etag != current_metadata['etag']:
+                os.remove(temporary_file)
+                raise RuntimeError(f'Artifact s3://{current_metadata["bucket"]}/{current_metadata["key"]} changed '
+                                   f'while it was downloaded')
+
+        os.replace(temporary_file, artifact_file)
+        with open(metadata_file, 'w') as json_file:
+            json.dump(current_metadata, json_file)
+
+        size = os.path.getsize(artifact_file)
+        self.__bytes_downloaded += size
+        self.__log.info(f'Artifact cache miss for s3://{current_metadata["bucket"]}/{current_metadata["key"]}, '
+                        f'downloaded {size} bytes in {elapsed_seconds:.2f} seconds')
+
+    def __evict(self):
+        entries_directory = os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME)
+        entries = []
+        total_size = 0
+        for entry_id in os.listdir(entries_directory):
+            entry_directory = os.path.join(entries_directory, entry_id)
+            try:
+                size = os.path.getsize(os.path.join(entry_directory, ARTIFACT_FILE_NAME))
+                last_used = os.path.getmtime(os.path.join(entry_directory, METADATA_FILE_NAME))
+            except OSError:
+                continue
+            entries.append((last_used, entry_id, size))
+            total_size += size
+
+        for _, entry_id, size in sorted(entries):
+            if total_size <= self.__max_size_bytes:
+                break
+            # Entries locked by a running process are in use and are skipped
+            with try_acquire_lock(self.__get_lock_file(entry_id)) as acquired:
+                if not acquired:
+                    continue
+                shutil.rmtree(os.path.join(entries_directory, entry_id), ignore_errors=True)
+            total_size -= size
+            self.__log.info(f'Evicted artifact cache entry {entry_id} of {size} bytes')
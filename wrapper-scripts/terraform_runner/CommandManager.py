@@ -1,8 +1,14 @@
 import subprocess
+import threading
+from collections import deque
 
 from terraform_runner.CustomLogger import CustomLogger
 
 SUCCESS_RETURN_CODE = 0
+# The number of trailing stderr lines kept for the error message of a failed streamed command
+STDERR_TAIL_LINES = 200
+# Longer lines are read, logged, and kept in the tail in pieces of this many characters
+MAX_LINE_LENGTH = 8192
 
 
 class CommandManager:
@@ -16,25 +22,73 @@ class CommandManager:
         """
         self.__log = log
 
-    def run_command(self, command: list, log_stdout: bool = False):
-        """
+    def run_command(self, command: list, log_stdout: bool = False, stream_output: bool = False,
+                    allowed_return_codes: tuple = (SUCCESS_RETURN_CODE,)) -> int:
+        """Runs a command and returns its return code. Raises RuntimeError with the stderr of the command when the
+        return code is not allowed.
+
         Parameters:
 
         command: list of str
             The command and arguments to run
         log_stdout: bool
             When True, logs the stdout of the command given a successful run. Default is False.
+        stream_output: bool
+            When True, logs stdout and stderr line by line while the command runs instead of capturing them, and only
+            the last lines of stderr are kept for the error message. Memory use does not grow with the output size.
+            Default is False.
+        allowed_return_codes: tuple of int
+            The return codes of a successful run. Default is (0,).
         """
         self.__log.info(f'Runnning command: {command}')
 
+        if stream_output:
+            return self.__run_streaming_command(command, allowed_return_codes)
+
         result = None
         try:
             result = subprocess.run(command, check=False, text=True, capture_output=True)
         except Exception as e:
             raise RuntimeError(f'subprocess.run raise and exception while running command {command}: {e}')
 
-        if result.returncode != SUCCESS_RETURN_CODE:
+        if result.returncode not in allowed_return_codes:
             raise RuntimeError(result.stderr)
 
         if log_stdout:
             self.__log.info(result.stdout)
+        return result.returncode
+
+    def __run_streaming_command(self, command, allowed_return_codes):
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       text=True, errors='replace')
+        except Exception as e:
+            raise RuntimeError(f'subprocess.Popen raise and exception while running command {command}: {e}')
+
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        # Both pipes are drained at the same time so the command never blocks on a full pipe
+        stderr_thread = threading.Thread(target=self.__log_lines, args=(process.stderr, stderr_tail), daemon=True)
+        stderr_thread.start()
+        try:
+            self.__log_lines(process.stdout)
+        except BaseException:
+            # A signal that stops the run reaches the process group of the command as well. The command is left to
+            # stop gracefully, as terraform does when it saves its state, without blocking on a full pipe meanwhile.
+            for _ in iter(lambda: process.stdout.read(MAX_LINE_LENGTH), ''):
+                pass
+            process.stdout.close()
+            process.wait()
+            raise
+        stderr_thread.join()
+
+        return_code = process.wait()
+        if return_code not in allowed_return_codes:
+            raise RuntimeError(''.join(stderr_tail))
+        return return_code
+
+    def __log_lines(self, stream, tail: deque = None):
+        for line in iter(lambda: stream.readline(MAX_LINE_LENGTH), ''):
+            self.__log.info(line.rstrip('\n'))
+            if tail is not None:
+                tail.append(line)
+        stream.close()
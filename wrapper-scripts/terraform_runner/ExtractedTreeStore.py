@@ -0,0 +1,275 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import time
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import acquire_lock, open_held_lock, try_acquire_lock
+from terraform_runner.override_manager import BACKEND_FILE_NAME, PROVIDER_FILE_NAME, VARIABLE_FILE_NAME
+from terraform_runner.workspace_reaper import move_to_trash, start_trash_reaper, TRASH_DIRECTORY_NAME
+
+# Constants
+TREES_DIRECTORY_NAME = 'trees'
+METADATA_DIRECTORY_NAME = 'metadata'
+LOCKS_DIRECTORY_NAME = 'locks'
+REFERENCES_DIRECTORY_NAME = 'references'
+TEMPORARY_DIRECTORY_SUFFIX = '.tmp'
+DIGEST_FILE_SUFFIX = '.sha256'
+HASH_CHUNK_SIZE = 1024 * 1024
+# The Linux ioctl that makes a file share the blocks of another on file systems such as XFS and Btrfs
+FICLONE = 0x40049409
+# Files the runner writes into the workspace root after extraction. They are copied so that writing them can never
+# change a tree in the store.
+GENERATED_FILE_NAMES = (BACKEND_FILE_NAME, VARIABLE_FILE_NAME, PROVIDER_FILE_NAME)
+
+# Metadata keys
+SIZE_KEY = 'size'
+FILE_COUNT_KEY = 'file_count'
+
+# Digest file keys
+IDENTITY_KEY = 'identity'
+DIGEST_KEY = 'digest'
+
+
+class ExtractedTreeStore:
+
+    def __init__(self, log: CustomLogger, store_directory: str, max_size_bytes: int):
+        """Keeps the extracted files of artifacts on the host, keyed by the SHA-256 digest of the artifact, so that an
+        artifact is extracted once and every later workspace is filled with hard links to its tree.
+
+        Tree files are read-only, because a hard link shares its content with the tree. Trees are referenced with a
+        shared lock by every run using them, and only unreferenced trees are evicted.
+
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        store_directory: str
+            The host-local directory of the extracted trees. Hard links need it on the same file system as the
+            workspaces, and files are copied otherwise.
+        max_size_bytes: int
+            The disk budget for extracted trees. Least recently used trees are evicted beyond it.
+        """
+        self.__log = log
+        self.__store_directory = store_directory
+        self.__max_size_bytes = max_size_bytes
+        self.__reference_file_descriptors = {}
+        self.__hit_count = 0
+        self.__miss_count = 0
+
+    def materialize(self, artifact_file: str, destination_directory: str, extract_tree) -> bool:
+        """Fills the destination directory with the extracted files of an artifact, extracting it only when no run on
+        the host has extracted the same content before. Files already in the destination with the same names are
+        replaced, as extraction would. The tree stays protected from eviction until release is called.
+
+        Returns the result of extract_tree when the artifact was extracted, and True when its tree was in the store.
+
+        Parameters:
+
+        artifact_file: str
+            The local artifact
+        destination_directory: str
+            The directory to fill, usually the workspace
+        extract_tree: callable
+            Called as extract_tree(directory) to extract the artifact into an empty directory. Returns False when the
+            artifact must not be used, in which case nothing is stored or materialized.
+        """
+        # An artifact downloaded into the destination is new on every run, so its digest is not worth keeping
+        is_downloaded_artifact = os.path.dirname(os.path.abspath(artifact_file)) == \
+            os.path.abspath(destination_directory)
+        digest = self.__get_digest(artifact_file, keep_digest=not is_downloaded_artifact)
+        tree_directory = os.path.join(self.__store_directory, TREES_DIRECTORY_NAME, digest)
+
+        # The reference is taken before the tree is looked at, so it cannot be evicted between the check and the links
+        if digest not in self.__reference_file_descriptors:
+            self.__reference_file_descriptors[digest] = open_held_lock(self.__get_reference_file(digest), shared=True)
+
+        # Concurrent runs of a new artifact wait for a single extraction
+        with acquire_lock(self.__get_lock_file(digest)):
+            if os.path.isdir(tree_directory):
+                self.__hit_count += 1
+                os.utime(self.__get_metadata_file(digest))
+            else:
+                self.__miss_count += 1
+                if not self.__extract(digest, tree_directory, extract_tree):
+                    return False
+
+        start_time = time.monotonic()
+        file_count = self.__link_tree(tree_directory, destination_directory)
+        self.__log.info(f'Materialized {file_count} files of extracted tree {digest} into {destination_directory} '
+                        f'in {time.monotonic() - start_time:.3f} seconds')
+        self.__evict()
+        return True
+
+    def release(self):
+        """Releases the references to all trees materialized by this object, allowing them to be evicted"""
+        for file_descriptor in self.__reference_file_descriptors.values():
+            os.close(file_descriptor)
+        self.__reference_file_descriptors = {}
+
+    def get_hit_count(self) -> int:
+        return self.__hit_count
+
+    def get_miss_count(self) -> int:
+        return self.__miss_count
+
+    def __get_lock_file(self, digest):
+        return os.path.join(self.__store_directory, LOCKS_DIRECTORY_NAME, f'{digest}.lock')
+
+    def __get_reference_file(self, digest):
+        return os.path.join(self.__store_directory, REFERENCES_DIRECTORY_NAME, f'{digest}.lock')
+
+    def __get_metadata_file(self, digest):
+        # Its mtime is the last use of the tree
+        return os.path.join(self.__store_directory, METADATA_DIRECTORY_NAME, f'{digest}.json')
+
+    def __get_digest(self, artifact_file, keep_digest):
+        # Cached artifacts are hashed once. The digest is kept next to the artifact with the identity of the file it
+        # was computed from, and a replaced artifact is hashed again.
+        artifact_stat = os.stat(artifact_file)
+        identity = [artifact_stat.st_ino, artifact_stat.st_size, artifact_stat.st_mtime_ns]
+        digest_file = f'{artifact_file}{DIGEST_FILE_SUFFIX}'
+        if keep_digest:
+            try:
+                with open(digest_file, 'r') as json_file:
+                    recorded = json.load(json_file)
+                if recorded[IDENTITY_KEY] == identity:
+                    return recorded[DIGEST_KEY]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        digest = hashlib.sha256()
+        with open(artifact_file, 'rb') as file_handle:
+            for chunk in iter(lambda: file_handle.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        if keep_digest:
+            # Written aside and renamed, so runs sharing a cached artifact never read a partial digest file
+            temporary_file = f'{digest_file}.{os.getpid()}'
+            try:
+                with open(temporary_file, 'w') as json_file:
+                    json.dump({IDENTITY_KEY: identity, DIGEST_KEY: digest.hexdigest()}, json_file)
+                os.replace(temporary_file, digest_file)
+            except OSError:
+                pass
+        return digest.hexdigest()
+
+    def __extract(self, digest, tree_directory, extract_tree):
+        # Trees are extracted next to their final location and renamed into place, so a tree directory is always
+        # complete. A temporary directory left by a crashed run is replaced.
+        temporary_directory = f'{tree_directory}{TEMPORARY_DIRECTORY_SUFFIX}'
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        os.makedirs(temporary_directory)
+        try:
+            if not extract_tree(temporary_directory):
+                return False
+            size, file_count = self.__make_read_only(temporary_directory)
+            # The metadata comes first, so eviction can find every tree even after a crash
+            metadata_file = self.__get_metadata_file(digest)
+            os.makedirs(os.path.dirname(metadata_file), exist_ok=True)
+            with open(metadata_file, 'w') as json_file:
+                json.dump({SIZE_KEY: size, FILE_COUNT_KEY: file_count}, json_file)
+            os.rename(temporary_directory, tree_directory)
+        finally:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self.__log.info(f'Extracted tree {digest} of {file_count} files and {size} bytes into the store')
+        return True
+
+    def __make_read_only(self, directory):
+        size = 0
+        file_count = 0
+        for parent, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                path = os.path.join(parent, file_name)
+                file_stat = os.lstat(path)
+                if stat.S_ISREG(file_stat.st_mode):
+                    os.chmod(path, stat.S_IMODE(file_stat.st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                size += file_stat.st_size
+                file_count += 1
+        return size, file_count
+
+    def __link_tree(self, tree_directory, destination_directory):
+        file_count = 0
+        for parent, directory_names, file_names in os.walk(tree_directory):
+            relative_parent = os.path.relpath(parent, tree_directory)
+            destination_parent = os.path.normpath(os.path.join(destination_directory, relative_parent))
+            os.makedirs(destination_parent, exist_ok=True)
+            # Links to directories are listed with the directories but are not walked into
+            for name in directory_names + file_names:
+                source = os.path.join(parent, name)
+                if name in directory_names and not os.path.islink(source):
+                    continue
+                is_generated_file = relative_parent == os.curdir and name in GENERATED_FILE_NAMES
+                self.__place_file(source, os.path.join(destination_parent, name), is_generated_file)
+                file_count += 1
+        return file_count
+
+    def __place_file(self, source, destination, is_generated_file):
+        if os.path.lexists(destination):
+            os.remove(destination)
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), destination)
+            return
+        if not is_generated_file:
+            try:
+                os.link(source, destination)
+                return
+            except OSError:
+                # The destination is on another file system, or the file has too many links
+                pass
+            if self.__try_reflink(source, destination):
+                return
+        shutil.copy2(source, destination)
+        # Copies share nothing with the tree and stay writable like extracted files
+        os.chmod(destination, stat.S_IMODE(os.stat(destination).st_mode) | stat.S_IWUSR)
+
+    def __try_reflink(self, source, destination):
+        try:
+            with open(source, 'rb') as source_handle, open(destination, 'wb') as destination_handle:
+                fcntl.ioctl(destination_handle.fileno(), FICLONE, source_handle.fileno())
+        except OSError:
+            try:
+                os.remove(destination)
+            except FileNotFoundError:
+                pass
+            return False
+        shutil.copystat(source, destination)
+        os.chmod(destination, stat.S_IMODE(os.stat(destination).st_mode) | stat.S_IWUSR)
+        return True
+
+    def __evict(self):
+        metadata_directory = os.path.join(self.__store_directory, METADATA_DIRECTORY_NAME)
+        entries = []
+        total_size = 0
+        for metadata_name in os.listdir(metadata_directory):
+            digest = metadata_name[:-len('.json')]
+            metadata_file = os.path.join(metadata_directory, metadata_name)
+            try:
+                with open(metadata_file, 'r') as json_file:
+                    size = json.load(json_file)[SIZE_KEY]
+                last_used = os.path.getmtime(metadata_file)
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, digest, size))
+            total_size += size
+
+        trash_directory = os.path.join(self.__store_directory, TRASH_DIRECTORY_NAME)
+        evicted_count = 0
+        for _, digest, size in sorted(entries):
+            if total_size <= self.__max_size_bytes:
+                break
+            # Trees referenced by a running process are in use and are skipped
+            with try_acquire_lock(self.__get_reference_file(digest)) as acquired:
+                if not acquired:
+                    continue
+                move_to_trash(os.path.join(self.__store_directory, TREES_DIRECTORY_NAME, digest), trash_directory)
+                os.remove(self.__get_metadata_file(digest))
+            total_size -= size
+            evicted_count += 1
+            self.__log.info(f'Evicted extracted tree {digest} of {size} bytes')
+
+        if evicted_count:
+            start_trash_reaper(trash_directory)
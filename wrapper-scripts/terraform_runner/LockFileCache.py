@@ -0,0 +1,119 @@
+import os
+import shutil
+from glob import glob
+
+from terraform_runner.content_hash import hash_directory
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.WorkspaceManager import CONFIGURATION_FINGERPRINT_EXCLUDED_NAMES, DEPENDENCY_LOCK_FILE_NAME
+
+# Constants
+ENTRIES_DIRECTORY_NAME = 'entries'
+CONFIGURATION_FILES_PATTERN = '*.tf'
+
+
+class LockFileCache:
+
+    def __init__(self, log: CustomLogger, cache_directory: str, max_entries: int):
+        """Keeps the dependency lock file terraform init writes for an artifact that ships without one, keyed by the
+        content of the artifact's configuration. Later runs of the same artifact start init with that lock file, so
+        Terraform installs the recorded provider versions instead of resolving the version constraints again.
+
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        cache_directory: str
+            The host-local directory where lock files are kept between runs
+        max_entries: int
+            The number of lock files above which the least recently used are evicted
+        """
+        self.__log = log
+        self.__cache_directory = cache_directory
+        self.__max_entries = max_entries
+        self.__unrecorded_fingerprints = {}
+        self.__injected_fingerprints = {}
+        self.__hit_count = 0
+        self.__miss_count = 0
+
+    def inject_lock_file(self, workspace_directory: str) -> bool:
+        """Copies the cached lock file into a workspace without one before terraform init. Returns True when a lock
+        file was injected. Lock files shipped in the artifact, or kept in a retained workspace, are left alone.
+        Workspaces without configuration files of their own, such as those of destroy runs, are left alone as well.
+        Their fingerprint would be the same for every product, which would pin every one of them to the provider
+        versions of the first.
+        """
+        lock_file = os.path.join(workspace_directory, DEPENDENCY_LOCK_FILE_NAME)
+        if os.path.exists(lock_file) or not glob(os.path.join(workspace_directory, CONFIGURATION_FILES_PATTERN)):
+            return False
+
+        fingerprint = hash_directory(workspace_directory, CONFIGURATION_FINGERPRINT_EXCLUDED_NAMES)
+        entry_file = self.__get_entry_file(fingerprint)
+        try:
+            shutil.copyfile(entry_file, lock_file)
+        except FileNotFoundError:
+            self.__miss_count += 1
+            self.__unrecorded_fingerprints[workspace_directory] = fingerprint
+            return False
+
+        # Entries are evicted by last use
+        os.utime(entry_file)
+        self.__hit_count += 1
+        self.__injected_fingerprints[workspace_directory] = fingerprint
+        self.__log.info(f'Injected the dependency lock file recorded for configuration {fingerprint}')
+        return True
+
+    def record_lock_file(self, workspace_directory: str):
+        """Records the lock file written by a successful terraform init in a workspace that had none before it, and
+        evicts the least recently used entries beyond the maximum
+        """
+        fingerprint = self.__unrecorded_fingerprints.pop(workspace_directory, None)
+        lock_file = os.path.join(workspace_directory, DEPENDENCY_LOCK_FILE_NAME)
+        if not fingerprint or not os.path.isfile(lock_file):
+            return
+
+        entries_directory = os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME)
+        os.makedirs(entries_directory, exist_ok=True)
+        entry_file = self.__get_entry_file(fingerprint)
+        # Copied aside and renamed, so concurrent runs never inject a partial lock file
+        temporary_file = f'{entry_file}.{os.getpid()}'
+        shutil.copyfile(lock_file, temporary_file)
+        os.replace(temporary_file, entry_file)
+        self.__log.info(f'Recorded the dependency lock file for configuration {fingerprint}')
+        self.__evict(entries_directory)
+
+    def discard_lock_file(self, workspace_directory: str):
+        """Removes the cached lock file injected into a workspace whose terraform init failed, so the next run of the
+        artifact resolves its providers again
+        """
+        fingerprint = self.__injected_fingerprints.pop(workspace_directory, None)
+        if not fingerprint:
+            return
+        try:
+            os.remove(self.__get_entry_file(fingerprint))
+            self.__log.info(f'Discarded the dependency lock file recorded for configuration {fingerprint}')
+        except FileNotFoundError:
+            pass
+
+    def get_hit_count(self) -> int:
+        return self.__hit_count
+
+    def get_miss_count(self) -> int:
+        return self.__miss_count
+
+    def __get_entry_file(self, fingerprint):
+        return os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME, f'{fingerprint}.hcl')
+
+    def __evict(self, entries_directory):
+        entries = []
+        for entry_name in os.listdir(entries_directory):
+            entry_file = os.path.join(entries_directory, entry_name)
+            try:
+                entries.append((os.path.getmtime(entry_file), entry_file))
+            except FileNotFoundError:
+                pass
+
+        for _, entry_file in sorted(entries)[:max(len(entries) - self.__max_entries, 0)]:
+            try:
+                os.remove(entry_file)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from terraform_runner.content_hash import hash_directory
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import acquire_lock, open_held_lock, try_acquire_lock
+from terraform_runner.WorkspaceManager import CONFIGURATION_FINGERPRINT_EXCLUDED_NAMES, TERRAFORM_DATA_DIRECTORY_NAME
+
+# Constants
+ENTRIES_DIRECTORY_NAME = 'entries'
+INDEXES_DIRECTORY_NAME = 'indexes'
+LOCKS_DIRECTORY_NAME = 'locks'
+PACKAGE_DIRECTORY_NAME = 'package'
+METADATA_FILE_NAME = 'metadata.json'
+TEMPORARY_DIRECTORY_SUFFIX = '.tmp'
+MODULES_DIRECTORY = os.path.join(TERRAFORM_DATA_DIRECTORY_NAME, 'modules')
+MODULE_MANIFEST_FILE_NAME = 'modules.json'
+MAX_INDEX_COUNT = 10000
+# Sources pinned to a full commit SHA always fetch the same content. Other sources without a registry version are not
+# cached, because they may change between runs, and so are branch and tag refs, which can be moved.
+PINNED_SOURCE_PATTERN = re.compile(r'[?&]ref=([0-9a-fA-F]{40}|[0-9a-fA-F]{64})(&|$)')
+
+# Module manifest keys, as written by terraform init
+MODULES_KEY = 'Modules'
+KEY_KEY = 'Key'
+SOURCE_KEY = 'Source'
+VERSION_KEY = 'Version'
+DIR_KEY = 'Dir'
+
+# Metadata keys
+SIZE_KEY = 'size'
+
+
+class ModuleCache:
+
+    def __init__(self, log: CustomLogger, cache_directory: str, max_size_bytes: int):
+        """Keeps the remote modules terraform init downloads, keyed by module source and version, and installs them
+        into later workspaces of the same configuration before terraform init runs, so init finds them installed.
+
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        cache_directory: str
+            The host-local directory where modules are kept between runs
+        max_size_bytes: int
+            The disk budget for cached modules. Least recently used modules are evicted beyond it.
+        """
+        self.__log = log
+        self.__cache_directory = cache_directory
+        self.__max_size_bytes = max_size_bytes
+        self.__hit_count = 0
+        self.__miss_count = 0
+
+    def install_modules(self, workspace_directory: str) -> bool:
+        """Installs the remote modules the configuration in the workspace used when it was last initialized on the
+        host, along with the module manifest terraform init recorded for them. Returns True when the modules were
+        installed, and False when the configuration was not seen before, the workspace already has modules, or any of
+        the modules was evicted or comes from a source that is not pinned to a version.
+        """
+        manifest_file = os.path.join(workspace_directory, MODULES_DIRECTORY, MODULE_MANIFEST_FILE_NAME)
+        if os.path.exists(manifest_file):
+            return False
+        fingerprint = hash_directory(workspace_directory, CONFIGURATION_FINGERPRINT_EXCLUDED_NAMES)
+        index_file = self.__get_index_file(fingerprint)
+        try:
+            with open(index_file, 'r') as json_file:
+                manifest = json.load(json_file)
+        except (FileNotFoundError, ValueError):
+            return False
+        os.utime(index_file)
+
+        modules = self.__get_remote_modules(manifest)
+        # terraform init would take a module in the manifest for installed, so every module must come from the cache
+        if not all(self.__is_cacheable(module) for module in modules):
+            return False
+        # Shared locks keep the modules from being evicted while they are copied
+        lock_file_descriptors = []
+        try:
+            for module in modules:
+                entry_id = self.__get_entry_id(module)
+                lock_file_descriptors.append(open_held_lock(self.__get_lock_file(entry_id), shared=True))
+                if not os.path.isdir(self.__get_package_directory(entry_id)):
+                    self.__log.info(f'Module cache is missing {module[SOURCE_KEY]}, so terraform init installs all '
+                                    f'modules')
+                    return False
+
+            modules_directory = os.path.join(workspace_directory, MODULES_DIRECTORY)
+            try:
+                for module in modules:
+                    entry_id = self.__get_entry_id(module)
+                    shutil.copytree(self.__get_package_directory(entry_id),
+                                    os.path.join(modules_directory, module[KEY_KEY]), symlinks=True)
+                    os.utime(self.__get_metadata_file(entry_id))
+            except OSError as e:
+                # terraform init installs the modules as usual into a clean modules directory
+                shutil.rmtree(modules_directory, ignore_errors=True)
+                self.__log.info(f'Could not install modules from the module cache: {e}')
+                return False
+        finally:
+            for file_descriptor in lock_file_descriptors:
+                os.close(file_descriptor)
+
+        with open(manifest_file, 'w') as json_file:
+            json.dump(manifest, json_file)
+        self.__hit_count += len(modules)
+        self.__log.info(f'Installed {len(modules)} modules from the module cache')
+        return True
+
+    def store_modules(self, workspace_directory: str):
+        """Adds the remote modules installed by terraform init in the workspace to the cache, records which modules
+        the configuration uses, and evicts the least recently used modules beyond the disk budget
+        """
+        manifest_file = os.path.join(workspace_directory, MODULES_DIRECTORY, MODULE_MANIFEST_FILE_NAME)
+        try:
+            with open(manifest_file, 'r') as json_file:
+                manifest = json.load(json_file)
+        except FileNotFoundError:
+            return
+
+        for module in self.__get_remote_modules(manifest):
+            if not self.__is_cacheable(module):
+                continue
+            entry_id = self.__get_entry_id(module)
+            # Concurrent runs that downloaded the same module store it only once
+            with acquire_lock(self.__get_lock_file(entry_id)):
+                if os.path.isdir(self.__get_package_directory(entry_id)):
+                    os.utime(self.__get_metadata_file(entry_id))
+                    continue
+                self.__miss_count += 1
+                self.__store_package(entry_id, os.path.join(workspace_directory, MODULES_DIRECTORY, module[KEY_KEY]))
+                self.__log.info(f'Stored module {module[SOURCE_KEY]} {module.get(VERSION_KEY) or ""} '
+                                f'in the module cache')
+
+        indexes_directory = os.path.join(self.__cache_directory, INDEXES_DIRECTORY_NAME)
+        os.makedirs(indexes_directory, exist_ok=True)
+        fingerprint = hash_directory(workspace_directory, CONFIGURATION_FINGERPRINT_EXCLUDED_NAMES)
+        index_file = self.__get_index_file(fingerprint)
+        # Written aside and renamed, so concurrent runs never read a partial index
+        temporary_file = f'{index_file}.{os.getpid()}'
+        with open(temporary_file, 'w') as json_file:
+            json.dump(manifest, json_file)
+        os.replace(temporary_file, index_file)
+
+        self.__evict_indexes(indexes_directory)
+        self.__evict()
+
+    def get_hit_count(self) -> int:
+        return self.__hit_count
+
+    def get_miss_count(self) -> int:
+        return self.__miss_count
+
+    def __get_remote_modules(self, manifest):
+        modules = []
+        for module in manifest.get(MODULES_KEY, []):
+            key = module.get(KEY_KEY)
+            if not key:
+                continue
+            # Remote modules are installed in a directory named after their key. Local modules are used where they
+            # are, in the configuration or in the package of a remote module.
+            package_directory = os.path.join(MODULES_DIRECTORY, key)
+            module_directory = os.path.normpath(module.get(DIR_KEY, ''))
+            if module_directory == package_directory or module_directory.startswith(package_directory + os.sep):
+                modules.append(module)
+        return modules
+
+    def __is_cacheable(self, module):
+        return bool(module.get(VERSION_KEY) or PINNED_SOURCE_PATTERN.search(module.get(SOURCE_KEY, '')))
+
+    def __get_entry_id(self, module):
+        return hashlib.sha256(f'{module[SOURCE_KEY]}\0{module.get(VERSION_KEY) or ""}'.encode()).hexdigest()
+
+    def __get_lock_file(self, entry_id):
+        # Lock files live outside the entry directories so that eviction never removes a lock someone is waiting on
+        return os.path.join(self.__cache_directory, LOCKS_DIRECTORY_NAME, f'{entry_id}.lock')
+
+    def __get_package_directory(self, entry_id):
+        return os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME, entry_id, PACKAGE_DIRECTORY_NAME)
+
+    def __get_metadata_file(self, entry_id):
+        # Its mtime is the last use of the module
+        return os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME, entry_id, METADATA_FILE_NAME)
+
+    def __get_index_file(self, fingerprint):
+        return os.path.join(self.__cache_directory, INDEXES_DIRECTORY_NAME, f'{fingerprint}.json')
+
+    def __store_package(self, entry_id, source_directory):
+        entry_directory = os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME, entry_id)
+        temporary_directory = f'{entry_directory}{TEMPORARY_DIRECTORY_SUFFIX}'
+        shutil.rmtree(entry_directory, ignore_errors=True)
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        try:
+            shutil.copytree(source_directory, os.path.join(temporary_directory, PACKAGE_DIRECTORY_NAME), symlinks=True)
+            size = 0
+            for parent, _, file_names in os.walk(temporary_directory):
+                size += sum(os.lstat(os.path.join(parent, file_name)).st_size for file_name in file_names)
+            with open(os.path.join(temporary_directory, METADATA_FILE_NAME), 'w') as json_file:
+                json.dump({SIZE_KEY: size}, json_file)
+            # A complete entry appears with a single rename
+            os.rename(temporary_directory, entry_directory)
+        finally:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+
+    def __evict_indexes(self, indexes_directory):
+        indexes = []
+        for index_name in os.listdir(indexes_directory):
+            index_file = os.path.join(indexes_directory, index_name)
+            try:
+                indexes.append((os.path.getmtime(index_file), index_file))
+            except FileNotFoundError:
+                pass
+
+        for _, index_file in sorted(indexes)[:max(len(indexes) - MAX_INDEX_COUNT, 0)]:
+            try:
+                os.remove(index_file)
+            except FileNotFoundError:
+                pass
+
+    def __evict(self):
+        entries_directory = os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME)
+        entries = []
+        total_size = 0
+        for entry_id in os.listdir(entries_directory):
+            metadata_file = self.__get_metadata_file(entry_id)
+            try:
+                with open(metadata_file, 'r') as json_file:
+                    size = json.load(json_file)[SIZE_KEY]
+                last_used = os.path.getmtime(metadata_file)
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, entry_id, size))
+            total_size += size
+
+        for _, entry_id, size in sorted(entries):
+            if total_size <= self.__max_size_bytes:
+                break
+            # Modules being copied by a running process are skipped
+            with try_acquire_lock(self.__get_lock_file(entry_id)) as acquired:
+                if not acquired:
+                    continue
+                shutil.rmtree(os.path.join(entries_directory, entry_id), ignore_errors=True)
+            total_size -= size
+            self.__log.info(f'Evicted module cache entry {entry_id} of {size} bytes')
@@ -0,0 +1,104 @@
+import queue
+import threading
+
+# Constants
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_BUFFERED_CHUNKS = 8
+
+
+class ReadAheadStream:
+
+    def __init__(self, source, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_buffered_chunks: int = DEFAULT_MAX_BUFFERED_CHUNKS):
+        """A file-like wrapper that keeps reading a source stream on a background thread, so that a slow producer such
+        as a network download overlaps with the consumer. At most max_buffered_chunks chunks are held in memory.
+
+        Parameters:
+
+        source: file-like object
+            The stream to read, for example an S3 GetObject body
+        chunk_size: int
+            The size of each read from the source
+        max_buffered_chunks: int
+            The number of chunks read ahead of the consumer
+        """
+        self.__source = source
+        self.__chunk_size = chunk_size
+        self.__chunks = queue.Queue(maxsize=max_buffered_chunks)
+        # The current chunk and how much of it was consumed. Slicing off the consumed part on every read would copy
+        # the rest of the chunk each time.
+        self.__pending = b''
+        self.__pending_offset = 0
+        self.__finished = False
+        self.__closed = threading.Event()
+        self.__bytes_read = 0
+        self.__thread = threading.Thread(target=self.__read_source, daemon=True)
+        self.__thread.start()
+
+    def read(self, size: int = -1) -> bytes:
+        """Returns up to size bytes, blocking until data is available. Returns b'' at the end of the stream."""
+        while self.__pending_offset == len(self.__pending) and not self.__finished:
+            self.__pending = self.__next_chunk()
+            self.__pending_offset = 0
+
+        available = len(self.__pending) - self.__pending_offset
+        if size is None or size < 0 or size > available:
+            size = available
+        data = self.__pending[self.__pending_offset:self.__pending_offset + size]
+        self.__pending_offset += size
+        self.__bytes_read += size
+        return data
+
+    def peek(self, size: int) -> bytes:
+        """Returns up to size bytes from the start of the unread data without consuming them"""
+        while len(self.__pending) - self.__pending_offset < size and not self.__finished:
+            self.__pending = self.__pending[self.__pending_offset:] + self.__next_chunk()
+            self.__pending_offset = 0
+        return self.__pending[self.__pending_offset:self.__pending_offset + size]
+
+    def get_bytes_read(self) -> int:
+        return self.__bytes_read
+
+    def close(self):
+        """Stops the background reader and closes the source"""
+        self.__closed.set()
+        # Unblock the reader if it is waiting for space in the queue
+        while self.__thread.is_alive():
+            try:
+                self.__chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.__source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __next_chunk(self):
+        chunk = self.__chunks.get()
+        if isinstance(chunk, Exception):
+            self.__finished = True
+            raise chunk
+        if not chunk:
+            self.__finished = True
+        return chunk
+
+    def __read_source(self):
+        try:
+            while not self.__closed.is_set():
+                chunk = self.__source.read(self.__chunk_size)
+                self.__put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self.__put(e)
+
+    def __put(self, item):
+        while not self.__closed.is_set():
+            try:
+                self.__chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
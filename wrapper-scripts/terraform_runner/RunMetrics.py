@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import acquire_lock
+
+# Constants
+SUMMARY_PREFIX = 'RUN_SUMMARY'
+METRIC_PREFIX = 'terraform_runner'
+# Upper bounds in seconds of the phase duration histogram buckets, from which dashboards derive percentiles
+DURATION_BUCKETS_SECONDS = [0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600]
+STATE_FILE_SUFFIX = '.state.json'
+TEMPORARY_FILE_SUFFIX = '.tmp'
+SUCCESS_STATUS = 'success'
+FAILURE_STATUS = 'failure'
+
+# Summary and state keys
+ACTION_KEY = 'action'
+PROVISIONED_PRODUCT_DESCRIPTOR_KEY = 'provisioned_product_descriptor'
+STATUS_KEY = 'status'
+TOTAL_SECONDS_KEY = 'total_seconds'
+PHASE_SECONDS_KEY = 'phase_seconds'
+COUNTERS_KEY = 'counters'
+HISTOGRAMS_KEY = 'histograms'
+RUNS_KEY = 'runs'
+BUCKET_COUNTS_KEY = 'bucket_counts'
+COUNT_KEY = 'count'
+SUM_KEY = 'sum'
+
+
+class RunMetrics:
+
+    def __init__(self, log: CustomLogger, action: str, provisioned_product_descriptor: str):
+        """Collects the duration of each phase of a run and counters such as bytes downloaded and cache hits.
+
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        action: str
+            The action of the run
+        provisioned_product_descriptor: str
+            The descriptor of the provisioned product the run works on
+        """
+        self.__log = log
+        self.__action = action
+        self.__provisioned_product_descriptor = provisioned_product_descriptor
+        self.__start_time = time.monotonic()
+        self.__phase_seconds = {}
+        self.__counters = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the body of the context as the named phase. The time of repeated phases adds up."""
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase_seconds(name, time.monotonic() - start_time)
+
+    def add_phase_seconds(self, name: str, seconds: float):
+        self.__phase_seconds[name] = self.__phase_seconds.get(name, 0) + seconds
+
+    def add_counter(self, name: str, value: int = 1):
+        self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def get_summary(self, exit_code) -> dict:
+        return {
+            ACTION_KEY: self.__action,
+            PROVISIONED_PRODUCT_DESCRIPTOR_KEY: self.__provisioned_product_descriptor,
+            STATUS_KEY: SUCCESS_STATUS if exit_code == 0 else FAILURE_STATUS,
+            TOTAL_SECONDS_KEY: round(time.monotonic() - self.__start_time, 3),
+            PHASE_SECONDS_KEY: {name: round(seconds, 3) for name, seconds in self.__phase_seconds.items()},
+            COUNTERS_KEY: dict(self.__counters)
+        }
+
+    def log_summary(self, exit_code):
+        """Logs the metrics of the run as a single JSON line that log queries can parse"""
+        self.__log.info(f'{SUMMARY_PREFIX} {json.dumps(self.get_summary(exit_code), sort_keys=True)}')
+
+    def write_textfile(self, textfile: str, exit_code):
+        """Adds the run to the host-wide totals in a node exporter textfile collector file.
+
+        Phase durations are histograms and the run count and counters are totals, all accumulated across the runs on
+        the host in a state file next to the textfile. Failures are logged and do not fail the run.
+        """
+        try:
+            summary = self.get_summary(exit_code)
+            # Concurrent runs update the same totals
+            with acquire_lock(f'{textfile}.lock'):
+                state = self.__read_state(f'{textfile}{STATE_FILE_SUFFIX}')
+                self.__add_to_state(state, summary)
+                self.__write_atomically(f'{textfile}{STATE_FILE_SUFFIX}', json.dumps(state))
+                self.__write_atomically(textfile, self.__format_textfile(state))
+        except Exception as e:
+            self.__log.error(f'Could not write metrics textfile {textfile}: {e}')
+
+    def __read_state(self, state_file):
+        try:
+            with open(state_file, 'r') as json_file:
+                return json.load(json_file)
+        except (FileNotFoundError, ValueError):
+            return {RUNS_KEY: {}, COUNTERS_KEY: {}, HISTOGRAMS_KEY: {}}
+
+    def __add_to_state(self, state, summary):
+        run_key = f'{summary[ACTION_KEY]}/{summary[STATUS_KEY]}'
+        state[RUNS_KEY][run_key] = state[RUNS_KEY].get(run_key, 0) + 1
+        for name, value in summary[COUNTERS_KEY].items():
+            state[COUNTERS_KEY][name] = state[COUNTERS_KEY].get(name, 0) + value
+
+        phase_seconds = dict(summary[PHASE_SECONDS_KEY])
+        phase_seconds['total'] = summary[TOTAL_SECONDS_KEY]
+        for phase, seconds in phase_seconds.items():
+            histogram = state[HISTOGRAMS_KEY].setdefault(f'{summary[ACTION_KEY]}/{phase}', {
+                BUCKET_COUNTS_KEY: [0] * len(DURATION_BUCKETS_SECONDS), COUNT_KEY: 0, SUM_KEY: 0})
+            for index, upper_bound in enumerate(DURATION_BUCKETS_SECONDS):
+                if seconds <= upper_bound:
+                    histogram[BUCKET_COUNTS_KEY][index] += 1
+            histogram[COUNT_KEY] += 1
+            histogram[SUM_KEY] += seconds
+
+    def __format_textfile(self, state):
+        lines = [f'# HELP {METRIC_PREFIX}_runs_total Runs by action and status',
+                 f'# TYPE {METRIC_PREFIX}_runs_total counter']
+        for run_key, count in sorted(state[RUNS_KEY].items()):
+            action, status = run_key.split('/')
+            lines.append(f'{METRIC_PREFIX}_runs_total{{action="{action}",status="{status}"}} {count}')
+
+        for name, value in sorted(state[COUNTERS_KEY].items()):
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name}_total counter')
+            lines.append(f'{METRIC_PREFIX}_{name}_total {value}')
+
+        lines.append(f'# HELP {METRIC_PREFIX}_phase_duration_seconds Duration of each phase of a run')
+        lines.append(f'# TYPE {METRIC_PREFIX}_phase_duration_seconds histogram')
+        for histogram_key, histogram in sorted(state[HISTOGRAMS_KEY].items()):
+            action, phase = histogram_key.split('/')
+            labels = f'action="{action}",phase="{phase}"'
+            for upper_bound, count in zip(DURATION_BUCKETS_SECONDS, histogram[BUCKET_COUNTS_KEY]):
+                lines.append(f'{METRIC_PREFIX}_phase_duration_seconds_bucket{{{labels},le="{upper_bound}"}} {count}')
+            lines.append(f'{METRIC_PREFIX}_phase_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram[COUNT_KEY]}')
+            lines.append(f'{METRIC_PREFIX}_phase_duration_seconds_sum{{{labels}}} {round(histogram[SUM_KEY], 3)}')
+            lines.append(f'{METRIC_PREFIX}_phase_duration_seconds_count{{{labels}}} {histogram[COUNT_KEY]}')
+        return '\n'.join(lines) + '\n'
+
+    def __write_atomically(self, path, content):
+        # node exporter may read the file at any time, so it must never see a partial write
+        temporary_file = f'{path}{TEMPORARY_FILE_SUFFIX}'
+        with open(temporary_file, 'w') as file_handle:
+            file_handle.write(content)
+        os.replace(temporary_file, path)
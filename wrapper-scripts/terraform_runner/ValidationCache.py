@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import shutil
+
+from terraform_runner.content_hash import hash_directory
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.override_manager import BACKEND_FILE_NAME, PROVIDER_FILE_NAME, VARIABLE_FILE_NAME
+from terraform_runner.WorkspaceManager import LOCAL_ARTIFACT_FILE, PLAN_FILE_NAME, \
+    RETAINED_WORKSPACE_MANIFEST_FILE_NAME, TERRAFORM_DATA_DIRECTORY_NAME
+
+# Constants
+ENTRIES_DIRECTORY_NAME = 'entries'
+TERRAFORM_EXECUTABLE = 'terraform'
+MODULES_DIRECTORY_NAME = 'modules'
+# The configuration and the dependency lock file are part of the fingerprint. Files that do not change what terraform
+# validate checks are left out, and so is the backend override, since validate ignores backend settings.
+FINGERPRINT_EXCLUDED_NAMES = (TERRAFORM_DATA_DIRECTORY_NAME, LOCAL_ARTIFACT_FILE, RETAINED_WORKSPACE_MANIFEST_FILE_NAME,
+                              PLAN_FILE_NAME, BACKEND_FILE_NAME, VARIABLE_FILE_NAME, PROVIDER_FILE_NAME)
+# The overrides hold the parameter and tag values of each provisioned product. Only their names and types are part of
+# the fingerprint, so products provisioned from the same artifact share it.
+STRUCTURE_FINGERPRINT_FILE_NAMES = (VARIABLE_FILE_NAME, PROVIDER_FILE_NAME)
+
+
+class ValidationCache:
+
+    def __init__(self, log: CustomLogger, cache_directory: str, max_entries: int):
+        """
+        Parameters:
+
+        log: CustomLogger
+            The object used to write logs
+        cache_directory: str
+            The host-local directory where successful validations are recorded between runs
+        max_entries: int
+            The number of recorded validations above which the least recently used are evicted
+        """
+        self.__log = log
+        self.__cache_directory = cache_directory
+        self.__max_entries = max_entries
+
+    def get_fingerprint(self, workspace_directory: str) -> str:
+        """Returns a digest of everything terraform validate depends on in an initialized workspace: the configuration,
+        the names and types in the variable and provider overrides, the modules installed by terraform init, and the
+        Terraform executable itself.
+        """
+        digest = hashlib.sha256()
+        digest.update(hash_directory(workspace_directory, FINGERPRINT_EXCLUDED_NAMES).encode())
+        for file_name in STRUCTURE_FINGERPRINT_FILE_NAMES:
+            structure = self.__get_file_structure(os.path.join(workspace_directory, file_name))
+            digest.update(f'{file_name}\0{structure}\n'.encode())
+        modules_directory = os.path.join(workspace_directory, TERRAFORM_DATA_DIRECTORY_NAME, MODULES_DIRECTORY_NAME)
+        if os.path.isdir(modules_directory):
+            digest.update(hash_directory(modules_directory).encode())
+        # A different Terraform version may validate the same configuration differently
+        terraform_executable = shutil.which(TERRAFORM_EXECUTABLE)
+        if terraform_executable:
+            executable_stat = os.stat(terraform_executable)
+            digest.update(f'{os.path.realpath(terraform_executable)}\0{executable_stat.st_size}\0'
+                          f'{executable_stat.st_mtime_ns}'.encode())
+        return digest.hexdigest()
+
+    def is_validated(self, fingerprint: str) -> bool:
+        """Returns True when a configuration with this fingerprint was validated successfully before"""
+        entry_file = self.__get_entry_file(fingerprint)
+        if not os.path.isfile(entry_file):
+            return False
+        # Entries are evicted by last use
+        os.utime(entry_file)
+        return True
+
+    def record_validation(self, fingerprint: str):
+        """Records a successful validation and evicts the least recently used entries beyond the maximum"""
+        entries_directory = os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME)
+        os.makedirs(entries_directory, exist_ok=True)
+        # Entries carry no content, so concurrent runs recording the same one do not conflict
+        with open(self.__get_entry_file(fingerprint), 'w'):
+            pass
+        self.__evict(entries_directory)
+
+    def __get_file_structure(self, json_file_path):
+        try:
+            with open(json_file_path, 'r') as json_file:
+                return json.dumps(self.__get_structure(json.load(json_file)), sort_keys=True)
+        except FileNotFoundError:
+            return ''
+        except ValueError:
+            # Fails validate the same way whatever the content
+            return 'invalid'
+
+    def __get_structure(self, value):
+        # Keeps the object keys and replaces every value by its JSON type
+        if isinstance(value, dict):
+            return {key: self.__get_structure(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.__get_structure(item) for item in value]
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, (int, float)):
+            return 'number'
+        if value is None:
+            return 'null'
+        return 'string'
+
+    def __get_entry_file(self, fingerprint):
+        return os.path.join(self.__cache_directory, ENTRIES_DIRECTORY_NAME, fingerprint)
+
+    def __evict(self, entries_directory):
+        entries = []
+        for entry_name in os.listdir(entries_directory):
+            entry_file = os.path.join(entries_directory, entry_name)
+            try:
+                entries.append((os.path.getmtime(entry_file), entry_file))
+            except FileNotFoundError:
+                pass
+
+        for _, entry_file in sorted(entries)[:max(len(entries) - self.__max_entries, 0)]:
+            try:
+                os.remove(entry_file)
+            except FileNotFoundError:
+                pass
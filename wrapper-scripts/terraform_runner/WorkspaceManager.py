@@ -1,12 +1,41 @@
+import json
 import os
+import shutil
+import time
+from contextlib import contextmanager
+from glob import glob
 
-from terraform_runner.CommandManager import CommandManager
+from terraform_runner.content_hash import hash_directory, hash_directory_files
 from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import acquire_lock, open_held_lock, try_acquire_lock
+from terraform_runner.override_manager import BACKEND_FILE_NAME, PROVIDER_FILE_NAME, VARIABLE_FILE_NAME
+from terraform_runner.workspace_reaper import move_to_trash, start_trash_reaper, LOCKS_DIRECTORY_NAME, \
+    RETAINED_WORKSPACE_MANIFEST_FILE_NAME, STAGING_DIRECTORY_NAME, TRASH_DIRECTORY_NAME
+
+# Constants
+# Provider packages in the plugin cache are laid out as <hostname>/<namespace>/<type>/<version>/<os_arch>
+PROVIDER_PACKAGE_PATTERN = '*/*/*/*/*'
+WORKSPACE_PROVIDER_LINK_PATTERN = '**/.terraform/providers/*/*/*/*/*'
+PLUGIN_CACHE_DIRECTORY_MODE = 0o755
+TERRAFORM_DATA_DIRECTORY_NAME = '.terraform'
+LOCAL_ARTIFACT_FILE = 'artifact.local'
+PLAN_FILE_NAME = 'runner.tfplan'
+INIT_FINGERPRINT_FILE_NAME = 'runner-init-fingerprint'
+DEPENDENCY_LOCK_FILE_NAME = '.terraform.lock.hcl'
+# Files that change from run to run without requiring terraform init to run again
+INIT_FINGERPRINT_EXCLUDED_NAMES = (TERRAFORM_DATA_DIRECTORY_NAME, VARIABLE_FILE_NAME, PROVIDER_FILE_NAME,
+                                   LOCAL_ARTIFACT_FILE, RETAINED_WORKSPACE_MANIFEST_FILE_NAME, PLAN_FILE_NAME)
+# What remains is the configuration from the artifact. The backend override differs for every provisioned product,
+# and terraform init may write the dependency lock file.
+CONFIGURATION_FINGERPRINT_EXCLUDED_NAMES = INIT_FINGERPRINT_EXCLUDED_NAMES + (BACKEND_FILE_NAME,
+                                                                              DEPENDENCY_LOCK_FILE_NAME)
 
 
 class WorkspaceManager:
 
-    def __init__(self, log: CustomLogger, provisioned_product_descriptor: str):
+    def __init__(self, log: CustomLogger, provisioned_product_descriptor: str,
+                 plugin_cache_directory: str = None, plugin_cache_max_size_bytes: int = 0,
+                 retain_workspace: bool = False, workspaces_root: str = None, disk_quota_bytes: int = 0):
         """
         Parameters:
 
@@ -14,20 +43,271 @@ class WorkspaceManager:
             The object used to write logs
         provisioned_product_descriptor: str
             The descriptor that uniquely identifies a provisioned product, used for naming the workspace directory
+        plugin_cache_directory: str
+            The host-wide Terraform provider plugin cache shared by all runs. Default is None, which disables the cache.
+        plugin_cache_max_size_bytes: int
+            The size above which least recently used provider packages are evicted from the plugin cache
+        retain_workspace: bool
+            When True, the workspace directory, including its .terraform directory and lock file, is kept between
+            runs for the provisioned product and only changed artifact files are synced into it. Default is False.
+        workspaces_root: str
+            The directory the workspaces are created in, for example on tmpfs or instance store. Default is None,
+            which uses the workspaces directory in the home directory.
+        disk_quota_bytes: int
+            The most disk space the workspace may use. Default is 0, which does not limit it.
         """
         self.__log = log
-        self.__command_manager = CommandManager(log)
-        home_directory = os.path.expanduser('~')
-        self.__workspace_directory = f'{home_directory}/workspaces/{provisioned_product_descriptor}'
+        self.__workspaces_root = workspaces_root or f'{os.path.expanduser("~")}/workspaces'
+        self.__workspace_directory = f'{self.__workspaces_root}/{provisioned_product_descriptor}'
+        self.__staging_directory = f'{self.__workspaces_root}/{STAGING_DIRECTORY_NAME}/{provisioned_product_descriptor}'
+        self.__lock_file = f'{self.__workspaces_root}/{LOCKS_DIRECTORY_NAME}/{provisioned_product_descriptor}.lock'
+        self.__trash_directory = f'{self.__workspaces_root}/{TRASH_DIRECTORY_NAME}'
+        self.__lock_file_descriptor = None
+        self.__retain_workspace = retain_workspace
+        self.__plugin_cache_directory = plugin_cache_directory
+        self.__plugin_cache_max_size_bytes = plugin_cache_max_size_bytes
+        self.__disk_quota_bytes = disk_quota_bytes
+
+    def get_workspaces_root(self):
+        return self.__workspaces_root
 
     def get_workspace_directory(self):
         return self.__workspace_directory
 
+    def get_plugin_cache_directory(self):
+        return self.__plugin_cache_directory
+
+    def get_artifact_directory(self):
+        """Returns the directory the artifact should be extracted to. Retained workspaces receive the artifact through
+        a staging directory so that only changed files are synced into the workspace.
+        """
+        return self.__staging_directory if self.__retain_workspace else self.__workspace_directory
+
+    def is_retaining_workspace(self):
+        return self.__retain_workspace
+
+    def get_trash_directory(self):
+        return self.__trash_directory
+
     def remove_workspace_directory(self):
-        self.__command_manager.run_command(['rm', '-f', '-r', self.__workspace_directory])
+        """Moves the workspace directory to the trash and leaves deleting it to a background reaper"""
+        if move_to_trash(self.__workspace_directory, self.__trash_directory):
+            start_trash_reaper(self.__trash_directory)
 
     def setup_workspace_directory(self):
-        # Remove any previous workspace directory  for this provisioned product in case there are old files left over from the last run
-        self.remove_workspace_directory()
-        os.makedirs(self.__workspace_directory)
-        self.__log.info(f'Workspace directory set up: {self.__workspace_directory}')
+        if self.__disk_quota_bytes > 0:
+            os.makedirs(self.__workspaces_root, exist_ok=True)
+            free_bytes = shutil.disk_usage(self.__workspaces_root).free
+            if free_bytes < self.__disk_quota_bytes:
+                raise RuntimeError(f'Workspaces root {self.__workspaces_root} has {free_bytes} bytes of free disk space, '
+                                   f'less than the workspace disk quota of {self.__disk_quota_bytes} bytes')
+
+        # Hold the workspace lock for the whole run so the workspace is never reaped while in use
+        if self.__lock_file_descriptor is None:
+            self.__lock_file_descriptor = open_held_lock(self.__lock_file)
+
+        if self.__retain_workspace and os.path.isdir(self.__workspace_directory):
+            self.__log.info(f'Reusing retained workspace directory: {self.__workspace_directory}')
+        else:
+            # Remove any previous workspace directory  for this provisioned product in case there are old files left over from the last run
+            self.remove_workspace_directory()
+            os.makedirs(self.__workspace_directory)
+            self.__log.info(f'Workspace directory set up: {self.__workspace_directory}')
+
+        if self.__retain_workspace:
+            shutil.rmtree(self.__staging_directory, ignore_errors=True)
+            os.makedirs(self.__staging_directory)
+
+    def holds_workspace_lock(self):
+        """Returns True between setup_workspace_directory taking the workspace lock and its release. Without the lock,
+        the workspace and its staging directory may be in use by another run for the same provisioned product.
+        """
+        return self.__lock_file_descriptor is not None
+
+    def release_workspace_directory(self):
+        """Releases the workspace lock taken by setup_workspace_directory. Does nothing when this run does not hold
+        it.
+        """
+        if self.__lock_file_descriptor is None:
+            return
+        if self.__retain_workspace:
+            shutil.rmtree(self.__staging_directory, ignore_errors=True)
+        os.close(self.__lock_file_descriptor)
+        self.__lock_file_descriptor = None
+
+    def check_disk_quota(self):
+        """Raises RuntimeError when the workspace uses more disk space than its quota"""
+        if self.__disk_quota_bytes <= 0:
+            return
+        used_bytes = self.__get_directory_size(self.__workspace_directory, follow_links=False)
+        if used_bytes > self.__disk_quota_bytes:
+            raise RuntimeError(f'Workspace {self.__workspace_directory} uses {used_bytes} bytes of disk space, '
+                               f'more than its quota of {self.__disk_quota_bytes} bytes')
+
+    def sync_artifact_directory(self):
+        """Brings a retained workspace in line with the artifact in the staging directory.
+        Changed and new files are copied, files removed from the artifact are deleted, and everything Terraform wrote
+        is left in place, except a dependency lock file written for a configuration that has changed since. Does
+        nothing when the workspace is not retained.
+        """
+        if not self.__retain_workspace:
+            return
+
+        manifest_file = f'{self.__workspace_directory}/{RETAINED_WORKSPACE_MANIFEST_FILE_NAME}'
+        previous_files = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, 'r') as json_file:
+                previous_files = json.load(json_file)
+
+        current_files = hash_directory_files(self.__staging_directory, (LOCAL_ARTIFACT_FILE,))
+        changed_count = 0
+        for relative_path, file_hash in current_files.items():
+            destination = os.path.join(self.__workspace_directory, relative_path)
+            if previous_files.get(relative_path) == file_hash and os.path.isfile(destination):
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Files linked from the extracted tree store are read-only, and so are earlier copies of them
+            if os.path.lexists(destination):
+                os.remove(destination)
+            shutil.copy2(os.path.join(self.__staging_directory, relative_path), destination)
+            changed_count += 1
+
+        removed_count = 0
+        for relative_path in previous_files.keys() - current_files.keys():
+            try:
+                os.remove(os.path.join(self.__workspace_directory, relative_path))
+                removed_count += 1
+            except FileNotFoundError:
+                pass
+
+        # terraform init writes a dependency lock file when the artifact has none. A changed configuration may tighten
+        # the version constraints so that they no longer match it, which fails init.
+        if (changed_count or removed_count) and DEPENDENCY_LOCK_FILE_NAME not in current_files:
+            try:
+                os.remove(os.path.join(self.__workspace_directory, DEPENDENCY_LOCK_FILE_NAME))
+                self.__log.info('Removed the dependency lock file terraform init wrote for the previous configuration')
+            except FileNotFoundError:
+                pass
+
+        with open(manifest_file, 'w') as json_file:
+            json.dump(current_files, json_file)
+        self.__log.info(f'Synced artifact into retained workspace: {changed_count} files copied, '
+                        f'{removed_count} files removed, {len(current_files) - changed_count} files unchanged')
+
+    def needs_init(self):
+        """Returns False when the workspace was initialized and nothing terraform init depends on has changed since"""
+        fingerprint_file = f'{self.__workspace_directory}/{TERRAFORM_DATA_DIRECTORY_NAME}/{INIT_FINGERPRINT_FILE_NAME}'
+        if not os.path.isfile(fingerprint_file):
+            return True
+        with open(fingerprint_file, 'r') as file_handle:
+            return file_handle.read() != self.__get_init_fingerprint()
+
+    def mark_initialized(self):
+        """Records the state of the workspace after a successful terraform init"""
+        terraform_data_directory = f'{self.__workspace_directory}/{TERRAFORM_DATA_DIRECTORY_NAME}'
+        os.makedirs(terraform_data_directory, exist_ok=True)
+        with open(f'{terraform_data_directory}/{INIT_FINGERPRINT_FILE_NAME}', 'w') as file_handle:
+            file_handle.write(self.__get_init_fingerprint())
+
+    def reap_retained_workspaces(self, time_to_live_seconds: int, max_retained_workspaces: int):
+        """Removes retained workspaces that were last used longer ago than the time to live, and the least recently
+        used ones beyond the maximum count. Workspaces in use by a run are never removed.
+        """
+        retained_workspaces = []
+        for manifest_file in glob(f'{self.__workspaces_root}/**/{RETAINED_WORKSPACE_MANIFEST_FILE_NAME}', recursive=True):
+            workspace_directory = os.path.dirname(manifest_file)
+            if workspace_directory != self.__workspace_directory:
+                retained_workspaces.append((os.path.getmtime(manifest_file), workspace_directory))
+
+        # This run's workspace counts towards the maximum and is the most recently used
+        remaining_count = len(retained_workspaces) + 1
+        expiry_time = time.time() - time_to_live_seconds
+        reaped_count = 0
+        for last_used, workspace_directory in sorted(retained_workspaces):
+            if last_used >= expiry_time and remaining_count <= max_retained_workspaces:
+                break
+            descriptor = os.path.relpath(workspace_directory, self.__workspaces_root)
+            with try_acquire_lock(f'{self.__workspaces_root}/{LOCKS_DIRECTORY_NAME}/{descriptor}.lock') as acquired:
+                if not acquired:
+                    continue
+                move_to_trash(workspace_directory, self.__trash_directory)
+            remaining_count -= 1
+            reaped_count += 1
+            self.__log.info(f'Reaped retained workspace directory {workspace_directory}')
+
+        if reaped_count:
+            start_trash_reaper(self.__trash_directory)
+
+    def __get_init_fingerprint(self):
+        return hash_directory(self.__workspace_directory, INIT_FINGERPRINT_EXCLUDED_NAMES)
+
+    def setup_plugin_cache_directory(self):
+        """Creates the provider plugin cache if needed and makes sure the current user can write to it"""
+        if not self.__plugin_cache_directory:
+            return
+        os.makedirs(self.__plugin_cache_directory, mode=PLUGIN_CACHE_DIRECTORY_MODE, exist_ok=True)
+        if not os.access(self.__plugin_cache_directory, os.W_OK | os.X_OK):
+            raise RuntimeError(f'Provider plugin cache directory {self.__plugin_cache_directory} is not writable by the current user')
+        self.__log.info(f'Provider plugin cache directory set up: {self.__plugin_cache_directory}')
+
+    @contextmanager
+    def plugin_cache_install_lock(self):
+        """Serializes the commands that install providers into the plugin cache, which Terraform does not make safe
+        for concurrent writers. When the commands succeed, the packages they used are marked as recently used and the
+        cache is trimmed to its size limit.
+        """
+        if not self.__plugin_cache_directory:
+            yield
+            return
+
+        with acquire_lock(f'{self.__plugin_cache_directory}.lock'):
+            yield
+            self.__mark_workspace_providers_used()
+            self.__evict_plugin_cache()
+
+    def __get_linked_provider_packages(self, directory):
+        # With a plugin cache, terraform init links each provider in the workspace to its package in the cache
+        packages = set()
+        for link in glob(f'{directory}/{WORKSPACE_PROVIDER_LINK_PATTERN}', recursive=True):
+            if os.path.islink(link):
+                packages.add(os.path.realpath(link))
+        return packages
+
+    def __mark_workspace_providers_used(self):
+        for package in self.__get_linked_provider_packages(self.__workspace_directory):
+            if os.path.isdir(package):
+                os.utime(package)
+
+    def __evict_plugin_cache(self):
+        packages = []
+        total_size = 0
+        for package in glob(f'{self.__plugin_cache_directory}/{PROVIDER_PACKAGE_PATTERN}'):
+            size = self.__get_directory_size(package)
+            packages.append((os.path.getmtime(package), os.path.realpath(package), size))
+            total_size += size
+
+        if total_size <= self.__plugin_cache_max_size_bytes:
+            return
+
+        # Packages linked from any workspace on the host are in use by a run and must not be removed
+        in_use_packages = self.__get_linked_provider_packages(self.__workspaces_root)
+        for _, package, size in sorted(packages):
+            if total_size <= self.__plugin_cache_max_size_bytes:
+                break
+            if package in in_use_packages:
+                continue
+            shutil.rmtree(package, ignore_errors=True)
+            total_size -= size
+            self.__log.info(f'Evicted provider package {package} of {size} bytes from the plugin cache')
+
+    def __get_directory_size(self, directory, follow_links=True):
+        # Providers linked from the plugin cache take no space in a workspace
+        size = 0
+        for parent, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                try:
+                    path = os.path.join(parent, file_name)
+                    size += os.path.getsize(path) if follow_links else os.lstat(path).st_size
+                except OSError:
+                    pass
+        return size
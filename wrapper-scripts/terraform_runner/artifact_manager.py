@@ -1,25 +1,85 @@
+import bz2
+from contextlib import contextmanager
 from glob import glob
+import gzip
+import lzma
+import os
+import posixpath
+import shutil
+import subprocess
 import tarfile
+import tempfile
+import threading
+import time
 
 import boto3
 from botocore.exceptions import ClientError
 
+from terraform_runner.ReadAheadStream import ReadAheadStream
+from terraform_runner.s3_downloader import download_file_in_parts
+
 # Constants
 ROLE_SESSION_NAME = 'TerraformLaunchRole'
 LOCAL_ARTIFACT_FILE = 'artifact.local'
 REQUIRED_FILES_PATTERN = '*.tf'
+REQUIRED_FILE_SUFFIX = '.tf'
+DOWNLOAD_MODE_FILE = 'file'
+DOWNLOAD_MODE_STREAM = 'stream'
+DOWNLOAD_MODE_PARALLEL = 'parallel'
+DOWNLOAD_MODES = [DOWNLOAD_MODE_FILE, DOWNLOAD_MODE_STREAM, DOWNLOAD_MODE_PARALLEL]
+DEFAULT_PART_SIZE_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+# Reads an uncompressed tar stream one member at a time. Decompression is done before tarfile, whose stream mode
+# re-slices its decompressed buffer on every read and becomes quadratic for well compressed archives.
+STREAM_TAR_MODE = 'r|'
+# Compressed formats by their leading magic bytes
+GZIP_MAGIC_BYTES = b'\x1f\x8b'
+ZSTD_MAGIC_BYTES = b'\x28\xb5\x2f\xfd'
+STREAM_DECOMPRESSORS = [
+    (GZIP_MAGIC_BYTES, gzip.GzipFile),
+    (b'BZh', bz2.BZ2File),
+    (b'\xfd7zXZ\x00', lzma.LZMAFile)
+]
+# Decompression commands that are faster than the Python modules, used when they are installed. pigz decompresses on
+# one thread too, but reads, writes, and checks on others and is about twice as fast as the gzip module.
+DECOMPRESSION_COMMANDS = [
+    (GZIP_MAGIC_BYTES, ['pigz', '-d', '-c']),
+    (ZSTD_MAGIC_BYTES, ['zstd', '-d', '-c', '-q'])
+]
+MAGIC_BYTES_LENGTH = 6
+DECOMPRESSION_CHUNK_SIZE = 1024 * 1024
+MAX_UNCOMPRESSED_SIZE_BYTES = 2 * 1024 * 1024 * 1024
+MAX_MEMBER_COUNT = 100000
+# Allows for the header and padding blocks of every member when the decompressed tar is checked against the limit
+TAR_OVERHEAD_BYTES_PER_MEMBER = 4096
+UNCOMPRESSED_FILE_SUFFIX = '.tar'
+# Python versions with extraction filters check every member against the destination on disk as it is extracted,
+# which also catches links that only leave the destination once resolved
+EXTRACT_ARGUMENTS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
 NO_REQUIRED_FILES_FOUND_MESSAGE = 'No .tf files found. Nothing to parse. Make sure the root directory of the Terraform open source configuration file contains the .tf files for the root module.'
 
 # Boto exception keys
 RESPONSE_METADATA_KEY = "ResponseMetadata"
 REQUEST_ID_KEY = "RequestId"
 
+# S3 response keys
+BODY_KEY = 'Body'
+
+# Symlink keys
+SYMLINK_PATHS_KEY = 'symlink_paths'
+TARGET_PARENT_PATHS_KEY = 'target_parent_paths'
+
+# Download statistics keys
+BYTES_DOWNLOADED_KEY = 'bytes_downloaded'
+DOWNLOAD_SECONDS_KEY = 'download_seconds'
 
-def __get_s3_client(launch_role_arn):
-    sts = boto3.client('sts')
-    assume_role_result = sts.assume_role(RoleArn=launch_role_arn,
-                                         RoleSessionName=ROLE_SESSION_NAME)
-    credentials = assume_role_result['Credentials']
+
+def __get_s3_client(launch_role_arn, credentials):
+    if credentials is None:
+        sts = boto3.client('sts')
+        assume_role_result = sts.assume_role(RoleArn=launch_role_arn,
+                                             RoleSessionName=ROLE_SESSION_NAME)
+        credentials = assume_role_result['Credentials']
     return boto3.client('s3',
                         aws_access_key_id=credentials['AccessKeyId'],
                         aws_secret_access_key=credentials['SecretAccessKey'],
@@ -30,7 +90,265 @@ def __validate_required_files_exist(workspace_dir):
     if not files:
         raise RuntimeError(NO_REQUIRED_FILES_FOUND_MESSAGE)
 
-def download_artifact(launch_role_arn, artifact_path, workspace_dir):
+def __is_unsafe_path(path):
+    return posixpath.isabs(path) or '..' in path.split('/')
+
+def __get_parent_paths(path):
+    parent_paths = []
+    parent = ''
+    for part in path.split('/')[:-1]:
+        parent = posixpath.normpath(posixpath.join(parent, part))
+        parent_paths.append(parent)
+    return parent_paths
+
+def __passes_through_symlink(path, symlinks):
+    # Paths are only checked lexically, which holds as long as nothing is reached through a symlink of the artifact
+    return any(parent in symlinks[SYMLINK_PATHS_KEY] for parent in __get_parent_paths(path))
+
+def __validate_symlink(member, symlinks):
+    target = posixpath.join(posixpath.dirname(member.name), member.linkname)
+    if posixpath.isabs(member.linkname) or __is_unsafe_path(posixpath.normpath(target)):
+        raise RuntimeError(f'Artifact member {member.name} links to {member.linkname} outside the artifact root')
+    if __passes_through_symlink(target, symlinks):
+        raise RuntimeError(f'Artifact member {member.name} links to {member.linkname} through another symlink')
+    # A symlink can also turn the target of one seen before it into a path outside the artifact root, as with
+    # a -> b/.. followed by b -> .
+    path = posixpath.normpath(member.name)
+    earlier_member = symlinks[TARGET_PARENT_PATHS_KEY].get(path)
+    if earlier_member:
+        raise RuntimeError(
+            f'Artifact member {earlier_member.name} links to {earlier_member.linkname} through another symlink')
+    symlinks[SYMLINK_PATHS_KEY].add(path)
+    for parent in __get_parent_paths(target):
+        symlinks[TARGET_PARENT_PATHS_KEY][parent] = member
+
+def __create_symlinks():
+    return {SYMLINK_PATHS_KEY: set(), TARGET_PARENT_PATHS_KEY: {}}
+
+def __validate_member(member, member_count, total_size, max_uncompressed_size_bytes, symlinks):
+    # Checked from the member header alone, before any of the member is written. symlinks holds the paths of the
+    # symlinks seen so far and the parent directories of their targets.
+    if member_count > MAX_MEMBER_COUNT:
+        raise RuntimeError(f'Artifact contains more than {MAX_MEMBER_COUNT} files')
+    if total_size > max_uncompressed_size_bytes:
+        raise RuntimeError(f'Artifact uncompressed size exceeds {max_uncompressed_size_bytes} bytes')
+    if __is_unsafe_path(member.name):
+        raise RuntimeError(f'Artifact member {member.name} has a path outside the artifact root')
+    if __passes_through_symlink(member.name, symlinks):
+        raise RuntimeError(f'Artifact member {member.name} has a path through a symlink')
+    if member.issym():
+        __validate_symlink(member, symlinks)
+    elif member.islnk():
+        if __is_unsafe_path(member.linkname) or __passes_through_symlink(member.linkname, symlinks):
+            raise RuntimeError(f'Artifact member {member.name} links to {member.linkname} outside the artifact root')
+    elif not (member.isfile() or member.isdir()):
+        raise RuntimeError(f'Artifact member {member.name} is not a file, directory, or link')
+
+def __is_root_configuration_file(member):
+    return member.isfile() and '/' not in posixpath.normpath(member.name) and member.name.endswith(REQUIRED_FILE_SUFFIX)
+
+def __scan_members(tar_file, max_uncompressed_size_bytes):
+    # Reads every member header without writing anything. Returns the members to extract, or None when the
+    # artifact has no Terraform configuration files in its root directory.
+    members = []
+    symlinks = __create_symlinks()
+    total_size = 0
+    has_root_configuration_file = False
+    for member in tar_file:
+        total_size += member.size
+        __validate_member(member, len(members) + 1, total_size, max_uncompressed_size_bytes, symlinks)
+        has_root_configuration_file = has_root_configuration_file or __is_root_configuration_file(member)
+        members.append(member)
+    return members if has_root_configuration_file else None
+
+def __extract_members(tar_file, workspace_dir, max_uncompressed_size_bytes):
+    # Members are extracted one at a time so the limits are enforced before the archive is fully read
+    member_count = 0
+    symlinks = __create_symlinks()
+    total_size = 0
+    for member in tar_file:
+        member_count += 1
+        total_size += member.size
+        __validate_member(member, member_count, total_size, max_uncompressed_size_bytes, symlinks)
+        tar_file.extract(member, workspace_dir, **EXTRACT_ARGUMENTS)
+
+def __format_download_error(e, artifact_path, launch_role_arn):
+    if isinstance(e, ClientError):
+        message = f'Failed to execute API: {e.operation_name} with request Id: {e.response[RESPONSE_METADATA_KEY][REQUEST_ID_KEY]}: {e}'
+        return f'Could not download artifact {artifact_path} using launch role {launch_role_arn}: {message}'
+    return f'Could not download artifact {artifact_path} using launch role {launch_role_arn}: {e}'
+
+def __get_decompression_command(magic_bytes):
+    for magic, command in DECOMPRESSION_COMMANDS:
+        if magic_bytes.startswith(magic) and shutil.which(command[0]):
+            return command
+    if magic_bytes.startswith(ZSTD_MAGIC_BYTES):
+        raise RuntimeError('Artifact is compressed with zstd, which requires the zstd command on the instance')
+    return None
+
+def __read_magic_bytes(path):
+    # A file that cannot be read is reported by tarfile
+    try:
+        with open(path, 'rb') as file_handle:
+            return file_handle.read(MAGIC_BYTES_LENGTH)
+    except OSError:
+        return b''
+
+def __feed_process(stream, process, errors):
+    try:
+        shutil.copyfileobj(stream, process.stdin, DECOMPRESSION_CHUNK_SIZE)
+    except BrokenPipeError:
+        # The process exited early, and its exit status tells why
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+@contextmanager
+def __run_decompression_command(command, stream=None):
+    # Yields the decompressed output of the command. Without a stream the command reads the file named in it.
+    process = subprocess.Popen(command, stdin=subprocess.PIPE if stream else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    feed_errors = []
+    feeder = None
+    if stream:
+        feeder = threading.Thread(target=__feed_process, args=(stream, process, feed_errors), daemon=True)
+        feeder.start()
+    try:
+        yield process.stdout
+        # tarfile stops at the end of archive marker. Reading the padding after it lets the command finish and
+        # verify its checksum instead of failing to write to a closed pipe.
+        while process.stdout.read(DECOMPRESSION_CHUNK_SIZE):
+            pass
+    except Exception:
+        process.kill()
+        raise
+    finally:
+        # Unblocks the feeder when extraction failed before the end of the output
+        process.stdout.close()
+        if feeder:
+            feeder.join()
+        stderr = process.stderr.read().decode(errors='replace').strip()
+        process.stderr.close()
+        process.wait()
+        # A failed download truncates the input, which is the cause of any decompression or extraction error
+        if feed_errors:
+            raise feed_errors[0]
+    if process.returncode != 0:
+        raise RuntimeError(f'{command[0]} exited with status {process.returncode}: {stderr}')
+
+@contextmanager
+def __decompress_stream(stream):
+    magic_bytes = stream.peek(MAGIC_BYTES_LENGTH)
+    command = __get_decompression_command(magic_bytes)
+    if command:
+        with __run_decompression_command(command, stream) as output:
+            yield output
+        return
+    decompressor = __get_stream_decompressor(magic_bytes)
+    yield decompressor(fileobj=stream, mode='rb') if decompressor else stream
+
+def __get_stream_decompressor(magic_bytes):
+    for magic, decompressor in STREAM_DECOMPRESSORS:
+        if magic_bytes.startswith(magic):
+            return decompressor
+    return None
+
+def __copy_decompressed(source, destination, max_uncompressed_size_bytes):
+    # Stops a decompression bomb before it fills the disk, ahead of the exact check on the member sizes
+    max_tar_size = max_uncompressed_size_bytes + MAX_MEMBER_COUNT * TAR_OVERHEAD_BYTES_PER_MEMBER
+    tar_size = 0
+    while True:
+        chunk = source.read(DECOMPRESSION_CHUNK_SIZE)
+        if not chunk:
+            return
+        tar_size += len(chunk)
+        if tar_size > max_tar_size:
+            raise RuntimeError(f'Artifact uncompressed size exceeds {max_uncompressed_size_bytes} bytes')
+        destination.write(chunk)
+
+def __scan_and_extract_tar(tar_path, workspace_dir, max_uncompressed_size_bytes):
+    with tarfile.open(tar_path) as file_handle:
+        members = __scan_members(file_handle, max_uncompressed_size_bytes)
+        if members is None:
+            return False
+        for member in members:
+            file_handle.extract(member, workspace_dir, **EXTRACT_ARGUMENTS)
+    return True
+
+def __extract_file(local_artifact_file, workspace_dir, max_uncompressed_size_bytes):
+    # The member headers are scanned before anything is written, so a wrong or oversized artifact fails without
+    # the cost of extracting it. Returns False, without extracting, when there is no root configuration file.
+    magic_bytes = __read_magic_bytes(local_artifact_file)
+    command = __get_decompression_command(magic_bytes)
+    decompressor = None if command else __get_stream_decompressor(magic_bytes)
+    if not command and not decompressor:
+        return __scan_and_extract_tar(local_artifact_file, workspace_dir, max_uncompressed_size_bytes)
+
+    # Decompressed once into an uncompressed tar next to the artifact, which the scan and the extraction then read
+    # with seeks. Rewinding a compressed artifact would decompress it a second time.
+    file_descriptor, uncompressed_file = tempfile.mkstemp(
+        suffix=UNCOMPRESSED_FILE_SUFFIX, dir=os.path.dirname(os.path.abspath(local_artifact_file)))
+    try:
+        with os.fdopen(file_descriptor, 'wb') as uncompressed_handle:
+            if command:
+                with __run_decompression_command(command + [local_artifact_file]) as output:
+                    __copy_decompressed(output, uncompressed_handle, max_uncompressed_size_bytes)
+            else:
+                with decompressor(local_artifact_file, mode='rb') as output:
+                    __copy_decompressed(output, uncompressed_handle, max_uncompressed_size_bytes)
+        return __scan_and_extract_tar(uncompressed_file, workspace_dir, max_uncompressed_size_bytes)
+    finally:
+        os.remove(uncompressed_file)
+
+def __stream_artifact(s3, bucket, key, artifact_path, launch_role_arn, workspace_dir, max_uncompressed_size_bytes):
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)[BODY_KEY]
+    except Exception as e:
+        raise RuntimeError(__format_download_error(e, artifact_path, launch_role_arn))
+
+    # The body is read ahead on a background thread so the download overlaps with extraction.
+    # Transfer errors therefore surface here as well.
+    try:
+        with ReadAheadStream(body) as stream:
+            with __decompress_stream(stream) as decompressed_stream:
+                with tarfile.open(fileobj=decompressed_stream, mode=STREAM_TAR_MODE) as file_handle:
+                    __extract_members(file_handle, workspace_dir, max_uncompressed_size_bytes)
+            return stream.get_bytes_read()
+    except Exception as e:
+        raise RuntimeError(f'Could not extract files from {artifact_path}: {e}')
+
+def __create_downloader(download_mode, part_size, max_workers):
+    # Downloaders return the number of bytes transferred
+    if download_mode == DOWNLOAD_MODE_PARALLEL:
+        return lambda s3, bucket, key, destination, extra_args=None: download_file_in_parts(
+            s3, bucket, key, destination, part_size, max_workers, extra_args)
+    return __download_file
+
+def __download_file(s3, bucket, key, destination, extra_args=None):
+    transferred = []
+    s3.download_file(bucket, key, destination, ExtraArgs=extra_args, Callback=transferred.append)
+    return sum(transferred)
+
+def download_artifact(launch_role_arn, artifact_path, workspace_dir, artifact_cache=None,
+                      download_mode=DOWNLOAD_MODE_FILE, part_size=DEFAULT_PART_SIZE_BYTES,
+                      max_workers=DEFAULT_MAX_WORKERS, credentials=None,
+                      max_uncompressed_size_bytes=MAX_UNCOMPRESSED_SIZE_BYTES, tree_store=None):
+    """Downloads the artifact and extracts it into the workspace directory.
+    Returns a dict with the number of bytes transferred from S3 and the seconds spent transferring them.
+
+    In file mode the artifact is downloaded to a local file, or taken from the artifact cache when one is given, and then
+    extracted. Parallel mode does the same with concurrent ranged requests of part_size bytes on max_workers threads.
+    In stream mode the S3 object body is extracted while it downloads, without a local copy or the cache.
+    The launch role is assumed for the download unless credentials from an earlier AssumeRole call are given.
+    Extraction fails once the extracted files add up to more than max_uncompressed_size_bytes.
+    In file and parallel modes a tree store, when given, extracts each artifact content once per host and fills the
+    workspace with links to the extracted files.
+    """
     # Extract bucket, key, and file name from the path. This will be the S3 URI.
     # Example: s3://my-bucket/test-data/main.tar.gz
     try:
@@ -40,19 +358,42 @@ def download_artifact(launch_role_arn, artifact_path, workspace_dir):
         raise RuntimeError(f'Invalid artifact path {artifact_path}: {e}')
 
     try:
-        s3 = __get_s3_client(launch_role_arn)
-        s3.download_file(bucket, key, f'{workspace_dir}/{LOCAL_ARTIFACT_FILE}')
-    except ClientError as e:
-        message = f'Failed to execute API: {e.operation_name} with request Id: {e.response[RESPONSE_METADATA_KEY][REQUEST_ID_KEY]}: {e}'
-        raise RuntimeError(
-            f'Could not download artifact {artifact_path} using launch role {launch_role_arn}: {message}')
+        s3 = __get_s3_client(launch_role_arn, credentials)
+    except Exception as e:
+        raise RuntimeError(__format_download_error(e, artifact_path, launch_role_arn))
+
+    start_time = time.monotonic()
+    if download_mode == DOWNLOAD_MODE_STREAM:
+        bytes_downloaded = __stream_artifact(s3, bucket, key, artifact_path, launch_role_arn, workspace_dir,
+                                             max_uncompressed_size_bytes)
+        __validate_required_files_exist(workspace_dir)
+        return {BYTES_DOWNLOADED_KEY: bytes_downloaded, DOWNLOAD_SECONDS_KEY: time.monotonic() - start_time}
+
+    downloader = __create_downloader(download_mode, part_size, max_workers)
+    try:
+        if artifact_cache:
+            bytes_downloaded_before = artifact_cache.get_bytes_downloaded()
+            local_artifact_file = artifact_cache.get_artifact(s3, bucket, key, downloader)
+            bytes_downloaded = artifact_cache.get_bytes_downloaded() - bytes_downloaded_before
+        else:
+            local_artifact_file = f'{workspace_dir}/{LOCAL_ARTIFACT_FILE}'
+            bytes_downloaded = downloader(s3, bucket, key, local_artifact_file)
     except Exception as e:
-        raise RuntimeError(f'Could not download artifact {artifact_path} using launch role {launch_role_arn}: {e}')
+        raise RuntimeError(__format_download_error(e, artifact_path, launch_role_arn))
+    download_seconds = time.monotonic() - start_time
 
     try:
-        with   tarfile.open(LOCAL_ARTIFACT_FILE) as file_handle:
-            file_handle.extractall(workspace_dir)
+        if tree_store:
+            has_root_configuration_file = tree_store.materialize(
+                local_artifact_file, workspace_dir,
+                lambda tree_directory: __extract_file(local_artifact_file, tree_directory, max_uncompressed_size_bytes))
+        else:
+            has_root_configuration_file = __extract_file(local_artifact_file, workspace_dir,
+                                                         max_uncompressed_size_bytes)
     except Exception as e:
         raise RuntimeError(f'Could not extract files from {artifact_path}: {e}')
+    if not has_root_configuration_file:
+        raise RuntimeError(NO_REQUIRED_FILES_FOUND_MESSAGE)
 
     __validate_required_files_exist(workspace_dir)
+    return {BYTES_DOWNLOADED_KEY: bytes_downloaded, DOWNLOAD_SECONDS_KEY: download_seconds}
@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+# Constants
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path: str) -> str:
+    """Returns the hex SHA-256 digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_directory_files(directory: str, excluded_names: tuple = ()) -> dict:
+    """Returns a dict of the SHA-256 digest of every file under a directory keyed by its path relative to the directory.
+
+    Parameters:
+
+    directory: str
+        The directory to walk
+    excluded_names: tuple of str
+        Names of files and directories directly under the directory that are skipped
+    """
+    file_hashes = {}
+    for parent, directory_names, file_names in os.walk(directory):
+        if parent == directory:
+            directory_names[:] = [name for name in directory_names if name not in excluded_names]
+            file_names = [name for name in file_names if name not in excluded_names]
+        for file_name in file_names:
+            file_path = os.path.join(parent, file_name)
+            file_hashes[os.path.relpath(file_path, directory)] = hash_file(file_path)
+    return file_hashes
+
+
+def hash_directory(directory: str, excluded_names: tuple = ()) -> str:
+    """Returns a single SHA-256 digest covering the relative paths and content of every file under a directory"""
+    digest = hashlib.sha256()
+    for relative_path, file_hash in sorted(hash_directory_files(directory, excluded_names).items()):
+        digest.update(f'{relative_path}\0{file_hash}\n'.encode())
+    return digest.hexdigest()
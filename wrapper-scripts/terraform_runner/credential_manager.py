@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import boto3
+
+from terraform_runner.file_lock import acquire_lock
+
+# Constants
+MAX_SESSION_NAME_LENGTH = 64
+LAUNCH_ROLE_PROFILE = 'terraform-runner-launch-role'
+CREDENTIALS_FILE_NAME = 'credentials.json'
+CONFIG_FILE_NAME = 'config'
+CREDENTIALS_FILE_MODE = 0o600
+# Cached credentials closer than this to their expiry are replaced with a new session
+REFRESH_MARGIN_SECONDS = 600
+CREDENTIAL_PROCESS_VERSION = 1
+CREDENTIAL_PROCESS_MODULE = 'terraform_runner.credential_manager'
+
+# STS response and credential_process keys
+CREDENTIALS_KEY = 'Credentials'
+VERSION_KEY = 'Version'
+ACCESS_KEY_ID_KEY = 'AccessKeyId'
+SECRET_ACCESS_KEY_KEY = 'SecretAccessKey'
+SESSION_TOKEN_KEY = 'SessionToken'
+EXPIRATION_KEY = 'Expiration'
+
+
+def format_session_name(provisioned_product_descriptor: str) -> str:
+    return f'{provisioned_product_descriptor[:MAX_SESSION_NAME_LENGTH]}'.replace('/', '-')
+
+
+def get_credentials(launch_role_arn: str, session_name: str, credentials_directory: str) -> dict:
+    """Returns launch role credentials in the credential_process format, assuming the role only when the credentials
+    cached in the directory are missing or about to expire.
+
+    The runner and every Terraform AWS provider instance of a run share one cache, so a run normally makes a single
+    AssumeRole call. Long runs make another one shortly before the session expires.
+
+    Parameters:
+
+    launch_role_arn: str
+        The role to assume
+    session_name: str
+        The role session name, which identifies the provisioned product in CloudTrail
+    credentials_directory: str
+        The private directory of the run that holds the cached credentials
+    """
+    credentials_file = os.path.join(credentials_directory, CREDENTIALS_FILE_NAME)
+    # Provider instances start concurrently and must not each assume the role
+    with acquire_lock(f'{credentials_file}.lock'):
+        credentials = __read_credentials(credentials_file)
+        if credentials and not __is_expiring(credentials):
+            return credentials
+
+        try:
+            sts = boto3.client('sts')
+            assume_role_result = sts.assume_role(RoleArn=launch_role_arn, RoleSessionName=session_name)
+        except Exception as e:
+            raise RuntimeError(f'Could not assume launch role {launch_role_arn}: {e}')
+        credentials = {
+            VERSION_KEY: CREDENTIAL_PROCESS_VERSION,
+            ACCESS_KEY_ID_KEY: assume_role_result[CREDENTIALS_KEY][ACCESS_KEY_ID_KEY],
+            SECRET_ACCESS_KEY_KEY: assume_role_result[CREDENTIALS_KEY][SECRET_ACCESS_KEY_KEY],
+            SESSION_TOKEN_KEY: assume_role_result[CREDENTIALS_KEY][SESSION_TOKEN_KEY],
+            EXPIRATION_KEY: assume_role_result[CREDENTIALS_KEY][EXPIRATION_KEY].isoformat()
+        }
+        __write_credentials(credentials_file, credentials)
+        return credentials
+
+
+def write_credential_process_config(launch_role_arn: str, session_name: str, credentials_directory: str) -> str:
+    """Writes an AWS config file whose launch role profile gets its credentials from the run's cache, and returns
+    its path. Pointing AWS_CONFIG_FILE at it lets the Terraform AWS provider use the profile instead of assuming the
+    launch role itself.
+    """
+    config_file = os.path.join(credentials_directory, CONFIG_FILE_NAME)
+    credential_process = ' '.join([sys.executable, '-m', CREDENTIAL_PROCESS_MODULE, '--launch-role', launch_role_arn,
+                                   '--session-name', session_name, '--credentials-directory', credentials_directory])
+    with open(config_file, 'w') as file_handle:
+        file_handle.write(f'[profile {LAUNCH_ROLE_PROFILE}]\ncredential_process = {credential_process}\n')
+    return config_file
+
+
+def __read_credentials(credentials_file):
+    try:
+        with open(credentials_file, 'r') as json_file:
+            return json.load(json_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def __write_credentials(credentials_file, credentials):
+    temporary_file = f'{credentials_file}.tmp'
+    file_descriptor = os.open(temporary_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, CREDENTIALS_FILE_MODE)
+    with os.fdopen(file_descriptor, 'w') as json_file:
+        json.dump(credentials, json_file)
+    os.replace(temporary_file, credentials_file)
+
+
+def __is_expiring(credentials):
+    expiration = datetime.fromisoformat(credentials[EXPIRATION_KEY])
+    return (expiration - datetime.now(timezone.utc)).total_seconds() < REFRESH_MARGIN_SECONDS
+
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser(description = 'Prints cached launch role credentials for the AWS credential_process setting')
+    parser.add_argument('--launch-role', required = True, help = 'The launch role Arn')
+    parser.add_argument('--session-name', required = True, help = 'The role session name')
+    parser.add_argument('--credentials-directory', required = True,
+        help = 'The directory of the run that holds the cached credentials')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # stdout is read by the AWS SDK and must contain nothing but the credentials
+    args = __parse_arguments()
+    print(json.dumps(get_credentials(args.launch_role, args.session_name, args.credentials_directory)))
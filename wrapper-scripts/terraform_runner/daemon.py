@@ -0,0 +1,231 @@
+import argparse
+import array
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+import boto3
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.daemon_client import receive_exactly, ARGV_KEY, DEFAULT_SOCKET_PATH, ENVIRONMENT_KEY, \
+    FAILED_EXIT_STATUS, HEADER_FORMAT, PASSED_FILE_DESCRIPTOR_COUNT, STATUS_FORMAT
+from terraform_runner.runner import run, DEFAULT_EXTRACTED_TREE_STORE_DIRECTORY
+from terraform_runner.workspace_reaper import get_trash_directories, start_trash_reaper
+
+# Constants
+LOG_PREFIX = 'terraform_runner_daemon'
+SOCKET_DIRECTORY_MODE = 0o700
+SOCKET_MODE = 0o600
+LISTEN_BACKLOG = 64
+# How long a connected client may take to send its job request. Finished workers are reaped at the same interval.
+ACCEPT_TIMEOUT_SECONDS = 1
+RECEIVE_TIMEOUT_SECONDS = 10
+# Clients whose models are loaded before the first job, so that forked workers start with them in memory
+WARM_CLIENT_SERVICES = ['sts', 's3']
+# Sent to the process group of a job whose client is gone, as pressing Ctrl-C would. Terraform stops gracefully on it.
+CANCEL_SIGNAL = signal.SIGINT
+CANCELLED_JOB_MESSAGE = 'The job was cancelled because its client disconnected'
+# Runner options the daemon passes to the jobs that do not set them
+WORKSPACES_ROOT_OPTION = '--workspaces-root'
+EXTRACTED_TREE_STORE_DIRECTORY_OPTION = '--extracted-tree-store-directory'
+
+
+def serve(socket_path: str, run_job=run, default_arguments: list = None):
+    """Accepts terraform_runner jobs on a Unix socket until the process is stopped.
+
+    Every job runs in a worker process forked from the daemon, so it starts with the interpreter, boto3, and the
+    service models already loaded while jobs stay isolated from each other. The worker takes over the client's stdout
+    and stderr and reports the exit status back over the connection. A job stops with its client: when the connection
+    closes before the job finishes, the job and its commands are interrupted as they would be in the client's process.
+
+    Parameters:
+
+    socket_path: str
+        The Unix socket to listen on. A stale socket left by a previous daemon is replaced.
+    run_job: callable
+        Called as run_job(argv) in the worker. Returns 0 or the error message of a failed job.
+    default_arguments: list of tuple
+        The (option, value) pairs of the host configuration, such as its workspaces roots, added to the arguments of
+        every job that does not set the option itself. Default is None, which runs the jobs with their own arguments.
+    """
+    log = CustomLogger(LOG_PREFIX)
+    __warm_up(log)
+
+    os.makedirs(os.path.dirname(socket_path), mode=SOCKET_DIRECTORY_MODE, exist_ok=True)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, SOCKET_MODE)
+    server.listen(LISTEN_BACKLOG)
+    server.settimeout(ACCEPT_TIMEOUT_SECONDS)
+    log.info(f'Listening for jobs on {socket_path}')
+
+    while True:
+        __reap_workers()
+        try:
+            connection, _ = server.accept()
+        except socket.timeout:
+            continue
+
+        try:
+            argv, environment, file_descriptors = __receive_job(connection)
+        except Exception as e:
+            log.error(f'Could not receive a job request: {e}')
+            connection.close()
+            continue
+        argv = __add_default_arguments(argv, default_arguments or [])
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            os._exit(__run_worker(log, connection, argv, environment, file_descriptors, run_job))
+
+        log.info(f'Started worker {pid} for job {argv}')
+        for file_descriptor in file_descriptors:
+            os.close(file_descriptor)
+        connection.close()
+
+
+def __warm_up(log):
+    for service in WARM_CLIENT_SERVICES:
+        try:
+            boto3.client(service)
+        except Exception as e:
+            log.info(f'Could not create a {service} client ahead of the first job: {e}')
+
+def __reap_workers():
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+def __receive_job(connection):
+    connection.settimeout(RECEIVE_TIMEOUT_SECONDS)
+    header_size = struct.calcsize(HEADER_FORMAT)
+    file_descriptors = array.array('i')
+    data, ancillary_data, _, _ = connection.recvmsg(
+        header_size, socket.CMSG_SPACE(PASSED_FILE_DESCRIPTOR_COUNT * file_descriptors.itemsize))
+    for level, message_type, message_data in ancillary_data:
+        if level == socket.SOL_SOCKET and message_type == socket.SCM_RIGHTS:
+            file_descriptors.frombytes(message_data[:len(message_data) - len(message_data) % file_descriptors.itemsize])
+
+    try:
+        if len(file_descriptors) != PASSED_FILE_DESCRIPTOR_COUNT:
+            raise RuntimeError(f'Expected {PASSED_FILE_DESCRIPTOR_COUNT} file descriptors but received {len(file_descriptors)}')
+        remaining_header = receive_exactly(connection, header_size - len(data)) if len(data) < header_size else b''
+        if remaining_header is None:
+            raise RuntimeError('The connection closed before the job request was complete')
+        payload_size = struct.unpack(HEADER_FORMAT, data + remaining_header)[0]
+        payload = receive_exactly(connection, payload_size)
+        if payload is None:
+            raise RuntimeError('The connection closed before the job request was complete')
+        request = json.loads(payload)
+    except Exception:
+        for file_descriptor in file_descriptors:
+            os.close(file_descriptor)
+        raise
+
+    connection.settimeout(None)
+    return request[ARGV_KEY], request[ENVIRONMENT_KEY], list(file_descriptors)
+
+def __add_default_arguments(argv, default_arguments):
+    # Options the job sets itself take precedence over the configuration of the host
+    added_arguments = []
+    for option, value in default_arguments:
+        if not any(argument == option or argument.startswith(f'{option}=') for argument in argv):
+            added_arguments += [option, value]
+    return added_arguments + argv
+
+def __cancel_job(signal_number, frame):
+    raise RuntimeError(CANCELLED_JOB_MESSAGE)
+
+def __watch_client(log, connection, argv, job_finished, daemon_output):
+    # The client sends nothing after its request, so the connection only becomes readable once the client is gone
+    try:
+        connection.recv(1)
+    except OSError:
+        pass
+    if job_finished.is_set():
+        return
+    # The client's stdout and stderr may be gone with it, so the rest of the job logs to the daemon output
+    os.dup2(daemon_output, sys.stdout.fileno())
+    os.dup2(daemon_output, sys.stderr.fileno())
+    log.info(f'The client of job {argv} disconnected, cancelling the job')
+    os.killpg(os.getpgrp(), CANCEL_SIGNAL)
+
+def __run_worker(log, connection, argv, environment, file_descriptors, run_job):
+    # The worker leads a process group of its own, so cancelling a job reaches the commands it runs and nothing else
+    os.setpgid(0, 0)
+    signal.signal(CANCEL_SIGNAL, __cancel_job)
+    daemon_output = os.dup(sys.stdout.fileno())
+
+    # The worker writes to the client's stdout and stderr and runs with the client's environment
+    os.dup2(file_descriptors[0], sys.stdout.fileno())
+    os.dup2(file_descriptors[1], sys.stderr.fileno())
+    for file_descriptor in file_descriptors:
+        os.close(file_descriptor)
+    os.environ.clear()
+    os.environ.update(environment)
+
+    job_finished = threading.Event()
+    threading.Thread(target=__watch_client, args=(log, connection, argv, job_finished, daemon_output),
+                     daemon=True).start()
+
+    try:
+        exit_code = run_job(argv)
+    except SystemExit as e:
+        # Raised by argparse for invalid arguments, after it printed the usage to stderr
+        exit_code = e.code
+    except BaseException:
+        traceback.print_exc()
+        exit_code = FAILED_EXIT_STATUS
+
+    job_finished.set()
+    # Report the result the way sys.exit would: a message goes to stderr with a failed status
+    if exit_code is None:
+        status = 0
+    elif isinstance(exit_code, int):
+        status = exit_code
+    else:
+        sys.stderr.write(f'{exit_code}\n')
+        status = FAILED_EXIT_STATUS
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        connection.sendall(struct.pack(STATUS_FORMAT, status))
+    except OSError:
+        pass
+    return status
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser(description = 'Runs terraform_runner jobs submitted by python3 -m terraform_runner')
+    parser.add_argument('--socket-path', default = DEFAULT_SOCKET_PATH, help = 'The Unix socket to listen on')
+    parser.add_argument('--workspaces-root', action = 'append',
+        help = 'A workspaces root for the jobs that do not set their own. Repeat for several.')
+    parser.add_argument('--extracted-tree-store-directory',
+        help = 'The extracted tree store for the jobs that do not set their own. '
+            f'Default is None, which leaves the jobs at {DEFAULT_EXTRACTED_TREE_STORE_DIRECTORY}.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = __parse_arguments()
+    # Workspaces and trees moved to the trash before a reboot are deleted once the daemon starts at boot
+    for trash_directory in get_trash_directories(
+            args.workspaces_root, args.extracted_tree_store_directory or DEFAULT_EXTRACTED_TREE_STORE_DIRECTORY):
+        start_trash_reaper(trash_directory)
+
+    default_arguments = [(WORKSPACES_ROOT_OPTION, workspaces_root) for workspaces_root in args.workspaces_root or []]
+    if args.extracted_tree_store_directory:
+        default_arguments.append((EXTRACTED_TREE_STORE_DIRECTORY_OPTION, args.extracted_tree_store_directory))
+    serve(args.socket_path, default_arguments=default_arguments)
@@ -0,0 +1,84 @@
+import array
+import json
+import os
+import socket
+import struct
+import sys
+
+# Constants
+# This module is imported on every run before anything else, so it must stay free of boto3 and the runner modules
+DEFAULT_SOCKET_PATH = os.path.join(os.path.expanduser('~'), '.terraform_runner', 'daemon.sock')
+SOCKET_PATH_ENVIRONMENT_VARIABLE = 'TERRAFORM_RUNNER_DAEMON_SOCKET'
+# A job request is a length prefixed JSON document sent together with the client's stdout and stderr descriptors
+HEADER_FORMAT = '!I'
+STATUS_FORMAT = '!i'
+PASSED_FILE_DESCRIPTOR_COUNT = 2
+FAILED_EXIT_STATUS = 1
+WORKER_EXITED_MESSAGE = 'The terraform_runner daemon worker exited before reporting the result of the job'
+
+# Job request keys
+ARGV_KEY = 'argv'
+ENVIRONMENT_KEY = 'environment'
+
+
+def get_socket_path() -> str:
+    """Returns the daemon socket path. Setting the environment variable to an empty string disables the daemon."""
+    return os.environ.get(SOCKET_PATH_ENVIRONMENT_VARIABLE, DEFAULT_SOCKET_PATH)
+
+
+def submit_job(argv: list, socket_path: str, stdout=sys.stdout, stderr=sys.stderr):
+    """Runs a job in the terraform_runner daemon and returns its exit status.
+    The job writes its logs and error message straight to the given stdout and stderr, as an in-process run would.
+
+    Returns None without running anything when no daemon is listening on the socket, so that the caller can run the
+    job in process instead.
+
+    Parameters:
+
+    argv: list of str
+        The terraform_runner command line arguments of the job
+    socket_path: str
+        The Unix socket the daemon listens on
+    stdout: file object
+        The file the job's stdout is connected to
+    stderr: file object
+        The file the job's stderr is connected to
+    """
+    if not socket_path:
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return None
+
+        payload = json.dumps({ARGV_KEY: argv, ENVIRONMENT_KEY: dict(os.environ)}).encode()
+        message = struct.pack(HEADER_FORMAT, len(payload)) + payload
+        stdout.flush()
+        stderr.flush()
+        file_descriptors = array.array('i', [stdout.fileno(), stderr.fileno()])
+        try:
+            sent = client.sendmsg([message], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, file_descriptors)])
+            client.sendall(message[sent:])
+        except OSError:
+            # The daemon never starts a job from an incomplete request
+            return None
+
+        status = receive_exactly(client, struct.calcsize(STATUS_FORMAT))
+        if status is None:
+            stderr.write(f'{WORKER_EXITED_MESSAGE}\n')
+            return FAILED_EXIT_STATUS
+        return struct.unpack(STATUS_FORMAT, status)[0]
+
+
+def receive_exactly(connection: socket.socket, size: int):
+    """Reads size bytes from a connection. Returns None when the connection closes first."""
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
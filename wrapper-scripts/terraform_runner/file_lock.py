@@ -0,0 +1,79 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def acquire_lock(lock_file_path: str, shared: bool = False):
+    """Holds an advisory lock on a lock file for the duration of the context, blocking until it is available.
+
+    Parameters:
+
+    lock_file_path: str
+        The path of the lock file. It is created if it does not exist and is never removed.
+    shared: bool
+        When True, takes a shared lock instead of an exclusive one. Default is False.
+    """
+    file_descriptor = __open_lock_file(lock_file_path)
+    try:
+        fcntl.flock(file_descriptor, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(file_descriptor)
+
+
+@contextmanager
+def try_acquire_lock(lock_file_path: str, shared: bool = False):
+    """Tries to take an advisory lock on a lock file without blocking.
+
+    Yields True when the lock is held for the duration of the context and False when another process holds it.
+    """
+    file_descriptor = __open_lock_file(lock_file_path)
+    try:
+        try:
+            fcntl.flock(file_descriptor, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+        else:
+            yield True
+    finally:
+        os.close(file_descriptor)
+
+
+def open_held_lock(lock_file_path: str, shared: bool = False) -> int:
+    """Takes an advisory lock, blocking until it is available, and returns the open file descriptor.
+    The lock is held until the caller closes the file descriptor or the process exits.
+    """
+    file_descriptor = __open_lock_file(lock_file_path)
+    try:
+        fcntl.flock(file_descriptor, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    except Exception:
+        os.close(file_descriptor)
+        raise
+    return file_descriptor
+
+
+def try_open_held_lock(lock_file_path: str, shared: bool = False):
+    """Takes an advisory lock without blocking and returns the open file descriptor, or None when another process
+    holds the lock. The lock is held until the caller closes the file descriptor or the process exits.
+    """
+    file_descriptor = __open_lock_file(lock_file_path)
+    try:
+        fcntl.flock(file_descriptor, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(file_descriptor)
+        return None
+    except Exception:
+        os.close(file_descriptor)
+        raise
+    return file_descriptor
+
+
+def downgrade_held_lock(file_descriptor: int):
+    """Converts an exclusive lock returned by open_held_lock into a shared lock"""
+    fcntl.flock(file_descriptor, fcntl.LOCK_SH)
+
+
+def __open_lock_file(lock_file_path):
+    os.makedirs(os.path.dirname(lock_file_path), exist_ok=True)
+    return os.open(lock_file_path, os.O_RDWR | os.O_CREAT, 0o644)
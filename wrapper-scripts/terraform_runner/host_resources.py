@@ -0,0 +1,51 @@
+import os
+import shutil
+
+# Constants
+MEMINFO_FILE = '/proc/meminfo'
+MEMINFO_AVAILABLE_KEY = 'MemAvailable:'
+BYTES_PER_KB = 1024
+
+
+def get_cpu_count() -> int:
+    """Returns the number of CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def find_usable_directory(candidate_directories: list, required_free_bytes: int):
+    """Returns the first of the candidate directories that the current user can create and write to, and whose file
+    system has at least the required free space, or None when no candidate is usable.
+    """
+    for directory in candidate_directories:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            continue
+        if not os.access(directory, os.W_OK | os.X_OK):
+            continue
+        if shutil.disk_usage(directory).free >= required_free_bytes:
+            return directory
+    return None
+
+
+def get_disk_usage(path: str):
+    """Returns the total, used, and free bytes of the file system of a path, which may not have been created yet"""
+    # The parent of a missing directory is on the same file system
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path)
+
+
+def get_available_memory():
+    """Returns the memory in bytes that can be allocated without swapping, or None when the host does not report it"""
+    try:
+        with open(MEMINFO_FILE, 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith(MEMINFO_AVAILABLE_KEY):
+                    return int(line.split()[1]) * BYTES_PER_KB
+    except OSError:
+        pass
+    return None
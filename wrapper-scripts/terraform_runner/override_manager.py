@@ -1,10 +1,10 @@
 import json
+import os
 from json.decoder import JSONDecodeError
 
 BACKEND_FILE_NAME = "backend_override.tf.json"
 VARIABLE_FILE_NAME = "variable_override.tf.json"
 PROVIDER_FILE_NAME = "provider_override.tf.json"
-MAX_SESSION_NAME_LENGTH = 64
 
 
 def write_backend_override(workspace_dir, provisioned_product_descriptor, state_bucket, state_region):
@@ -25,6 +25,9 @@ def write_backend_override(workspace_dir, provisioned_product_descriptor, state_
 
 def write_variable_override(workspace_dir, variables):
     if not variables:
+        # A retained workspace may hold the override of an earlier run, for variables this artifact may not declare
+        if os.path.exists(f"{workspace_dir}/{VARIABLE_FILE_NAME}"):
+            os.remove(f"{workspace_dir}/{VARIABLE_FILE_NAME}")
         return
 
     variable_override = {'variable': {}}
@@ -38,14 +41,16 @@ def write_variable_override(workspace_dir, variables):
         json.dump(variable_override, json_file)
 
 
-def write_provider_override(workspace_dir, provisioned_product_descriptor, launch_role_arn, region, tags):
+def write_provider_override(workspace_dir, profile, region, tags):
+    # The profile already holds the launch role credentials. A nested block in an override replaces the blocks of its
+    # type in the artifact, so this empty assume_role keeps the provider from chaining a role of the artifact onto them.
     provider_override = {
         "provider": {
             "aws": {
                 "region": f"{region}",
+                "profile": f"{profile}",
                 "assume_role": {
-                    "role_arn": f"{launch_role_arn}",
-                    "session_name": __format_session_name(provisioned_product_descriptor)
+                    "role_arn": ""
                 },
                 'default_tags': {
                     'tags': {
@@ -63,6 +68,3 @@ def write_provider_override(workspace_dir, provisioned_product_descriptor, launc
     with open(f"{workspace_dir}/{PROVIDER_FILE_NAME}", "w") as json_file:
         json.dump(provider_override, json_file)
 
-
-def __format_session_name(unformatted_session_name):
-    return f"{unformatted_session_name[:MAX_SESSION_NAME_LENGTH]}".replace('/', '-')
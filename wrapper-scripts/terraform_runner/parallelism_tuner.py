@@ -0,0 +1,84 @@
+import json
+from fnmatch import fnmatch
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.host_resources import get_available_memory, get_cpu_count
+
+# Constants
+# Most Terraform operations wait on AWS API calls, so several of them share a CPU
+OPERATIONS_PER_CPU = 4
+MIN_PARALLELISM = 2
+# Terraform's own default. A run alone on the host never gets less, unless memory is short, so small instances are
+# not slower than without tuning.
+TERRAFORM_DEFAULT_PARALLELISM = 10
+MAX_PARALLELISM = 64
+
+# Overrides file keys
+OVERRIDES_KEY = 'overrides'
+ARTIFACT_PATH_KEY = 'artifact_path'
+PROVISIONED_PRODUCT_DESCRIPTOR_KEY = 'provisioned_product_descriptor'
+PARALLELISM_KEY = 'parallelism'
+
+
+def calculate_parallelism(cpu_count: int, available_memory_bytes, active_run_count: int,
+                          memory_per_operation_bytes: int) -> int:
+    """Returns the number of concurrent Terraform operations a run can use without oversubscribing the host.
+
+    Parameters:
+
+    cpu_count: int
+        The number of CPUs on the host
+    available_memory_bytes: int
+        The memory still available on the host, or None when unknown. Active runs have already taken theirs from it.
+    active_run_count: int
+        The number of runs on the host, including this one. They share the CPUs equally. A run alone on the host gets
+        at least Terraform's default parallelism of 10, unless memory is short.
+    memory_per_operation_bytes: int
+        The memory an operation in flight needs. 0 ignores memory.
+    """
+    parallelism = cpu_count * OPERATIONS_PER_CPU // max(active_run_count, 1)
+    if active_run_count <= 1:
+        parallelism = max(parallelism, TERRAFORM_DEFAULT_PARALLELISM)
+    if available_memory_bytes is not None and memory_per_operation_bytes > 0:
+        parallelism = min(parallelism, available_memory_bytes // memory_per_operation_bytes)
+    return max(MIN_PARALLELISM, min(parallelism, MAX_PARALLELISM))
+
+
+def find_parallelism_override(overrides_file: str, artifact_path: str, provisioned_product_descriptor: str):
+    """Returns the parallelism of the first override matching the run, or None.
+
+    The overrides file holds a list of overrides, each with a parallelism and glob patterns for the artifact path,
+    the provisioned product descriptor, or both. Every pattern an override has must match. For example:
+
+    {"overrides": [{"artifact_path": "s3://artifacts/network-*", "parallelism": 30}]}
+    """
+    try:
+        with open(overrides_file, 'r') as json_file:
+            overrides = json.load(json_file)[OVERRIDES_KEY]
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        raise RuntimeError(f'Invalid parallelism overrides file {overrides_file}: {e}')
+
+    run_values = {ARTIFACT_PATH_KEY: artifact_path or '', PROVISIONED_PRODUCT_DESCRIPTOR_KEY: provisioned_product_descriptor}
+    for override in overrides:
+        patterns = {key: override[key] for key in run_values if key in override}
+        if patterns and all(fnmatch(run_values[key], pattern) for key, pattern in patterns.items()):
+            return int(override[PARALLELISM_KEY])
+    return None
+
+
+def choose_parallelism(log: CustomLogger, overrides_file: str, artifact_path: str, provisioned_product_descriptor: str,
+                       active_run_count: int, memory_per_operation_bytes: int) -> int:
+    """Returns the parallelism for a run, from the operator overrides when one matches and from the host otherwise"""
+    override = find_parallelism_override(overrides_file, artifact_path, provisioned_product_descriptor)
+    if override is not None:
+        log.info(f'Using terraform parallelism {override} from the overrides in {overrides_file}')
+        return override
+
+    cpu_count = get_cpu_count()
+    available_memory_bytes = get_available_memory()
+    parallelism = calculate_parallelism(cpu_count, available_memory_bytes, active_run_count, memory_per_operation_bytes)
+    log.info(f'Using terraform parallelism {parallelism} for {cpu_count} CPUs, {available_memory_bytes} bytes of '
+             f'available memory, and {active_run_count} active runs')
+    return parallelism
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+from glob import glob
+
+from terraform_runner.CommandManager import CommandManager
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import acquire_lock
+from terraform_runner.RunMetrics import RunMetrics
+from terraform_runner.WorkspaceManager import PROVIDER_PACKAGE_PATTERN
+
+# Constants
+LOG_PREFIX = 'terraform_runner_prewarm'
+PREWARM_ACTION = 'prewarm'
+PROVIDER_INSTALL_PHASE = 'provider_install'
+TF_PLUGIN_CACHE_DIR = 'TF_PLUGIN_CACHE_DIR'
+DEFAULT_PLUGIN_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), 'cache', 'plugins')
+DEFAULT_HISTORY_DAYS = 7
+SECONDS_PER_DAY = 86400
+CONFIGURATION_FILE_NAME = 'main.tf.json'
+# Terraform names architectures after Go, and Python after the kernel
+MACHINE_ARCHITECTURES = {'x86_64': 'amd64', 'aarch64': 'arm64'}
+
+# Manifest keys
+PROVIDERS_KEY = 'providers'
+SOURCE_KEY = 'source'
+VERSION_KEY = 'version'
+
+
+def read_manifest(manifest_file: str) -> list:
+    """Returns the providers of a prewarm manifest as a list of (source, version) tuples. Sources are fully
+    qualified, as in registry.terraform.io/hashicorp/aws.
+    """
+    try:
+        with open(manifest_file, 'r') as json_file:
+            manifest = json.load(json_file)
+        return [(provider[SOURCE_KEY], provider[VERSION_KEY]) for provider in manifest[PROVIDERS_KEY]]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(f'Invalid provider prewarm manifest {manifest_file}: {e}')
+
+
+def generate_manifest(plugin_cache_directory: str, history_seconds: int) -> dict:
+    """Returns a prewarm manifest of the provider versions in a plugin cache that runs used within the history.
+    Runs mark the packages they use, so the manifest reflects the recent runs on the host.
+
+    Parameters:
+
+    plugin_cache_directory: str
+        The plugin cache of a host that has been running for a while
+    history_seconds: int
+        How far back a package must have been used to be included
+    """
+    used_since = time.time() - history_seconds
+    providers = set()
+    for package in glob(os.path.join(plugin_cache_directory, PROVIDER_PACKAGE_PATTERN)):
+        if os.path.isdir(package) and os.path.getmtime(package) >= used_since:
+            # The package directory is <hostname>/<namespace>/<type>/<version>/<os_arch>
+            source_directory, version = os.path.split(os.path.dirname(os.path.relpath(package, plugin_cache_directory)))
+            providers.add((source_directory.replace(os.sep, '/'), version))
+    return {PROVIDERS_KEY: [{SOURCE_KEY: source, VERSION_KEY: version} for source, version in sorted(providers)]}
+
+
+def prewarm_plugin_cache(log: CustomLogger, command_manager: CommandManager, providers: list,
+                         plugin_cache_directory: str, metrics: RunMetrics) -> list:
+    """Installs provider versions into the plugin cache with terraform init, so the first runs on a new host do not
+    download them. Versions already in the cache are skipped. Returns the providers that could not be installed.
+
+    Parameters:
+
+    log: CustomLogger
+        The object used to write logs
+    command_manager: CommandManager
+        The object used to run terraform init
+    providers: list of tuple
+        The (source, version) of each provider to install
+    plugin_cache_directory: str
+        The host-wide plugin cache the runs use
+    metrics: RunMetrics
+        Records the time spent and the number of providers installed, cached, and failed
+    """
+    os.makedirs(plugin_cache_directory, exist_ok=True)
+    os.environ[TF_PLUGIN_CACHE_DIR] = plugin_cache_directory
+    os_arch = get_os_arch()
+    missing_providers = []
+    for source, version in sorted(set(providers)):
+        if os.path.isdir(os.path.join(plugin_cache_directory, *source.split('/'), version, os_arch)):
+            metrics.add_counter('providers_cached')
+        else:
+            missing_providers.append((source, version))
+    log.info(f'{len(missing_providers)} of {len(set(providers))} providers are missing from {plugin_cache_directory}')
+
+    failed_providers = []
+    for round_providers in split_into_rounds(missing_providers):
+        start_time = time.monotonic()
+        with metrics.phase(PROVIDER_INSTALL_PHASE):
+            failed_providers.extend(__install_round(log, command_manager, round_providers, plugin_cache_directory,
+                                                    metrics))
+        log.info(f'Installing {len(round_providers)} providers took {time.monotonic() - start_time:.2f} seconds')
+    return failed_providers
+
+
+def split_into_rounds(providers: list) -> list:
+    """Splits (source, version) tuples into lists with at most one version of each provider, since a configuration
+    can only require one version of a provider
+    """
+    rounds = []
+    version_counts = {}
+    for source, version in providers:
+        round_index = version_counts.get(source, 0)
+        version_counts[source] = round_index + 1
+        if round_index == len(rounds):
+            rounds.append([])
+        rounds[round_index].append((source, version))
+    return rounds
+
+
+def write_provider_requirements(configuration_directory: str, providers: list):
+    """Writes a configuration that requires exactly the given (source, version) tuples into an empty directory"""
+    required_providers = {}
+    for index, (source, version) in enumerate(providers):
+        required_providers[f'provider_{index}'] = {SOURCE_KEY: source, VERSION_KEY: f'= {version}'}
+    with open(os.path.join(configuration_directory, CONFIGURATION_FILE_NAME), 'w') as json_file:
+        json.dump({'terraform': {'required_providers': required_providers}}, json_file)
+
+
+def get_os_arch() -> str:
+    """Returns the platform of the host as Terraform names it, for example linux_amd64"""
+    machine = platform.machine().lower()
+    return f'{platform.system().lower()}_{MACHINE_ARCHITECTURES.get(machine, machine)}'
+
+
+def __install_round(log, command_manager, providers, plugin_cache_directory, metrics):
+    try:
+        __install_providers(command_manager, providers, plugin_cache_directory)
+        metrics.add_counter('providers_installed', len(providers))
+        return []
+    except RuntimeError as e:
+        log.error(f'Could not install providers together, installing them one by one: {e}')
+
+    # One provider that cannot be installed must not keep the others out of the cache
+    failed_providers = []
+    for provider in providers:
+        try:
+            __install_providers(command_manager, [provider], plugin_cache_directory)
+            metrics.add_counter('providers_installed')
+        except RuntimeError as e:
+            log.error(f'Could not install provider {provider[0]} {provider[1]}: {e}')
+            metrics.add_counter('providers_failed')
+            failed_providers.append(provider)
+    return failed_providers
+
+
+def __install_providers(command_manager, providers, plugin_cache_directory):
+    with tempfile.TemporaryDirectory() as configuration_directory:
+        write_provider_requirements(configuration_directory, providers)
+        # The same lock as the runs, since Terraform does not make the plugin cache safe for concurrent writers
+        with acquire_lock(f'{plugin_cache_directory}.lock'):
+            command_manager.run_command(['terraform', f'-chdir={configuration_directory}', 'init', '-backend=false',
+                                         '-input=false', '-no-color'], stream_output=True)
+
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser(
+        description = 'Installs the providers of a manifest into the terraform_runner plugin cache, or generates the '
+            'manifest from the providers recent runs used')
+    parser.add_argument('--manifest', help = 'The JSON manifest of the providers to install')
+    parser.add_argument('--generate-manifest',
+        help = 'Write a manifest of the providers used within --history-days to this file instead of installing')
+    parser.add_argument('--history-days', type = int, default = DEFAULT_HISTORY_DAYS,
+        help = 'How many days back a provider must have been used to be in a generated manifest')
+    parser.add_argument('--plugin-cache-directory', default = DEFAULT_PLUGIN_CACHE_DIRECTORY,
+        help = 'The host-wide Terraform provider plugin cache directory')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = __parse_arguments()
+    if args.generate_manifest:
+        with open(args.generate_manifest, 'w') as json_file:
+            json.dump(generate_manifest(args.plugin_cache_directory, args.history_days * SECONDS_PER_DAY), json_file,
+                      indent=2)
+        sys.exit(0)
+
+    log = CustomLogger(LOG_PREFIX)
+    metrics = RunMetrics(log, PREWARM_ACTION, socket.gethostname())
+    exit_code = 0
+    try:
+        failed_providers = prewarm_plugin_cache(log, CommandManager(log), read_manifest(args.manifest),
+                                                args.plugin_cache_directory, metrics)
+        if failed_providers:
+            exit_code = f'Could not install {len(failed_providers)} providers: {failed_providers}'
+    except Exception as e:
+        log.error(str(e))
+        exit_code = str(e)
+    metrics.log_summary(exit_code)
+    sys.exit(1 if exit_code else 0)
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from glob import glob
+
+import boto3
+
+from terraform_runner.CommandManager import CommandManager
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.plugin_prewarm import get_os_arch, read_manifest, split_into_rounds, write_provider_requirements
+
+# Constants
+LOG_PREFIX = 'terraform_runner_mirror'
+PUBLISH_COMMAND = 'publish'
+SYNC_COMMAND = 'sync'
+TF_CLI_CONFIG_FILE = 'TF_CLI_CONFIG_FILE'
+DEFAULT_PREFIX = 'provider-mirror/'
+DEFAULT_MIRROR_DIRECTORY = os.path.join(os.path.expanduser('~'), 'cache', 'provider-mirror')
+DEFAULT_CLI_CONFIG_FILE = os.path.join(os.path.expanduser('~'), 'cache', 'provider-mirror.tfrc')
+# Records the ETag of every synced file, so unchanged files are not downloaded again
+SYNC_STATE_FILE_NAME = '.mirror-sync-state.json'
+DOWNLOAD_FILE_SUFFIX = '.download'
+# Packages are named after their version and platform and never change. The index files of each provider do.
+INDEX_FILE_SUFFIX = '.json'
+# Mirrored providers are laid out as <hostname>/<namespace>/<type>
+MIRRORED_PROVIDER_PATTERN = '*/*/*'
+
+# S3 response keys
+CONTENTS_KEY = 'Contents'
+KEY_KEY = 'Key'
+ETAG_KEY = 'ETag'
+
+# Sync statistics keys
+DOWNLOADED_KEY = 'downloaded'
+REMOVED_KEY = 'removed'
+UNCHANGED_KEY = 'unchanged'
+
+
+def sync_mirror(log: CustomLogger, s3, bucket: str, prefix: str, mirror_directory: str) -> dict:
+    """Makes a local directory an exact copy of the provider mirror under a prefix of a bucket. Only new and changed
+    files are downloaded, and files no longer in the bucket are removed. Returns the number of files downloaded,
+    removed, and unchanged.
+
+    Parameters:
+
+    log: CustomLogger
+        The object used to write logs
+    s3: S3.Client
+        The client used to list and download the mirror
+    bucket: str
+        The bucket of the mirror, usually the bootstrap bucket
+    prefix: str
+        The prefix of the mirror in the bucket
+    mirror_directory: str
+        The local directory Terraform uses as a filesystem mirror
+    """
+    os.makedirs(mirror_directory, exist_ok=True)
+    remote_etags = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get(CONTENTS_KEY, []):
+            relative_path = s3_object[KEY_KEY][len(prefix):]
+            if not relative_path or relative_path.endswith('/'):
+                continue
+            if os.path.isabs(relative_path) or '..' in relative_path.split('/'):
+                raise RuntimeError(f'Provider mirror object {s3_object[KEY_KEY]} has a path outside the mirror')
+            remote_etags[relative_path] = s3_object[ETAG_KEY]
+
+    state_file = os.path.join(mirror_directory, SYNC_STATE_FILE_NAME)
+    try:
+        with open(state_file, 'r') as json_file:
+            local_etags = json.load(json_file)
+    except (FileNotFoundError, ValueError):
+        local_etags = {}
+
+    statistics = {DOWNLOADED_KEY: 0, REMOVED_KEY: 0, UNCHANGED_KEY: 0}
+    for relative_path, etag in sorted(remote_etags.items()):
+        local_file = os.path.join(mirror_directory, *relative_path.split('/'))
+        if local_etags.get(relative_path) == etag and os.path.isfile(local_file):
+            statistics[UNCHANGED_KEY] += 1
+            continue
+        os.makedirs(os.path.dirname(local_file), exist_ok=True)
+        # Terraform never sees a partial package, since files appear with a single rename
+        s3.download_file(bucket, f'{prefix}{relative_path}', f'{local_file}{DOWNLOAD_FILE_SUFFIX}')
+        os.replace(f'{local_file}{DOWNLOAD_FILE_SUFFIX}', local_file)
+        local_etags[relative_path] = etag
+        statistics[DOWNLOADED_KEY] += 1
+
+    for relative_path in __list_files(mirror_directory):
+        if relative_path not in remote_etags:
+            os.remove(os.path.join(mirror_directory, *relative_path.split('/')))
+            local_etags.pop(relative_path, None)
+            statistics[REMOVED_KEY] += 1
+
+    with open(state_file, 'w') as json_file:
+        json.dump({path: etag for path, etag in local_etags.items() if path in remote_etags}, json_file)
+    log.info(f'Synced provider mirror s3://{bucket}/{prefix} into {mirror_directory}: '
+             f'{statistics[DOWNLOADED_KEY]} files downloaded, {statistics[REMOVED_KEY]} removed, '
+             f'{statistics[UNCHANGED_KEY]} unchanged')
+    return statistics
+
+
+def publish_mirror(log: CustomLogger, command_manager: CommandManager, s3, bucket: str, prefix: str, providers: list,
+                   platforms: list, work_directory: str) -> int:
+    """Adds provider versions to the mirror under a prefix of a bucket with terraform providers mirror, keeping the
+    versions already in it. Returns the number of files uploaded.
+
+    Parameters:
+
+    log: CustomLogger
+        The object used to write logs
+    command_manager: CommandManager
+        The object used to run terraform providers mirror
+    s3: S3.Client
+        The client used to read and update the mirror
+    bucket: str
+        The bucket of the mirror, usually the bootstrap bucket
+    prefix: str
+        The prefix of the mirror in the bucket
+    providers: list of tuple
+        The (source, version) of each provider to add
+    platforms: list of str
+        The platforms of the worker hosts, such as linux_amd64
+    work_directory: str
+        A local directory that holds a copy of the mirror while it is updated
+    """
+    # Terraform adds the new versions to the index files of the existing mirror
+    sync_mirror(log, s3, bucket, prefix, work_directory)
+    remote_files = set(__list_files(work_directory))
+
+    platform_flags = [f'-platform={platform_name}' for platform_name in platforms]
+    for round_providers in split_into_rounds(sorted(set(providers))):
+        with tempfile.TemporaryDirectory() as configuration_directory:
+            write_provider_requirements(configuration_directory, round_providers)
+            command_manager.run_command(['terraform', f'-chdir={configuration_directory}', 'providers', 'mirror']
+                                        + platform_flags + [os.path.abspath(work_directory)], stream_output=True)
+
+    uploaded_count = 0
+    for relative_path in __list_files(work_directory):
+        if relative_path in remote_files and not relative_path.endswith(INDEX_FILE_SUFFIX):
+            continue
+        s3.upload_file(os.path.join(work_directory, *relative_path.split('/')), bucket, f'{prefix}{relative_path}')
+        uploaded_count += 1
+    log.info(f'Published {uploaded_count} files to provider mirror s3://{bucket}/{prefix}')
+    return uploaded_count
+
+
+def write_cli_config(cli_config_file: str, mirror_directory: str, exclusive: bool = False) -> bool:
+    """Writes a Terraform CLI configuration that installs the providers in the local mirror from it, and every other
+    provider from its registry. Removes the configuration and returns False when the mirror has no providers.
+
+    Parameters:
+
+    cli_config_file: str
+        The file to write, which runs pass to Terraform with TF_CLI_CONFIG_FILE
+    mirror_directory: str
+        The local filesystem mirror
+    exclusive: bool
+        When True, the providers in the mirror are never looked up in their registry, which saves the registry
+        requests but fails terraform init for versions missing from the mirror. Default is False, which still looks
+        up every mirrored provider in its registry and installs from it when it has a newer matching version.
+    """
+    mirrored_providers = sorted(os.path.relpath(directory, mirror_directory).replace(os.sep, '/')
+                                for directory in glob(os.path.join(mirror_directory, MIRRORED_PROVIDER_PATTERN))
+                                if os.path.isdir(directory))
+    if not mirrored_providers:
+        try:
+            os.remove(cli_config_file)
+        except FileNotFoundError:
+            pass
+        return False
+
+    provider_list = json.dumps(mirrored_providers)
+    direct_block = f'  direct {{\n    exclude = {provider_list}\n  }}\n' if exclusive else '  direct {}\n'
+    # Written aside and renamed, so runs never read a partial configuration
+    temporary_file = f'{cli_config_file}.{os.getpid()}'
+    os.makedirs(os.path.dirname(os.path.abspath(cli_config_file)), exist_ok=True)
+    with open(temporary_file, 'w') as file_handle:
+        file_handle.write('provider_installation {\n'
+                          '  filesystem_mirror {\n'
+                          f'    path    = {json.dumps(os.path.abspath(mirror_directory))}\n'
+                          f'    include = {provider_list}\n'
+                          '  }\n'
+                          f'{direct_block}'
+                          '}\n')
+    os.replace(temporary_file, cli_config_file)
+    return True
+
+
+def configure_terraform_cli(cli_config_file: str) -> bool:
+    """Points Terraform at the CLI configuration written by the mirror sync, when there is one. Returns True when the
+    configuration is used.
+    """
+    if not cli_config_file or not os.path.isfile(cli_config_file):
+        return False
+    os.environ[TF_CLI_CONFIG_FILE] = cli_config_file
+    return True
+
+
+def __list_files(directory):
+    files = []
+    for parent, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if (parent == directory and file_name == SYNC_STATE_FILE_NAME) or file_name.endswith(DOWNLOAD_FILE_SUFFIX):
+                continue
+            files.append(os.path.relpath(os.path.join(parent, file_name), directory).replace(os.sep, '/'))
+    return files
+
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser(
+        description = 'Maintains the Terraform provider mirror in S3 and syncs it into a local filesystem mirror')
+    subparsers = parser.add_subparsers(dest = 'command')
+    subparsers.required = True
+
+    publish_parser = subparsers.add_parser(PUBLISH_COMMAND,
+        help = 'Add the providers of a prewarm manifest to the mirror in S3')
+    publish_parser.add_argument('--manifest', required = True,
+        help = 'The JSON manifest of the providers to add, as written by terraform_runner.plugin_prewarm')
+    publish_parser.add_argument('--platform', action = 'append',
+        help = 'A platform of the worker hosts. Repeat for several. Default is the platform of this host.')
+    publish_parser.add_argument('--work-directory',
+        help = 'Keep the local copy of the mirror in this directory. Default is a temporary directory.')
+
+    sync_parser = subparsers.add_parser(SYNC_COMMAND,
+        help = 'Sync the mirror in S3 into the local filesystem mirror and write the Terraform CLI configuration')
+    sync_parser.add_argument('--mirror-directory', default = DEFAULT_MIRROR_DIRECTORY,
+        help = 'The local filesystem mirror')
+    sync_parser.add_argument('--cli-config-file', default = DEFAULT_CLI_CONFIG_FILE,
+        help = 'The Terraform CLI configuration file the runner passes to Terraform')
+    sync_parser.add_argument('--exclusive', action = 'store_true',
+        help = 'Never look up mirrored providers in their registry, so versions missing from the mirror fail init')
+
+    for subparser in (publish_parser, sync_parser):
+        subparser.add_argument('--bucket', required = True,
+            help = 'The bucket of the mirror, usually the bootstrap bucket')
+        subparser.add_argument('--prefix', default = DEFAULT_PREFIX, help = 'The prefix of the mirror in the bucket')
+        subparser.add_argument('--region', help = 'The region of the bucket')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = __parse_arguments()
+    log = CustomLogger(LOG_PREFIX)
+    s3 = boto3.client('s3', region_name=args.region)
+    try:
+        if args.command == PUBLISH_COMMAND:
+            providers = read_manifest(args.manifest)
+            if args.work_directory:
+                publish_mirror(log, CommandManager(log), s3, args.bucket, args.prefix, providers,
+                               args.platform or [get_os_arch()], args.work_directory)
+            else:
+                with tempfile.TemporaryDirectory() as work_directory:
+                    publish_mirror(log, CommandManager(log), s3, args.bucket, args.prefix, providers,
+                                   args.platform or [get_os_arch()], work_directory)
+        else:
+            sync_mirror(log, s3, args.bucket, args.prefix, args.mirror_directory)
+            if write_cli_config(args.cli_config_file, args.mirror_directory, args.exclusive):
+                log.info(f'Terraform installs mirrored providers from {args.mirror_directory}')
+    except Exception as e:
+        log.error(str(e))
+        sys.exit(1)
@@ -0,0 +1,493 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import traceback
+
+from terraform_runner.AdmissionController import AdmissionController
+from terraform_runner.ArtifactCache import ArtifactCache
+from terraform_runner.artifact_manager import download_artifact, DOWNLOAD_MODE_FILE, DOWNLOAD_MODES, \
+    DEFAULT_MAX_WORKERS, DEFAULT_PART_SIZE_BYTES, BYTES_DOWNLOADED_KEY, DOWNLOAD_SECONDS_KEY, MAX_UNCOMPRESSED_SIZE_BYTES
+from terraform_runner.CommandManager import CommandManager
+from terraform_runner.credential_manager import format_session_name, get_credentials, write_credential_process_config, \
+    EXPIRATION_KEY, LAUNCH_ROLE_PROFILE
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.ExtractedTreeStore import ExtractedTreeStore
+from terraform_runner.host_resources import find_usable_directory, get_cpu_count, get_disk_usage
+from terraform_runner.LockFileCache import LockFileCache
+from terraform_runner.ModuleCache import ModuleCache
+from terraform_runner.override_manager import write_backend_override, write_variable_override, write_provider_override
+from terraform_runner.parallelism_tuner import choose_parallelism
+from terraform_runner.provider_mirror import configure_terraform_cli, DEFAULT_CLI_CONFIG_FILE
+from terraform_runner.RunMetrics import RunMetrics
+from terraform_runner.state_manager import read_state, state_exists, count_managed_resources
+from terraform_runner.ValidationCache import ValidationCache
+from terraform_runner.WorkspaceManager import WorkspaceManager, PLAN_FILE_NAME
+from terraform_runner.workspace_reaper import get_workspaces_roots, DEFAULT_WORKSPACES_ROOT
+
+
+# Constants
+APPLY_ACTION = 'apply'
+DESTROY_ACTION = 'destroy'
+PROVISION_PRODUCT_OPERATION = 'PROVISION_PRODUCT'
+UPDATE_PROVISIONED_PRODUCT_OPERATION = 'UPDATE_PROVISIONED_PRODUCT'
+# terraform plan -detailed-exitcode return codes
+PLAN_NO_CHANGES_RETURN_CODE = 0
+PLAN_CHANGES_PRESENT_RETURN_CODE = 2
+AWS_DEFAULT_REGION = 'AWS_DEFAULT_REGION'
+AWS_CONFIG_FILE = 'AWS_CONFIG_FILE'
+AWS_SDK_LOAD_CONFIG = 'AWS_SDK_LOAD_CONFIG'
+TF_PLUGIN_CACHE_DIR = 'TF_PLUGIN_CACHE_DIR'
+TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE = 'TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE'
+DEFAULT_CACHE_ROOT = os.path.join(os.path.expanduser('~'), 'cache')
+DEFAULT_EXTRACTED_TREE_STORE_DIRECTORY = os.path.join(DEFAULT_CACHE_ROOT, 'trees')
+DEFAULT_ARTIFACT_CACHE_MAX_SIZE_MB = 5120
+DEFAULT_PLUGIN_CACHE_MAX_SIZE_MB = 10240
+DEFAULT_EXTRACTED_TREE_STORE_MAX_SIZE_MB = 5120
+DEFAULT_MODULE_CACHE_MAX_SIZE_MB = 1024
+DEFAULT_VALIDATION_CACHE_MAX_ENTRIES = 10000
+DEFAULT_LOCK_FILE_CACHE_MAX_ENTRIES = 10000
+DEFAULT_RETAINED_WORKSPACE_TTL_HOURS = 72
+DEFAULT_MAX_RETAINED_WORKSPACES = 20
+DEFAULT_RUN_MEMORY_MB = 1024
+DEFAULT_RUN_DISK_MB = 2048
+DEFAULT_ADMISSION_TIMEOUT_MINUTES = 20
+DEFAULT_MIN_FREE_DISK_MB = 1024
+DEFAULT_OPERATION_MEMORY_MB = 64
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_MINUTE = 60
+CREDENTIALS_DIRECTORY_PREFIX = 'terraform-runner-credentials-'
+BYTES_PER_MB = 1024 * 1024
+
+
+def __parse_arguments(argv):
+    # The program name is fixed because jobs run by the daemon are parsed in a worker of the daemon process
+    parser = argparse.ArgumentParser(prog = 'terraform_runner')
+    parser.add_argument('--action', help = 'The action to perform', choices = [APPLY_ACTION, DESTROY_ACTION])
+    parser.add_argument('--operation', choices = [PROVISION_PRODUCT_OPERATION, UPDATE_PROVISIONED_PRODUCT_OPERATION],
+        help = 'The Service Catalog operation an apply performs. Updates plan first and skip apply when nothing changed.')
+    parser.add_argument('--provisioned-product-descriptor', 
+        help = 'A descriptor that uniquely identifies a provisioned product')
+    parser.add_argument('--launch-role', help = 'The launch role Arn')
+    parser.add_argument('--region',
+        help = 'The region where resources will be provisioned and where the Terraform state will be stored')
+    parser.add_argument('--terraform-state-bucket', 
+        help = 'The bucket where the Terraform state will be stored')
+    parser.add_argument('--artifact-path', help = 'The artifact S3 path in URI format')
+    parser.add_argument('--artifact-parameters', type = json.loads,
+        help = 'Artifact parameters in json format')
+    parser.add_argument('--tags', type = json.loads,
+        help = 'Tags to apply to the provisioned resources, in json format')
+    parser.add_argument('--artifact-cache-directory', default = os.path.join(DEFAULT_CACHE_ROOT, 'artifacts'),
+        help = 'The host-local directory where downloaded artifacts are cached between runs')
+    parser.add_argument('--artifact-cache-max-size-mb', type = int, default = DEFAULT_ARTIFACT_CACHE_MAX_SIZE_MB,
+        help = 'The disk budget of the artifact cache in MB. Set to 0 to disable the cache.')
+    parser.add_argument('--artifact-download-mode', choices = DOWNLOAD_MODES, default = DOWNLOAD_MODE_FILE,
+        help = 'file downloads the artifact before extracting it and uses the artifact cache. '
+            'parallel does the same with concurrent ranged requests. '
+            'stream extracts the artifact while it downloads and bypasses the artifact cache.')
+    parser.add_argument('--artifact-download-part-size-mb', type = int, default = DEFAULT_PART_SIZE_BYTES // BYTES_PER_MB,
+        help = 'The size of each ranged request in parallel download mode')
+    parser.add_argument('--artifact-download-workers', type = int, default = DEFAULT_MAX_WORKERS,
+        help = 'The number of concurrent ranged requests in parallel download mode')
+    parser.add_argument('--extracted-tree-store-directory', default = DEFAULT_EXTRACTED_TREE_STORE_DIRECTORY,
+        help = 'The host-local directory of extracted artifacts that workspaces are linked to. '
+            'Keep it on the file system of the workspaces so files are hard linked rather than copied.')
+    parser.add_argument('--extracted-tree-store-max-size-mb', type = int,
+        default = DEFAULT_EXTRACTED_TREE_STORE_MAX_SIZE_MB,
+        help = 'The disk budget of the extracted tree store in MB. Set to 0 to extract every artifact into its workspace.')
+    parser.add_argument('--plugin-cache-directory', default = os.path.join(DEFAULT_CACHE_ROOT, 'plugins'),
+        help = 'The host-wide Terraform provider plugin cache directory')
+    parser.add_argument('--plugin-cache-max-size-mb', type = int, default = DEFAULT_PLUGIN_CACHE_MAX_SIZE_MB,
+        help = 'The size of the provider plugin cache in MB above which unused providers are evicted. Set to 0 to disable the cache.')
+    parser.add_argument('--module-cache-directory', default = os.path.join(DEFAULT_CACHE_ROOT, 'modules'),
+        help = 'The host-local directory where remote modules installed by terraform init are cached between runs')
+    parser.add_argument('--module-cache-max-size-mb', type = int, default = DEFAULT_MODULE_CACHE_MAX_SIZE_MB,
+        help = 'The disk budget of the module cache in MB. Set to 0 to disable the cache.')
+    parser.add_argument('--lock-file-cache-directory', default = os.path.join(DEFAULT_CACHE_ROOT, 'lock-files'),
+        help = 'The host-local directory where the dependency lock files written by terraform init are recorded for '
+            'artifacts that ship without one')
+    parser.add_argument('--lock-file-cache-max-entries', type = int, default = DEFAULT_LOCK_FILE_CACHE_MAX_ENTRIES,
+        help = 'The number of recorded lock files to keep. Set to 0 to disable the cache.')
+    parser.add_argument('--terraform-cli-config-file', default = DEFAULT_CLI_CONFIG_FILE,
+        help = 'The Terraform CLI configuration written by the provider mirror sync. It is used when it exists.')
+    parser.add_argument('--validation-cache-directory', default = os.path.join(DEFAULT_CACHE_ROOT, 'validations'),
+        help = 'The host-local directory where successful terraform validate results are recorded')
+    parser.add_argument('--validation-cache-max-entries', type = int, default = DEFAULT_VALIDATION_CACHE_MAX_ENTRIES,
+        help = 'The number of recorded validations to keep. Set to 0 to disable the cache.')
+    parser.add_argument('--slots-directory', default = os.path.join(os.path.expanduser('~'), '.terraform_runner', 'slots'),
+        help = 'The host-wide directory of the lock files that limit how many runs execute at once')
+    parser.add_argument('--max-concurrent-runs', type = int, default = get_cpu_count(),
+        help = 'The most runs that execute at once on the host. Default is the number of CPUs.')
+    parser.add_argument('--run-memory-mb', type = int, default = DEFAULT_RUN_MEMORY_MB,
+        help = 'The available memory in MB a run needs to start. Set to 0 to ignore memory.')
+    parser.add_argument('--run-disk-mb', type = int, default = DEFAULT_RUN_DISK_MB,
+        help = 'The free disk space in MB a run needs to start. Set to 0 to ignore disk space.')
+    parser.add_argument('--min-free-disk-mb', type = int, default = DEFAULT_MIN_FREE_DISK_MB,
+        help = 'The free disk space in MB below which the host refuses to start runs. Set to 0 to disable the check.')
+    parser.add_argument('--admission-timeout-minutes', type = float, default = DEFAULT_ADMISSION_TIMEOUT_MINUTES,
+        help = 'How long a run waits for capacity on the host before it fails')
+    parser.add_argument('--parallelism', type = int, default = 0,
+        help = 'The number of concurrent operations Terraform performs. Default is 0, which chooses it from the overrides '
+            'file, or else from the CPUs, available memory, and active runs of the host.')
+    parser.add_argument('--parallelism-overrides-file',
+        default = os.path.join(os.path.expanduser('~'), '.terraform_runner', 'parallelism.json'),
+        help = 'A JSON file of parallelism values for the artifacts and provisioned products that match its patterns')
+    parser.add_argument('--operation-memory-mb', type = int, default = DEFAULT_OPERATION_MEMORY_MB,
+        help = 'The memory in MB one concurrent Terraform operation needs when choosing the parallelism')
+    parser.add_argument('--metrics-textfile',
+        help = 'A node exporter textfile collector file to add the phase durations and counters of the run to, '
+            'for example /var/lib/node_exporter/textfile_collector/terraform_runner.prom')
+    parser.add_argument('--workspaces-root', action = 'append',
+        help = 'A directory to create workspaces in, such as a tmpfs or instance store mount. Repeat to list several in '
+            'order of preference. The first one that is writable and has room for the workspace disk quota is used, '
+            f'and {DEFAULT_WORKSPACES_ROOT} is used when none is.')
+    parser.add_argument('--workspace-disk-quota-mb', type = int, default = 0,
+        help = 'The most disk space in MB a workspace may use. The run fails when the workspaces root has less free '
+            'space, or when the workspace grows beyond it. Default is 0, which does not limit it.')
+    parser.add_argument('--retain-workspace', action = 'store_true',
+        help = 'Keep the workspace, including its .terraform directory, between runs for the provisioned product')
+    parser.add_argument('--retained-workspace-ttl-hours', type = int, default = DEFAULT_RETAINED_WORKSPACE_TTL_HOURS,
+        help = 'How long an unused retained workspace is kept before it is reaped')
+    parser.add_argument('--max-retained-workspaces', type = int, default = DEFAULT_MAX_RETAINED_WORKSPACES,
+        help = 'The number of retained workspaces on the host above which the least recently used are reaped')
+    return parser.parse_args(argv)
+
+def __set_environment_variables(args, workspace_manager):
+    os.environ[AWS_DEFAULT_REGION] = args.region
+    plugin_cache_directory = workspace_manager.get_plugin_cache_directory()
+    if plugin_cache_directory:
+        os.environ[TF_PLUGIN_CACHE_DIR] = plugin_cache_directory
+        # Runs start without a lock file for most artifacts, and without this Terraform re-downloads providers
+        # to record their checksums. The workspace lock file is discarded after each run, so nothing is lost.
+        os.environ[TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE] = 'true'
+    # Prefers the local provider mirror synced from the bootstrap bucket
+    configure_terraform_cli(args.terraform_cli_config_file)
+
+def __setup_launch_role_credentials(log, args, credentials_directory):
+    # The launch role is assumed once here. The artifact download uses these credentials and the Terraform AWS
+    # provider reads them from the same cache through the launch role profile.
+    session_name = format_session_name(args.provisioned_product_descriptor)
+    credentials = get_credentials(args.launch_role, session_name, credentials_directory)
+    log.info(f'Assumed launch role {args.launch_role} for the run. The credentials expire at {credentials[EXPIRATION_KEY]}')
+
+    os.environ[AWS_CONFIG_FILE] = write_credential_process_config(args.launch_role, session_name, credentials_directory)
+    # Makes Terraform AWS providers built on version 1 of the AWS SDK for Go read profiles from the config file
+    os.environ[AWS_SDK_LOAD_CONFIG] = 'true'
+    return credentials
+
+def __choose_workspaces_root(log, args):
+    workspaces_root = find_usable_directory(get_workspaces_roots(args.workspaces_root), args.workspace_disk_quota_mb * BYTES_PER_MB)
+    if workspaces_root is None:
+        # Setting up the workspace fails with the reason
+        return DEFAULT_WORKSPACES_ROOT
+    log.info(f'Using workspaces root {workspaces_root}')
+    return workspaces_root
+
+def __create_workspace_manager(log, args):
+    workspaces_root = __choose_workspaces_root(log, args)
+    disk_quota_bytes = args.workspace_disk_quota_mb * BYTES_PER_MB
+    if args.plugin_cache_max_size_mb <= 0:
+        return WorkspaceManager(log, args.provisioned_product_descriptor, retain_workspace = args.retain_workspace,
+            workspaces_root = workspaces_root, disk_quota_bytes = disk_quota_bytes)
+    return WorkspaceManager(log, args.provisioned_product_descriptor,
+        args.plugin_cache_directory, args.plugin_cache_max_size_mb * BYTES_PER_MB, args.retain_workspace,
+        workspaces_root, disk_quota_bytes)
+
+def __setup_workspace(workspace_manager, args):
+    workspace_manager.setup_plugin_cache_directory()
+    workspace_manager.setup_workspace_directory()
+    if workspace_manager.is_retaining_workspace():
+        workspace_manager.reap_retained_workspaces(args.retained_workspace_ttl_hours * SECONDS_PER_HOUR,
+            args.max_retained_workspaces)
+    workspace_dir = workspace_manager.get_workspace_directory()
+    os.chdir(workspace_dir)
+    return workspace_dir
+
+def __write_common_overrides(workspace_dir, args):
+    write_backend_override(workspace_dir, args.provisioned_product_descriptor, 
+        args.terraform_state_bucket, args.region)
+    write_provider_override(workspace_dir, LAUNCH_ROLE_PROFILE, args.region, args.tags)
+
+def __check_disk_pressure(log, args, workspace_manager):
+    workspaces_root = workspace_manager.get_workspaces_root()
+    free_mb = get_disk_usage(workspaces_root).free // BYTES_PER_MB
+    log.info(f'Workspaces root {workspaces_root} has {free_mb} MB of free disk space')
+    if args.min_free_disk_mb > 0 and free_mb < args.min_free_disk_mb:
+        raise RuntimeError(f'Refusing to run because {workspaces_root} has {free_mb} MB of free disk space, less than the '
+            f'minimum of {args.min_free_disk_mb} MB. Orphaned workspaces are removed by python3 -m '
+            'terraform_runner.workspace_reaper.')
+
+def __create_admission_controller(log, args, workspace_manager):
+    return AdmissionController(log, args.slots_directory, args.max_concurrent_runs,
+        args.run_memory_mb * BYTES_PER_MB, args.run_disk_mb * BYTES_PER_MB, workspace_manager.get_workspaces_root())
+
+def __create_artifact_cache(log, args):
+    if args.artifact_cache_max_size_mb <= 0:
+        return None
+    return ArtifactCache(log, args.artifact_cache_directory, args.artifact_cache_max_size_mb * BYTES_PER_MB)
+
+def __create_extracted_tree_store(log, args):
+    if args.extracted_tree_store_max_size_mb <= 0:
+        return None
+    return ExtractedTreeStore(log, args.extracted_tree_store_directory,
+        args.extracted_tree_store_max_size_mb * BYTES_PER_MB)
+
+def __create_module_cache(log, args):
+    if args.module_cache_max_size_mb <= 0:
+        return None
+    return ModuleCache(log, args.module_cache_directory, args.module_cache_max_size_mb * BYTES_PER_MB)
+
+def __create_lock_file_cache(log, args):
+    if args.lock_file_cache_max_entries <= 0:
+        return None
+    return LockFileCache(log, args.lock_file_cache_directory, args.lock_file_cache_max_entries)
+
+def __create_validation_cache(log, args):
+    if args.validation_cache_max_entries <= 0:
+        return None
+    return ValidationCache(log, args.validation_cache_directory, args.validation_cache_max_entries)
+
+def __perform_validate(log, command_manager, workspace_manager, validation_cache, metrics):
+    if not validation_cache:
+        command_manager.run_command(['terraform', 'validate', '-no-color'])
+        return
+    fingerprint = validation_cache.get_fingerprint(workspace_manager.get_workspace_directory())
+    if validation_cache.is_validated(fingerprint):
+        log.info(f'Skipping terraform validate because this configuration was validated before: {fingerprint}')
+        metrics.add_counter('validation_cache_hits')
+        return
+    metrics.add_counter('validation_cache_misses')
+    command_manager.run_command(['terraform', 'validate', '-no-color'])
+    validation_cache.record_validation(fingerprint)
+
+def __get_parallelism_flag(log, args, admission_controller):
+    parallelism = args.parallelism
+    if parallelism <= 0:
+        parallelism = choose_parallelism(log, args.parallelism_overrides_file, args.artifact_path,
+            args.provisioned_product_descriptor, admission_controller.get_active_run_count(),
+            args.operation_memory_mb * BYTES_PER_MB)
+    return f'-parallelism={parallelism}'
+
+def __perform_init(log, command_manager, workspace_manager, module_cache, lock_file_cache, metrics):
+    if not workspace_manager.needs_init():
+        log.info('Skipping terraform init because the workspace is already initialized for this configuration')
+        metrics.add_counter('init_skipped')
+        return
+    workspace_directory = workspace_manager.get_workspace_directory()
+    if module_cache:
+        module_cache.install_modules(workspace_directory)
+    if lock_file_cache:
+        lock_file_cache.inject_lock_file(workspace_directory)
+    try:
+        with workspace_manager.plugin_cache_install_lock():
+            command_manager.run_command(['terraform', 'init', '-no-color'], stream_output = True)
+    except Exception:
+        # A recorded provider version may no longer be installable
+        if lock_file_cache:
+            lock_file_cache.discard_lock_file(workspace_directory)
+        raise
+    workspace_manager.mark_initialized()
+    if module_cache:
+        module_cache.store_modules(workspace_directory)
+    if lock_file_cache:
+        lock_file_cache.record_lock_file(workspace_directory)
+
+def __log_download_throughput(log, download_statistics):
+    bytes_downloaded = download_statistics[BYTES_DOWNLOADED_KEY]
+    download_seconds = download_statistics[DOWNLOAD_SECONDS_KEY]
+    throughput = bytes_downloaded / BYTES_PER_MB / download_seconds if download_seconds > 0 else 0
+    log.info(f'Artifact download transferred {bytes_downloaded} bytes in {download_seconds:.2f} seconds ({throughput:.2f} MB/s)')
+
+def __perform_apply(log, command_manager, workspace_manager, workspace_dir, args, artifact_cache, tree_store,
+        module_cache, lock_file_cache, validation_cache, credentials, parallelism_flag, metrics):
+    max_uncompressed_size_bytes = MAX_UNCOMPRESSED_SIZE_BYTES
+    if args.workspace_disk_quota_mb > 0:
+        max_uncompressed_size_bytes = min(max_uncompressed_size_bytes, args.workspace_disk_quota_mb * BYTES_PER_MB)
+    start_time = time.monotonic()
+    download_statistics = download_artifact(args.launch_role, args.artifact_path,
+        workspace_manager.get_artifact_directory(), artifact_cache, args.artifact_download_mode,
+        args.artifact_download_part_size_mb * BYTES_PER_MB, args.artifact_download_workers, credentials,
+        max_uncompressed_size_bytes, tree_store)
+    # Extraction is everything download_artifact does besides the transfer itself
+    metrics.add_phase_seconds('artifact_download', download_statistics[DOWNLOAD_SECONDS_KEY])
+    metrics.add_phase_seconds('artifact_extract', time.monotonic() - start_time - download_statistics[DOWNLOAD_SECONDS_KEY])
+    metrics.add_counter('bytes_downloaded', download_statistics[BYTES_DOWNLOADED_KEY])
+    __log_download_throughput(log, download_statistics)
+    with metrics.phase('workspace_sync'):
+        workspace_manager.sync_artifact_directory()
+        write_variable_override(workspace_dir, args.artifact_parameters)
+        workspace_manager.check_disk_quota()
+    with metrics.phase('init'):
+        __perform_init(log, command_manager, workspace_manager, module_cache, lock_file_cache, metrics)
+        workspace_manager.check_disk_quota()
+    with metrics.phase('validate'):
+        __perform_validate(log, command_manager, workspace_manager, validation_cache, metrics)
+    __perform_terraform_apply(log, command_manager, args, parallelism_flag, metrics)
+
+def __is_first_provision(log, args):
+    if args.operation != PROVISION_PRODUCT_OPERATION:
+        return False
+    # The check only saves time, so when the state cannot be checked the apply refreshes as usual
+    try:
+        return not state_exists(args.terraform_state_bucket, args.provisioned_product_descriptor, args.region)
+    except Exception as e:
+        log.info(f'Running terraform apply with refresh because the state could not be checked: {e}')
+        return False
+
+def __perform_terraform_apply(log, command_manager, args, parallelism_flag, metrics):
+    if args.operation != UPDATE_PROVISIONED_PRODUCT_OPERATION:
+        apply_command = ['terraform', 'apply', '-auto-approve', '-input=false', '-compact-warnings', '-no-color',
+            parallelism_flag]
+        with metrics.phase('state_check'):
+            is_first_provision = __is_first_provision(log, args)
+        if is_first_provision:
+            # Nothing in a missing state needs refreshing
+            log.info(f'Running terraform apply without refresh because the state s3://{args.terraform_state_bucket}/'
+                f'{args.provisioned_product_descriptor} does not exist yet')
+            apply_command.append('-refresh=false')
+            metrics.add_counter('refresh_skipped')
+        start_time = time.monotonic()
+        with metrics.phase('apply'):
+            command_manager.run_command(apply_command, stream_output = True)
+        refresh_description = 'without' if is_first_provision else 'with'
+        log.info(f'terraform apply {refresh_description} refresh took {time.monotonic() - start_time:.1f} seconds')
+        return
+
+    # Updates often resubmit an unchanged configuration, so they plan first and apply the saved plan only when it
+    # has changes, without planning a second time
+    try:
+        with metrics.phase('plan'):
+            return_code = command_manager.run_command(['terraform', 'plan', '-detailed-exitcode', '-input=false',
+                '-compact-warnings', '-no-color', parallelism_flag, f'-out={PLAN_FILE_NAME}'], stream_output = True,
+                allowed_return_codes = (PLAN_NO_CHANGES_RETURN_CODE, PLAN_CHANGES_PRESENT_RETURN_CODE))
+        if return_code == PLAN_NO_CHANGES_RETURN_CODE:
+            log.info('Skipping terraform apply because the plan has no changes')
+            metrics.add_counter('no_change_updates')
+            return
+        with metrics.phase('apply'):
+            command_manager.run_command(['terraform', 'apply', '-input=false', '-compact-warnings', '-no-color',
+                parallelism_flag, PLAN_FILE_NAME], stream_output = True)
+    finally:
+        if os.path.exists(PLAN_FILE_NAME):
+            os.remove(PLAN_FILE_NAME)
+
+def __has_no_managed_resources(log, args):
+    # Terminating a failed first provision, or a product whose resources are gone, needs no Terraform work at all.
+    # The check only saves time, so when the state cannot be read the destroy runs as usual.
+    try:
+        state = read_state(args.terraform_state_bucket, args.provisioned_product_descriptor, args.region)
+    except Exception as e:
+        log.info(f'Running terraform destroy because the state could not be checked for resources: {e}')
+        return False
+    return count_managed_resources(state) == 0
+
+def __perform_destroy(log, command_manager, workspace_manager, args, module_cache, validation_cache, parallelism_flag,
+        metrics):
+    with metrics.phase('state_check'):
+        has_no_managed_resources = __has_no_managed_resources(log, args)
+    if has_no_managed_resources:
+        log.info(f'Skipping terraform init, validate, and destroy because the state s3://{args.terraform_state_bucket}/'
+            f'{args.provisioned_product_descriptor} has no managed resources')
+        metrics.add_counter('empty_state_destroys')
+        return
+
+    # Destroy runs without the artifact, so a retained workspace is synced to an empty artifact
+    with metrics.phase('workspace_sync'):
+        workspace_manager.sync_artifact_directory()
+    # The lock file cache is keyed by the artifact's configuration, which destroy runs do not have. Destroy installs
+    # the newest allowed provider versions instead, which can read state written by any earlier apply.
+    with metrics.phase('init'):
+        __perform_init(log, command_manager, workspace_manager, module_cache, None, metrics)
+        workspace_manager.check_disk_quota()
+    with metrics.phase('validate'):
+        __perform_validate(log, command_manager, workspace_manager, validation_cache, metrics)
+    with metrics.phase('destroy'):
+        command_manager.run_command(['terraform', 'destroy', '-auto-approve', '-no-color', parallelism_flag],
+            stream_output = True)
+
+def run(argv: list):
+    """Performs the action described by the command line arguments.
+    Returns 0 on success, or the error message to report on stderr with a failed exit status.
+    """
+    args = __parse_arguments(argv)
+    log = CustomLogger(args.provisioned_product_descriptor)
+    log.info(f'Command args: {args}')
+
+    command_manager = CommandManager(log)
+    workspace_manager = __create_workspace_manager(log, args)
+    artifact_cache = __create_artifact_cache(log, args)
+    tree_store = __create_extracted_tree_store(log, args)
+    module_cache = __create_module_cache(log, args)
+    lock_file_cache = __create_lock_file_cache(log, args)
+    validation_cache = __create_validation_cache(log, args)
+    admission_controller = __create_admission_controller(log, args, workspace_manager)
+    metrics = RunMetrics(log, args.action, args.provisioned_product_descriptor)
+    credentials_directory = tempfile.mkdtemp(prefix = CREDENTIALS_DIRECTORY_PREFIX)
+
+    exit_code = 0
+    try:
+        __check_disk_pressure(log, args, workspace_manager)
+        with metrics.phase('admission'):
+            admission_controller.acquire_slot(args.admission_timeout_minutes * SECONDS_PER_MINUTE)
+        __set_environment_variables(args, workspace_manager)
+        with metrics.phase('credentials'):
+            credentials = __setup_launch_role_credentials(log, args, credentials_directory)
+
+        with metrics.phase('workspace_setup'):
+            workspace_dir = __setup_workspace(workspace_manager, args)
+            __write_common_overrides(workspace_dir, args)
+            parallelism_flag = __get_parallelism_flag(log, args, admission_controller)
+
+        # Perform the action
+        if args.action == APPLY_ACTION:
+            __perform_apply(log, command_manager, workspace_manager, workspace_dir, args, artifact_cache, tree_store,
+                module_cache, lock_file_cache, validation_cache, credentials, parallelism_flag, metrics)
+        elif args.action == DESTROY_ACTION:
+            __perform_destroy(log, command_manager, workspace_manager, args, module_cache, validation_cache,
+                parallelism_flag, metrics)
+
+    except Exception as exception:
+        message = str(exception)
+        # Log every exception with traceback in a single place.
+        log.error(f'{message} {traceback.format_exc()}' )
+        # Then exit with error status, only writing the exception message to stderr
+        exit_code = message
+
+    finally:
+        shutil.rmtree(credentials_directory, ignore_errors = True)
+        if artifact_cache:
+            artifact_cache.close()
+            artifact_cache.log_statistics()
+            metrics.add_counter('artifact_cache_hits', artifact_cache.get_hit_count())
+            metrics.add_counter('artifact_cache_misses', artifact_cache.get_miss_count())
+        if module_cache:
+            metrics.add_counter('module_cache_hits', module_cache.get_hit_count())
+            metrics.add_counter('module_cache_misses', module_cache.get_miss_count())
+        if lock_file_cache:
+            metrics.add_counter('lock_file_cache_hits', lock_file_cache.get_hit_count())
+            metrics.add_counter('lock_file_cache_misses', lock_file_cache.get_miss_count())
+        with metrics.phase('cleanup'):
+            # A run that failed before taking the workspace lock leaves the workspace to the run holding it
+            if not workspace_manager.holds_workspace_lock():
+                log.info(f'Leaving workspace directory {workspace_manager.get_workspace_directory()} in place because '
+                    'this run does not hold its lock')
+            elif workspace_manager.is_retaining_workspace() and exit_code == 0 and args.action == APPLY_ACTION:
+                log.info(f'Retaining workspace directory {workspace_manager.get_workspace_directory()}')
+            else:
+                log.info(f'Removing workspace directory {workspace_manager.get_workspace_directory()}')
+                workspace_manager.remove_workspace_directory()
+            workspace_manager.release_workspace_directory()
+        # Trees stay referenced until the workspace linked to them is gone
+        if tree_store:
+            tree_store.release()
+            metrics.add_counter('extracted_tree_store_hits', tree_store.get_hit_count())
+            metrics.add_counter('extracted_tree_store_misses', tree_store.get_miss_count())
+        admission_controller.release_slot()
+        metrics.log_summary(exit_code)
+        if args.metrics_textfile:
+            metrics.write_textfile(args.metrics_textfile, exit_code)
+
+    return exit_code
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Constants
+READ_CHUNK_SIZE = 1024 * 1024
+
+# S3 response keys
+BODY_KEY = 'Body'
+CONTENT_LENGTH_KEY = 'ContentLength'
+ETAG_KEY = 'ETag'
+VERSION_ID_KEY = 'VersionId'
+
+# GetObject parameter keys
+IF_MATCH_KEY = 'IfMatch'
+
+
+def download_file_in_parts(s3, bucket: str, key: str, destination: str, part_size: int, max_workers: int,
+                           extra_args: dict = None) -> int:
+    """Downloads an S3 object to a file with concurrent ranged GetObject requests and returns its size in bytes.
+
+    Each worker streams its part into place in the destination file, so memory use is bounded by
+    max_workers * READ_CHUNK_SIZE regardless of the object or part size.
+
+    Parameters:
+
+    s3: S3.Client
+        The client used for the requests. boto3 clients are safe to share between threads.
+    bucket: str
+        The bucket of the object
+    key: str
+        The key of the object
+    destination: str
+        The file to write. It is created or truncated.
+    part_size: int
+        The size of each ranged request in bytes
+    max_workers: int
+        The number of concurrent requests
+    extra_args: dict
+        Additional GetObject parameters applied to every request, such as VersionId or IfMatch. When neither is given,
+        the requests are pinned to the object version HeadObject returned, so an overwrite during the download fails
+        it instead of mixing parts of two objects.
+    """
+    extra_args = extra_args or {}
+    head_response = s3.head_object(Bucket=bucket, Key=key, **extra_args)
+    size = head_response[CONTENT_LENGTH_KEY]
+    if VERSION_ID_KEY not in extra_args and IF_MATCH_KEY not in extra_args:
+        # Unversioned buckets return no version ID, or the version ID null
+        if head_response.get(VERSION_ID_KEY, 'null') != 'null':
+            extra_args = dict(extra_args, **{VERSION_ID_KEY: head_response[VERSION_ID_KEY]})
+        else:
+            extra_args = dict(extra_args, **{IF_MATCH_KEY: head_response[ETAG_KEY]})
+
+    file_descriptor = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(file_descriptor, size)
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(__download_part, s3, bucket, key, file_descriptor, start, end, extra_args)
+                       for start, end in ranges]
+            # Surfaces the first failed part
+            for future in futures:
+                future.result()
+    finally:
+        os.close(file_descriptor)
+    return size
+
+
+def __download_part(s3, bucket, key, file_descriptor, start, end, extra_args):
+    body = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end}', **extra_args)[BODY_KEY]
+    offset = start
+    try:
+        for chunk in iter(lambda: body.read(READ_CHUNK_SIZE), b''):
+            os.pwrite(file_descriptor, chunk, offset)
+            offset += len(chunk)
+    finally:
+        body.close()
+
+    if offset != end + 1:
+        raise RuntimeError(f'Expected bytes {start}-{end} of s3://{bucket}/{key} but received {offset - start} bytes')
@@ -0,0 +1,66 @@
+import json
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Constants
+MANAGED_RESOURCE_MODE = 'managed'
+# S3 reports a missing key as NoSuchKey, or as 404 when the request carries no body
+MISSING_OBJECT_ERROR_CODES = ('NoSuchKey', '404')
+
+# S3 response keys
+BODY_KEY = 'Body'
+ERROR_KEY = 'Error'
+CODE_KEY = 'Code'
+
+# Terraform state keys
+RESOURCES_KEY = 'resources'
+MODE_KEY = 'mode'
+INSTANCES_KEY = 'instances'
+
+
+def read_state(state_bucket: str, state_key: str, region: str):
+    """Returns the Terraform state stored by the S3 backend as a dict, or None when no state object exists.
+    The state is read with the credentials of the instance, which are the ones the backend uses.
+
+    Parameters:
+
+    state_bucket: str
+        The bucket of the S3 backend
+    state_key: str
+        The key of the state object, which is the provisioned product descriptor
+    region: str
+        The region of the bucket
+    """
+    s3 = boto3.client('s3', region_name=region)
+    try:
+        state_object = s3.get_object(Bucket=state_bucket, Key=state_key)
+    except ClientError as e:
+        if e.response.get(ERROR_KEY, {}).get(CODE_KEY) in MISSING_OBJECT_ERROR_CODES:
+            return None
+        raise RuntimeError(f'Could not read Terraform state s3://{state_bucket}/{state_key}: {e}')
+
+    try:
+        return json.loads(state_object[BODY_KEY].read())
+    except ValueError as e:
+        raise RuntimeError(f'Invalid Terraform state s3://{state_bucket}/{state_key}: {e}')
+
+
+def state_exists(state_bucket: str, state_key: str, region: str) -> bool:
+    """Returns True when the S3 backend has a state object for the key, without downloading it"""
+    s3 = boto3.client('s3', region_name=region)
+    try:
+        s3.head_object(Bucket=state_bucket, Key=state_key)
+    except ClientError as e:
+        if e.response.get(ERROR_KEY, {}).get(CODE_KEY) in MISSING_OBJECT_ERROR_CODES:
+            return False
+        raise RuntimeError(f'Could not check for Terraform state s3://{state_bucket}/{state_key}: {e}')
+    return True
+
+
+def count_managed_resources(state: dict) -> int:
+    """Returns the number of resource instances Terraform manages in the state. Data sources are not counted."""
+    if not state:
+        return 0
+    return sum(len(resource.get(INSTANCES_KEY, [])) for resource in state.get(RESOURCES_KEY, [])
+               if resource.get(MODE_KEY) == MANAGED_RESOURCE_MODE)
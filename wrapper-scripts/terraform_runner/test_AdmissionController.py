@@ -0,0 +1,83 @@
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from terraform_runner.AdmissionController import AdmissionController
+
+NO_LIMIT = 0
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.slots_directory = self.__temporary_directory.name
+        self.controllers = []
+
+    def tearDown(self):
+        for controller in self.controllers:
+            controller.release_slot()
+        self.__temporary_directory.cleanup()
+
+    def __create_controller(self, max_slots, memory_per_run_bytes=NO_LIMIT, disk_per_run_bytes=NO_LIMIT):
+        controller = AdmissionController(Mock(), self.slots_directory, max_slots, memory_per_run_bytes,
+                                         disk_per_run_bytes, f'{self.slots_directory}/missing/workspaces')
+        self.controllers.append(controller)
+        return controller
+
+    def test_acquire_slot_up_to_max_slots(self):
+        # arrange
+        first_controller = self.__create_controller(2)
+        second_controller = self.__create_controller(2)
+        third_controller = self.__create_controller(2)
+
+        # act
+        first_controller.acquire_slot(0)
+        second_controller.acquire_slot(0)
+        with self.assertRaises(RuntimeError) as context:
+            third_controller.acquire_slot(0)
+
+        # assert
+        self.assertIn('2 runs are active', str(context.exception))
+        self.assertEqual(2, first_controller.get_active_run_count())
+
+    def test_release_slot_admits_waiting_run(self):
+        # arrange
+        first_controller = self.__create_controller(1)
+        second_controller = self.__create_controller(1)
+        first_controller.acquire_slot(0)
+
+        # act
+        first_controller.release_slot()
+        second_controller.acquire_slot(0)
+
+        # assert
+        self.assertEqual(1, second_controller.get_active_run_count())
+
+    def test_acquire_slot_limited_by_memory_admits_one_run(self):
+        # arrange
+        first_controller = self.__create_controller(4, memory_per_run_bytes=1 << 60)
+        second_controller = self.__create_controller(4, memory_per_run_bytes=1 << 60)
+
+        # act
+        first_controller.acquire_slot(0)
+
+        # assert
+        with self.assertRaises(RuntimeError):
+            second_controller.acquire_slot(0)
+
+    def test_acquire_slot_limited_by_disk_admits_one_run(self):
+        # arrange
+        first_controller = self.__create_controller(4, disk_per_run_bytes=1 << 60)
+        second_controller = self.__create_controller(4, disk_per_run_bytes=1 << 60)
+
+        # act
+        first_controller.acquire_slot(0)
+
+        # assert
+        with self.assertRaises(RuntimeError):
+            second_controller.acquire_slot(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from terraform_runner.ArtifactCache import ArtifactCache
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.cache_directory = self.__temporary_directory.name
+        self.mock_logger = Mock()
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __create_mock_s3(self, etag='"etag-1"', version_id=None, content=b'artifact-content'):
+        mock_s3 = Mock()
+        head_response = {'ETag': etag, 'ContentLength': len(content)}
+        if version_id:
+            head_response['VersionId'] = version_id
+        mock_s3.head_object.return_value = head_response
+
+        def download_file(bucket, key, file_name, ExtraArgs):
+            with open(file_name, 'wb') as file_handle:
+                file_handle.write(content)
+        mock_s3.download_file.side_effect = download_file
+        return mock_s3
+
+    def __create_stubbed_s3(self):
+        # A real client validates the arguments of download_file, which a Mock accepts whatever they are
+        s3 = boto3.client('s3', region_name='us-east-1', aws_access_key_id='key', aws_secret_access_key='secret')
+        return s3, Stubber(s3)
+
+    def __add_head_response(self, stubber, etag, version_id=None, content=b'artifact-content'):
+        head_response = {'ETag': etag, 'ContentLength': len(content)}
+        expected_parameters = {'Bucket': 'bucket', 'Key': 'key'}
+        if version_id:
+            head_response['VersionId'] = version_id
+        stubber.add_response('head_object', head_response, expected_parameters)
+
+    def __add_download_responses(self, stubber, etag, version_id=None, content=b'artifact-content'):
+        # S3.Client.download_file reads the size of the object first, then the object
+        expected_parameters = {'Bucket': 'bucket', 'Key': 'key'}
+        if version_id:
+            expected_parameters['VersionId'] = version_id
+        stubber.add_response('head_object', {'ETag': etag, 'ContentLength': len(content)}, expected_parameters)
+        stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(content), len(content)),
+                                            'ETag': etag, 'ContentLength': len(content)},
+                             expected_parameters)
+
+    def test_get_artifact_miss_then_hit(self):
+        # arrange
+        s3, stubber = self.__create_stubbed_s3()
+        self.__add_head_response(stubber, '"etag-1"')
+        self.__add_download_responses(stubber, '"etag-1"')
+        self.__add_head_response(stubber, '"etag-1"')
+        self.__add_head_response(stubber, '"etag-1"')
+        artifact_cache = ArtifactCache(self.mock_logger, self.cache_directory, 1024)
+
+        # act
+        with stubber:
+            first_path = artifact_cache.get_artifact(s3, 'bucket', 'key')
+            artifact_cache.close()
+            second_path = artifact_cache.get_artifact(s3, 'bucket', 'key')
+            artifact_cache.close()
+
+        # assert
+        stubber.assert_no_pending_responses()
+        self.assertEqual(first_path, second_path)
+        self.assertEqual(artifact_cache.get_miss_count(), 1)
+        self.assertEqual(artifact_cache.get_hit_count(), 1)
+        with open(first_path, 'rb') as file_handle:
+            self.assertEqual(file_handle.read(), b'artifact-content')
+
+    def test_get_artifact_changed_during_download_raises_error(self):
+        # arrange
+        s3, stubber = self.__create_stubbed_s3()
+        self.__add_head_response(stubber, '"etag-1"')
+        self.__add_download_responses(stubber, '"etag-1"')
+        self.__add_head_response(stubber, '"etag-2"')
+        artifact_cache = ArtifactCache(self.mock_logger, self.cache_directory, 1024)
+
+        # act
+        with stubber, self.assertRaises(RuntimeError):
+            artifact_cache.get_artifact(s3, 'bucket', 'key')
+        artifact_cache.close()
+
+        # assert
+        stubber.assert_no_pending_responses()
+        self.assertEqual(artifact_cache.get_bytes_downloaded(), 0)
+        entries_directory = os.path.join(self.cache_directory, 'entries')
+        self.assertEqual([file_name for _, _, file_names in os.walk(entries_directory) for file_name in file_names], [])
+
+    def test_get_artifact_stale_etag_downloads_again(self):
+        # arrange
+        artifact_cache = ArtifactCache(self.mock_logger, self.cache_directory, 1024)
+        artifact_cache.get_artifact(self.__create_mock_s3(etag='"etag-1"'), 'bucket', 'key')
+        artifact_cache.close()
+        mock_s3 = self.__create_mock_s3(etag='"etag-2"', content=b'new-content')
+
+        # act
+        path = artifact_cache.get_artifact(mock_s3, 'bucket', 'key')
+        artifact_cache.close()
+
+        # assert
+        mock_s3.download_file.assert_called_once()
+        self.assertEqual(artifact_cache.get_miss_count(), 2)
+        with open(path, 'rb') as file_handle:
+            self.assertEqual(file_handle.read(), b'new-content')
+
+    def test_get_artifact_pins_version_id(self):
+        # arrange
+        s3, stubber = self.__create_stubbed_s3()
+        self.__add_head_response(stubber, '"etag-1"', version_id='version-1')
+        self.__add_download_responses(stubber, '"etag-1"', version_id='version-1')
+        artifact_cache = ArtifactCache(self.mock_logger, self.cache_directory, 1024)
+
+        # act
+        with stubber:
+            artifact_cache.get_artifact(s3, 'bucket', 'key')
+        artifact_cache.close()
+
+        # assert
+        stubber.assert_no_pending_responses()
+        self.assertEqual(artifact_cache.get_miss_count(), 1)
+
+    def test_get_artifact_evicts_least_recently_used_unlocked_entries(self):
+        # arrange
+        content = b'x' * 100
+        first_cache = ArtifactCache(self.mock_logger, self.cache_directory, 150)
+        first_path = first_cache.get_artifact(self.__create_mock_s3(content=content), 'bucket', 'first')
+        first_cache.close()
+        os.utime(os.path.join(os.path.dirname(first_path), 'metadata.json'), (0, 0))
+
+        # act
+        second_cache = ArtifactCache(self.mock_logger, self.cache_directory, 150)
+        second_path = second_cache.get_artifact(self.__create_mock_s3(content=content), 'bucket', 'second')
+
+        # assert
+        self.assertFalse(os.path.exists(first_path))
+        self.assertTrue(os.path.exists(second_path))
+        second_cache.close()
+
+    def test_get_artifact_does_not_evict_locked_entries(self):
+        # arrange
+        content = b'x' * 100
+        first_cache = ArtifactCache(self.mock_logger, self.cache_directory, 150)
+        first_path = first_cache.get_artifact(self.__create_mock_s3(content=content), 'bucket', 'first')
+        os.utime(os.path.join(os.path.dirname(first_path), 'metadata.json'), (0, 0))
+
+        # act
+        second_cache = ArtifactCache(self.mock_logger, self.cache_directory, 150)
+        second_cache.get_artifact(self.__create_mock_s3(content=content), 'bucket', 'second')
+
+        # assert
+        self.assertTrue(os.path.exists(first_path))
+        first_cache.close()
+        second_cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
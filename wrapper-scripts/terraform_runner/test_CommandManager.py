@@ -1,10 +1,46 @@
+import subprocess
+import sys
+import threading
+import tracemalloc
 import unittest
 from unittest.mock import Mock, patch
 
-from terraform_runner.CommandManager import CommandManager
+from terraform_runner.CommandManager import CommandManager, STDERR_TAIL_LINES
 
 SUCCESS_RETURN_CODE = 0
 ERROR_RETURN_CODE = 1
+# Writes the given number of MB to stdout and stderr in 100 character lines, then exits with the given code
+NOISY_COMMAND_SCRIPT = '''
+import sys
+line = 'x' * 99 + '\\n'
+for index in range(int(sys.argv[1]) * 1024 * 1024 // 100):
+    sys.stdout.write(line)
+    sys.stderr.write(f'error line {index}\\n')
+sys.exit(int(sys.argv[2]))
+'''
+
+
+class CountingLogger:
+    """Counts log entries without keeping them, unlike a Mock, which records every call"""
+
+    def __init__(self):
+        self.info_count = 0
+
+    def info(self, message):
+        self.info_count += 1
+
+    def error(self, message):
+        pass
+
+
+class InterruptedLogger(CountingLogger):
+    """Raises in the main thread on the first line of output, as a signal handler that stops the run would"""
+
+    def info(self, message):
+        super().info(message)
+        if self.info_count > 1 and threading.current_thread() is threading.main_thread():
+            self.info = super().info
+            raise KeyboardInterrupt()
 
 
 class TestCommandManager(unittest.TestCase):
@@ -71,6 +107,100 @@ class TestCommandManager(unittest.TestCase):
         self.assertEqual(context.expected, RuntimeError)
         self.assertTrue(str(context.exception).startswith('standard error'))
 
+    @patch('terraform_runner.CommandManager.CustomLogger')
+    @patch('terraform_runner.CommandManager.subprocess')
+    def test_run_command_with_allowed_return_code(self, mock_subprocess, mock_logger):
+        # arrange
+        command_manager = CommandManager(mock_logger)
+        changes_result = Mock()
+        changes_result.returncode = 2
+        mock_subprocess.run.return_value = changes_result
+
+        # act
+        return_code = command_manager.run_command(['terraform', 'plan', '-detailed-exitcode'],
+                                                  allowed_return_codes=(SUCCESS_RETURN_CODE, 2))
+
+        # assert
+        self.assertEqual(2, return_code)
+
+    def test_run_command_stream_output_with_allowed_return_code(self):
+        # arrange
+        command_manager = CommandManager(CountingLogger())
+
+        # act
+        return_code = command_manager.run_command([sys.executable, '-c', NOISY_COMMAND_SCRIPT, '0', '2'],
+                                                  stream_output=True, allowed_return_codes=(SUCCESS_RETURN_CODE, 2))
+
+        # assert
+        self.assertEqual(2, return_code)
+
+    def test_run_command_stream_output_memory_stays_flat(self):
+        # arrange
+        log = CountingLogger()
+        command_manager = CommandManager(log)
+        output_size_mb = 16
+
+        # act
+        tracemalloc.start()
+        try:
+            command_manager.run_command([sys.executable, '-c', NOISY_COMMAND_SCRIPT, str(output_size_mb), '0'],
+                                        stream_output=True)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # assert
+        lines_per_stream = output_size_mb * 1024 * 1024 // 100
+        self.assertEqual(2 * lines_per_stream + 1, log.info_count)
+        self.assertLess(peak_bytes, 2 * 1024 * 1024)
+
+    def test_run_command_stream_output_error_keeps_stderr_tail(self):
+        # arrange
+        command_manager = CommandManager(CountingLogger())
+
+        # act
+        with self.assertRaises(RuntimeError) as context:
+            command_manager.run_command([sys.executable, '-c', NOISY_COMMAND_SCRIPT, '1', str(ERROR_RETURN_CODE)],
+                                        stream_output=True)
+
+        # assert
+        stderr_lines = str(context.exception).splitlines()
+        self.assertEqual(STDERR_TAIL_LINES, len(stderr_lines))
+        last_index = 1024 * 1024 // 100 - 1
+        self.assertEqual(f'error line {last_index}', stderr_lines[-1])
+        self.assertEqual(f'error line {last_index - STDERR_TAIL_LINES + 1}', stderr_lines[0])
+
+    def test_run_command_stream_output_interrupted_waits_for_command(self):
+        # arrange
+        command_manager = CommandManager(InterruptedLogger())
+        processes = []
+        popen = subprocess.Popen
+
+        def start_process(*args, **kwargs):
+            processes.append(popen(*args, **kwargs))
+            return processes[-1]
+
+        # act
+        with patch('terraform_runner.CommandManager.subprocess.Popen', side_effect=start_process):
+            with self.assertRaises(KeyboardInterrupt):
+                command_manager.run_command([sys.executable, '-c', NOISY_COMMAND_SCRIPT, '1', '3'],
+                                            stream_output=True)
+
+        # assert
+        # The command wrote more than a pipe holds after the interruption and still ran to its end
+        self.assertEqual(3, processes[0].returncode)
+
+    @patch('terraform_runner.CommandManager.CustomLogger')
+    @patch('terraform_runner.CommandManager.subprocess.Popen')
+    def test_run_command_stream_output_exception_raised(self, mock_popen, mock_logger):
+        # arrange
+        command_manager = CommandManager(mock_logger)
+        mock_popen.side_effect = Exception('Something went wrong')
+
+        # act and assert
+        with self.assertRaises(RuntimeError):
+            command_manager.run_command(['foo', 'bar'], stream_output=True)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,158 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from terraform_runner.ExtractedTreeStore import ExtractedTreeStore
+
+
+class TestExtractedTreeStore(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.store_directory = os.path.join(self.__temporary_directory.name, 'store')
+        self.mock_logger = Mock()
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __create_artifact(self, name, content=b'artifact-content'):
+        artifact_file = os.path.join(self.__temporary_directory.name, name)
+        with open(artifact_file, 'wb') as file_handle:
+            file_handle.write(content)
+        return artifact_file
+
+    def __create_workspace(self, name):
+        workspace_directory = os.path.join(self.__temporary_directory.name, name)
+        os.makedirs(workspace_directory)
+        return workspace_directory
+
+    def __create_extract_tree(self, file_size=10):
+        def extract_tree(directory):
+            os.makedirs(os.path.join(directory, 'modules'))
+            with open(os.path.join(directory, 'main.tf'), 'wb') as file_handle:
+                file_handle.write(b'x' * file_size)
+            with open(os.path.join(directory, 'modules', 'module.tf'), 'w') as file_handle:
+                file_handle.write('module')
+            with open(os.path.join(directory, 'backend_override.tf.json'), 'w') as file_handle:
+                file_handle.write('backend')
+            os.symlink('main.tf', os.path.join(directory, 'link.tf'))
+            return True
+        return Mock(side_effect=extract_tree)
+
+    def test_materialize_miss_then_hit_links_files(self):
+        # arrange
+        artifact_file = self.__create_artifact('artifact')
+        extract_tree = self.__create_extract_tree()
+        first_workspace = self.__create_workspace('first')
+        second_workspace = self.__create_workspace('second')
+        tree_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 1024)
+
+        # act
+        first_result = tree_store.materialize(artifact_file, first_workspace, extract_tree)
+        second_result = tree_store.materialize(artifact_file, second_workspace, extract_tree)
+        tree_store.release()
+
+        # assert
+        self.assertTrue(first_result)
+        self.assertTrue(second_result)
+        extract_tree.assert_called_once()
+        self.assertEqual(tree_store.get_miss_count(), 1)
+        self.assertEqual(tree_store.get_hit_count(), 1)
+        self.assertTrue(os.path.samefile(os.path.join(first_workspace, 'modules', 'module.tf'),
+                                         os.path.join(second_workspace, 'modules', 'module.tf')))
+        self.assertEqual(os.stat(os.path.join(second_workspace, 'main.tf')).st_mode & stat.S_IWUSR, 0)
+        self.assertEqual(os.readlink(os.path.join(second_workspace, 'link.tf')), 'main.tf')
+
+    def test_materialize_copies_generated_files(self):
+        # arrange
+        artifact_file = self.__create_artifact('artifact')
+        workspace_directory = self.__create_workspace('workspace')
+        tree_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 1024)
+
+        # act
+        tree_store.materialize(artifact_file, workspace_directory, self.__create_extract_tree())
+        with open(os.path.join(workspace_directory, 'backend_override.tf.json'), 'w') as file_handle:
+            file_handle.write('generated')
+        tree_store.materialize(artifact_file, self.__create_workspace('other'), self.__create_extract_tree())
+        tree_store.release()
+
+        # assert
+        other_file = os.path.join(self.__temporary_directory.name, 'other', 'backend_override.tf.json')
+        with open(other_file, 'r') as file_handle:
+            self.assertEqual(file_handle.read(), 'backend')
+
+    def test_materialize_keeps_digest_of_artifact_outside_destination(self):
+        # arrange
+        artifact_file = self.__create_artifact('artifact')
+        tree_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 1024)
+
+        # act
+        with patch('terraform_runner.ExtractedTreeStore.hashlib') as mock_hashlib:
+            mock_hashlib.sha256.return_value.hexdigest.return_value = 'digest'
+            tree_store.materialize(artifact_file, self.__create_workspace('first'), self.__create_extract_tree())
+            tree_store.materialize(artifact_file, self.__create_workspace('second'), self.__create_extract_tree())
+        tree_store.release()
+
+        # assert
+        mock_hashlib.sha256.assert_called_once()
+        self.assertTrue(os.path.isfile(f'{artifact_file}.sha256'))
+
+    def test_materialize_stores_nothing_when_extraction_is_refused(self):
+        # arrange
+        artifact_file = self.__create_artifact('artifact')
+        workspace_directory = self.__create_workspace('workspace')
+        tree_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 1024)
+
+        # act
+        result = tree_store.materialize(artifact_file, workspace_directory, Mock(return_value=False))
+        tree_store.release()
+
+        # assert
+        self.assertFalse(result)
+        self.assertEqual(os.listdir(workspace_directory), [])
+        self.assertEqual(os.listdir(os.path.join(self.store_directory, 'trees')), [])
+
+    @patch('terraform_runner.ExtractedTreeStore.start_trash_reaper')
+    def test_materialize_evicts_least_recently_used_unreferenced_trees(self, mock_start_trash_reaper):
+        # arrange
+        first_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 150)
+        first_store.materialize(self.__create_artifact('first', b'first'), self.__create_workspace('first-workspace'),
+                                self.__create_extract_tree(100))
+        first_store.release()
+        second_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 150)
+
+        # act
+        second_store.materialize(self.__create_artifact('second', b'second'),
+                                 self.__create_workspace('second-workspace'), self.__create_extract_tree(100))
+        second_store.release()
+
+        # assert
+        self.assertEqual(len(os.listdir(os.path.join(self.store_directory, 'trees'))), 1)
+        mock_start_trash_reaper.assert_called_once_with(os.path.join(self.store_directory, '.trash'))
+        # Files linked before eviction keep their content
+        with open(os.path.join(self.__temporary_directory.name, 'first-workspace', 'main.tf'), 'rb') as file_handle:
+            self.assertEqual(file_handle.read(), b'x' * 100)
+
+    @patch('terraform_runner.ExtractedTreeStore.start_trash_reaper')
+    def test_materialize_does_not_evict_referenced_trees(self, mock_start_trash_reaper):
+        # arrange
+        first_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 150)
+        first_store.materialize(self.__create_artifact('first', b'first'), self.__create_workspace('first-workspace'),
+                                self.__create_extract_tree(100))
+        second_store = ExtractedTreeStore(self.mock_logger, self.store_directory, 150)
+
+        # act
+        second_store.materialize(self.__create_artifact('second', b'second'),
+                                 self.__create_workspace('second-workspace'), self.__create_extract_tree(100))
+
+        # assert
+        self.assertEqual(len(os.listdir(os.path.join(self.store_directory, 'trees'))), 2)
+        mock_start_trash_reaper.assert_not_called()
+        first_store.release()
+        second_store.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from terraform_runner.LockFileCache import LockFileCache
+
+
+class TestLockFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.cache_directory = os.path.join(self.__temporary_directory.name, 'cache')
+        self.mock_logger = Mock()
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __create_workspace(self, name, configuration='provider "aws" {}'):
+        workspace_directory = os.path.join(self.__temporary_directory.name, name)
+        os.makedirs(workspace_directory)
+        self.__write_file(os.path.join(workspace_directory, 'main.tf'), configuration)
+        # Differs for every provisioned product and does not affect the providers
+        self.__write_file(os.path.join(workspace_directory, 'backend_override.tf.json'), name)
+        return workspace_directory
+
+    def __write_file(self, path, content):
+        with open(path, 'w') as file_handle:
+            file_handle.write(content)
+
+    def __read_file(self, path):
+        with open(path, 'r') as file_handle:
+            return file_handle.read()
+
+    def __init_workspace(self, lock_file_cache, workspace_directory, lock_content='lock'):
+        lock_file_cache.inject_lock_file(workspace_directory)
+        # terraform init writes the lock file when there is none
+        lock_file = os.path.join(workspace_directory, '.terraform.lock.hcl')
+        if not os.path.exists(lock_file):
+            self.__write_file(lock_file, lock_content)
+        lock_file_cache.record_lock_file(workspace_directory)
+
+    def test_inject_lock_file_after_record_copies_lock_file(self):
+        # arrange
+        lock_file_cache = LockFileCache(self.mock_logger, self.cache_directory, 10)
+        self.__init_workspace(lock_file_cache, self.__create_workspace('first'))
+        second_workspace = self.__create_workspace('second')
+
+        # act
+        injected = lock_file_cache.inject_lock_file(second_workspace)
+
+        # assert
+        self.assertTrue(injected)
+        self.assertEqual(self.__read_file(os.path.join(second_workspace, '.terraform.lock.hcl')), 'lock')
+        self.assertEqual(lock_file_cache.get_miss_count(), 1)
+        self.assertEqual(lock_file_cache.get_hit_count(), 1)
+
+    def test_inject_lock_file_for_other_configuration_does_nothing(self):
+        # arrange
+        lock_file_cache = LockFileCache(self.mock_logger, self.cache_directory, 10)
+        self.__init_workspace(lock_file_cache, self.__create_workspace('first'))
+        second_workspace = self.__create_workspace('second', configuration='provider "google" {}')
+
+        # act
+        injected = lock_file_cache.inject_lock_file(second_workspace)
+
+        # assert
+        self.assertFalse(injected)
+        self.assertFalse(os.path.exists(os.path.join(second_workspace, '.terraform.lock.hcl')))
+
+    def test_record_lock_file_shipped_in_artifact_records_nothing(self):
+        # arrange
+        lock_file_cache = LockFileCache(self.mock_logger, self.cache_directory, 10)
+        first_workspace = self.__create_workspace('first')
+        self.__write_file(os.path.join(first_workspace, '.terraform.lock.hcl'), 'shipped')
+        second_workspace = self.__create_workspace('second')
+
+        # act
+        self.__init_workspace(lock_file_cache, first_workspace)
+        injected = lock_file_cache.inject_lock_file(second_workspace)
+
+        # assert
+        self.assertFalse(injected)
+        self.assertEqual(lock_file_cache.get_miss_count(), 1)
+
+    def test_discard_lock_file_removes_injected_entry(self):
+        # arrange
+        lock_file_cache = LockFileCache(self.mock_logger, self.cache_directory, 10)
+        self.__init_workspace(lock_file_cache, self.__create_workspace('first'))
+        second_workspace = self.__create_workspace('second')
+        lock_file_cache.inject_lock_file(second_workspace)
+
+        # act
+        lock_file_cache.discard_lock_file(second_workspace)
+
+        # assert
+        self.assertFalse(lock_file_cache.inject_lock_file(self.__create_workspace('third')))
+
+    def test_inject_lock_file_without_configuration_files_does_nothing(self):
+        # arrange
+        lock_file_cache = LockFileCache(self.mock_logger, self.cache_directory, 10)
+        # A destroy workspace holds only the override files the runner writes
+        first_workspace = self.__create_workspace('first')
+        os.remove(os.path.join(first_workspace, 'main.tf'))
+        second_workspace = self.__create_workspace('second')
+        os.remove(os.path.join(second_workspace, 'main.tf'))
+
+        # act
+        self.__init_workspace(lock_file_cache, first_workspace)
+        injected = lock_file_cache.inject_lock_file(second_workspace)
+
+        # assert
+        self.assertFalse(injected)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_directory, 'entries')))
+        self.assertEqual(lock_file_cache.get_miss_count(), 0)
+
+    def test_record_lock_file_evicts_least_recently_used_entries(self):
+        # arrange
+        lock_file_cache = LockFileCache(self.mock_logger, self.cache_directory, 1)
+        self.__init_workspace(lock_file_cache, self.__create_workspace('first'))
+        entries_directory = os.path.join(self.cache_directory, 'entries')
+        os.utime(os.path.join(entries_directory, os.listdir(entries_directory)[0]), (0, 0))
+
+        # act
+        self.__init_workspace(lock_file_cache, self.__create_workspace('second', configuration='provider "google" {}'))
+
+        # assert
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_directory, 'entries'))), 1)
+        self.assertFalse(lock_file_cache.inject_lock_file(self.__create_workspace('third')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from terraform_runner.ModuleCache import ModuleCache
+
+MODULES = [
+    {'Key': '', 'Source': '', 'Dir': '.'},
+    {'Key': 'vpc', 'Source': 'registry.terraform.io/example/vpc/aws', 'Version': '1.2.0',
+     'Dir': '.terraform/modules/vpc'},
+    {'Key': 'vpc.subnets', 'Source': './modules/subnets', 'Dir': '.terraform/modules/vpc/modules/subnets'},
+    {'Key': 'network', 'Source': './network', 'Dir': 'network'}
+]
+
+
+class TestModuleCache(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.cache_directory = os.path.join(self.__temporary_directory.name, 'cache')
+        self.mock_logger = Mock()
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __create_workspace(self, name, configuration='module "vpc" {}'):
+        workspace_directory = os.path.join(self.__temporary_directory.name, name)
+        os.makedirs(workspace_directory)
+        with open(os.path.join(workspace_directory, 'main.tf'), 'w') as file_handle:
+            file_handle.write(configuration)
+        # Differs for every provisioned product and does not affect the modules
+        with open(os.path.join(workspace_directory, 'backend_override.tf.json'), 'w') as file_handle:
+            file_handle.write(name)
+        return workspace_directory
+
+    def __init_workspace(self, workspace_directory, modules=MODULES, content='vpc'):
+        # Lays out the modules the way terraform init does
+        modules_directory = os.path.join(workspace_directory, '.terraform', 'modules')
+        os.makedirs(os.path.join(modules_directory, 'vpc', 'modules', 'subnets'))
+        with open(os.path.join(modules_directory, 'vpc', 'main.tf'), 'w') as file_handle:
+            file_handle.write(content)
+        with open(os.path.join(modules_directory, 'modules.json'), 'w') as file_handle:
+            json.dump({'Modules': modules}, file_handle)
+
+    def test_install_modules_after_store_copies_modules_and_manifest(self):
+        # arrange
+        module_cache = ModuleCache(self.mock_logger, self.cache_directory, 1024)
+        first_workspace = self.__create_workspace('first')
+        self.__init_workspace(first_workspace)
+        module_cache.store_modules(first_workspace)
+        second_workspace = self.__create_workspace('second')
+
+        # act
+        installed = module_cache.install_modules(second_workspace)
+
+        # assert
+        self.assertTrue(installed)
+        self.assertEqual(module_cache.get_miss_count(), 1)
+        self.assertEqual(module_cache.get_hit_count(), 1)
+        with open(os.path.join(second_workspace, '.terraform', 'modules', 'vpc', 'main.tf'), 'r') as file_handle:
+            self.assertEqual(file_handle.read(), 'vpc')
+        with open(os.path.join(second_workspace, '.terraform', 'modules', 'modules.json'), 'r') as file_handle:
+            self.assertEqual(json.load(file_handle), {'Modules': MODULES})
+
+    def test_install_modules_for_unknown_configuration_does_nothing(self):
+        # arrange
+        module_cache = ModuleCache(self.mock_logger, self.cache_directory, 1024)
+        first_workspace = self.__create_workspace('first')
+        self.__init_workspace(first_workspace)
+        module_cache.store_modules(first_workspace)
+        second_workspace = self.__create_workspace('second', configuration='module "other" {}')
+
+        # act
+        installed = module_cache.install_modules(second_workspace)
+
+        # assert
+        self.assertFalse(installed)
+        self.assertFalse(os.path.exists(os.path.join(second_workspace, '.terraform')))
+
+    def test_install_modules_with_unpinned_source_does_nothing(self):
+        # arrange
+        modules = MODULES + [
+            {'Key': 'git', 'Source': 'git::https://example.com/module.git', 'Dir': '.terraform/modules/git'}]
+        module_cache = ModuleCache(self.mock_logger, self.cache_directory, 1024)
+        first_workspace = self.__create_workspace('first')
+        self.__init_workspace(first_workspace, modules)
+        module_cache.store_modules(first_workspace)
+        second_workspace = self.__create_workspace('second')
+
+        # act
+        installed = module_cache.install_modules(second_workspace)
+
+        # assert
+        self.assertFalse(installed)
+        self.assertEqual(module_cache.get_miss_count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(second_workspace, '.terraform')))
+
+    def test_install_modules_with_branch_ref_does_nothing(self):
+        # arrange
+        modules = MODULES + [{'Key': 'git', 'Source': 'git::https://example.com/module.git?ref=main',
+                              'Dir': '.terraform/modules/git'}]
+        module_cache = ModuleCache(self.mock_logger, self.cache_directory, 1024)
+        first_workspace = self.__create_workspace('first')
+        self.__init_workspace(first_workspace, modules)
+        module_cache.store_modules(first_workspace)
+
+        # act
+        installed = module_cache.install_modules(self.__create_workspace('second'))
+
+        # assert
+        self.assertFalse(installed)
+
+    def test_install_modules_with_commit_ref_copies_modules(self):
+        # arrange
+        modules = MODULES + [{'Key': 'git', 'Source': f'git::https://example.com/module.git?ref={"a1" * 20}',
+                              'Dir': '.terraform/modules/git'}]
+        module_cache = ModuleCache(self.mock_logger, self.cache_directory, 1024)
+        first_workspace = self.__create_workspace('first')
+        self.__init_workspace(first_workspace, modules)
+        os.makedirs(os.path.join(first_workspace, '.terraform', 'modules', 'git'))
+        module_cache.store_modules(first_workspace)
+
+        # act
+        installed = module_cache.install_modules(self.__create_workspace('second'))
+
+        # assert
+        self.assertTrue(installed)
+
+    def test_store_modules_evicts_least_recently_used_modules(self):
+        # arrange
+        module_cache = ModuleCache(self.mock_logger, self.cache_directory, 150)
+        first_workspace = self.__create_workspace('first')
+        self.__init_workspace(first_workspace, content='x' * 100)
+        module_cache.store_modules(first_workspace)
+        modules = [dict(module, Version='2.0.0') if module['Key'] == 'vpc' else module for module in MODULES]
+        second_workspace = self.__create_workspace('second', configuration='module "vpc" { version = "2.0.0" }')
+        self.__init_workspace(second_workspace, modules, content='y' * 100)
+
+        # act
+        module_cache.store_modules(second_workspace)
+
+        # assert
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_directory, 'entries'))), 1)
+        self.assertFalse(module_cache.install_modules(self.__create_workspace('third')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import io
+import unittest
+from unittest.mock import Mock
+
+from terraform_runner.ReadAheadStream import ReadAheadStream
+
+
+class TestReadAheadStream(unittest.TestCase):
+
+    def test_read_returns_source_content_in_order(self):
+        # arrange
+        content = bytes(range(256)) * 1000
+        stream = ReadAheadStream(io.BytesIO(content), chunk_size=1000, max_buffered_chunks=2)
+
+        # act
+        magic_bytes = stream.peek(3)
+        chunks = []
+        for chunk in iter(lambda: stream.read(777), b''):
+            chunks.append(chunk)
+        stream.close()
+
+        # assert
+        self.assertEqual(magic_bytes, content[:3])
+        self.assertEqual(b''.join(chunks), content)
+        self.assertEqual(stream.get_bytes_read(), len(content))
+
+    def test_read_raises_source_errors(self):
+        # arrange
+        source = Mock()
+        source.read.side_effect = [b'data', ConnectionError('connection reset')]
+        stream = ReadAheadStream(source)
+
+        # act and assert
+        self.assertEqual(stream.read(), b'data')
+        with self.assertRaises(ConnectionError):
+            stream.read()
+        stream.close()
+        source.close.assert_called_once()
+
+    def test_close_stops_reader_blocked_on_full_buffer(self):
+        # arrange
+        source = io.BytesIO(b'x' * 100000)
+        stream = ReadAheadStream(source, chunk_size=10, max_buffered_chunks=1)
+
+        # act
+        stream.read(5)
+        stream.close()
+
+        # assert
+        self.assertTrue(source.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
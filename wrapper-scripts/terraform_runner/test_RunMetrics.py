@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from terraform_runner.RunMetrics import RunMetrics, SUMMARY_PREFIX
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.textfile = os.path.join(self.__temporary_directory.name, 'terraform_runner.prom')
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def test_log_summary_includes_phases_and_counters(self):
+        # arrange
+        mock_logger = Mock()
+        metrics = RunMetrics(mock_logger, 'apply', 'account-id/pp-id')
+        with metrics.phase('init'):
+            pass
+        metrics.add_phase_seconds('apply', 1.5)
+        metrics.add_phase_seconds('apply', 1)
+        metrics.add_counter('bytes_downloaded', 2048)
+        metrics.add_counter('init_skipped')
+
+        # act
+        metrics.log_summary('Error message')
+
+        # assert
+        message = mock_logger.info.call_args[0][0]
+        self.assertTrue(message.startswith(f'{SUMMARY_PREFIX} '))
+        summary = json.loads(message[len(SUMMARY_PREFIX) + 1:])
+        self.assertEqual('apply', summary['action'])
+        self.assertEqual('account-id/pp-id', summary['provisioned_product_descriptor'])
+        self.assertEqual('failure', summary['status'])
+        self.assertEqual(2.5, summary['phase_seconds']['apply'])
+        self.assertIn('init', summary['phase_seconds'])
+        self.assertEqual({'bytes_downloaded': 2048, 'init_skipped': 1}, summary['counters'])
+
+    @patch('terraform_runner.RunMetrics.time.monotonic')
+    def test_write_textfile_accumulates_runs(self, mock_monotonic):
+        # arrange
+        mock_monotonic.return_value = 0
+        first_metrics = RunMetrics(Mock(), 'apply', 'pp-1')
+        first_metrics.add_phase_seconds('apply', 3)
+        first_metrics.add_counter('bytes_downloaded', 100)
+        second_metrics = RunMetrics(Mock(), 'apply', 'pp-2')
+        second_metrics.add_phase_seconds('apply', 45)
+        second_metrics.add_counter('bytes_downloaded', 50)
+
+        # act
+        first_metrics.write_textfile(self.textfile, 0)
+        second_metrics.write_textfile(self.textfile, 'Error message')
+        with open(self.textfile, 'r') as file_handle:
+            lines = file_handle.read().splitlines()
+
+        # assert
+        self.assertIn('terraform_runner_runs_total{action="apply",status="success"} 1', lines)
+        self.assertIn('terraform_runner_runs_total{action="apply",status="failure"} 1', lines)
+        self.assertIn('terraform_runner_bytes_downloaded_total 150', lines)
+        self.assertIn('terraform_runner_phase_duration_seconds_bucket{action="apply",phase="apply",le="2"} 0', lines)
+        self.assertIn('terraform_runner_phase_duration_seconds_bucket{action="apply",phase="apply",le="5"} 1', lines)
+        self.assertIn('terraform_runner_phase_duration_seconds_bucket{action="apply",phase="apply",le="60"} 2', lines)
+        self.assertIn('terraform_runner_phase_duration_seconds_bucket{action="apply",phase="apply",le="+Inf"} 2', lines)
+        self.assertIn('terraform_runner_phase_duration_seconds_sum{action="apply",phase="apply"} 48', lines)
+        self.assertIn('terraform_runner_phase_duration_seconds_count{action="apply",phase="total"} 2', lines)
+
+    def test_write_textfile_failure_is_logged(self):
+        # arrange
+        mock_logger = Mock()
+        metrics = RunMetrics(mock_logger, 'destroy', 'pp-1')
+        with open(self.textfile, 'w'):
+            pass
+
+        # act
+        metrics.write_textfile(os.path.join(self.textfile, 'metrics.prom'), 0)
+
+        # assert
+        mock_logger.error.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from terraform_runner.ValidationCache import ValidationCache
+
+
+class TestValidationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.cache_directory = os.path.join(self.__temporary_directory.name, 'cache')
+        self.workspace_directory = os.path.join(self.__temporary_directory.name, 'workspace')
+        os.makedirs(os.path.join(self.workspace_directory, '.terraform', 'providers'))
+        self.__write_workspace_file('main.tf', 'resource "null_resource" "r" {}')
+        self.__write_workspace_file('variable_override.tf.json', '{"variable": {"name": {"default": "a"}}}')
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __write_workspace_file(self, relative_path, content):
+        with open(os.path.join(self.workspace_directory, relative_path), 'w') as file_handle:
+            file_handle.write(content)
+
+    def test_is_validated_after_record_validation(self):
+        # arrange
+        validation_cache = ValidationCache(Mock(), self.cache_directory, 10)
+        fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+
+        # act
+        validated_before = validation_cache.is_validated(fingerprint)
+        validation_cache.record_validation(fingerprint)
+        validated_after = validation_cache.is_validated(fingerprint)
+
+        # assert
+        self.assertFalse(validated_before)
+        self.assertTrue(validated_after)
+
+    def test_get_fingerprint_changes_with_configuration_and_overrides(self):
+        # arrange
+        validation_cache = ValidationCache(Mock(), self.cache_directory, 10)
+        original_fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+
+        # act
+        self.__write_workspace_file('.terraform/providers/ignored', 'provider binary')
+        unchanged_fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+        self.__write_workspace_file('variable_override.tf.json', '{"variable": {"name": {"default": 1}}}')
+        override_fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+        self.__write_workspace_file('main.tf', 'resource "null_resource" "s" {}')
+        configuration_fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+
+        # assert
+        self.assertEqual(original_fingerprint, unchanged_fingerprint)
+        self.assertEqual(3, len({original_fingerprint, override_fingerprint, configuration_fingerprint}))
+
+    def test_get_fingerprint_ignores_per_product_values(self):
+        # arrange
+        validation_cache = ValidationCache(Mock(), self.cache_directory, 10)
+        self.__write_workspace_file('backend_override.tf.json',
+                                    '{"terraform": {"backend": {"s3": {"key": "111122223333/pp-1"}}}}')
+        self.__write_workspace_file('provider_override.tf.json',
+                                    '{"provider": {"aws": {"default_tags": {"tags": {"Owner": "first"}}}}}')
+        first_fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+
+        # act
+        self.__write_workspace_file('backend_override.tf.json',
+                                    '{"terraform": {"backend": {"s3": {"key": "111122223333/pp-2"}}}}')
+        self.__write_workspace_file('provider_override.tf.json',
+                                    '{"provider": {"aws": {"default_tags": {"tags": {"Owner": "second"}}}}}')
+        self.__write_workspace_file('variable_override.tf.json', '{"variable": {"name": {"default": "b"}}}')
+        second_fingerprint = validation_cache.get_fingerprint(self.workspace_directory)
+
+        # assert
+        self.assertEqual(first_fingerprint, second_fingerprint)
+
+    def test_record_validation_evicts_least_recently_used(self):
+        # arrange
+        validation_cache = ValidationCache(Mock(), self.cache_directory, 2)
+        validation_cache.record_validation('first')
+        validation_cache.record_validation('second')
+        past = time.time() - 60
+        os.utime(os.path.join(self.cache_directory, 'entries', 'first'), (past, past))
+        os.utime(os.path.join(self.cache_directory, 'entries', 'second'), (past - 60, past - 60))
+        validation_cache.is_validated('second')
+
+        # act
+        validation_cache.record_validation('third')
+
+        # assert
+        self.assertFalse(validation_cache.is_validated('first'))
+        self.assertTrue(validation_cache.is_validated('second'))
+        self.assertTrue(validation_cache.is_validated('third'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,23 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from terraform_runner.CommandManager import CommandManager
 from terraform_runner.WorkspaceManager import WorkspaceManager
 
 
 class TestWorkspaceManager(unittest.TestCase):
 
+    @patch('terraform_runner.WorkspaceManager.start_trash_reaper')
+    @patch('terraform_runner.WorkspaceManager.move_to_trash')
+    @patch('terraform_runner.WorkspaceManager.open_held_lock')
     @patch('terraform_runner.WorkspaceManager.CustomLogger')
     @patch('terraform_runner.WorkspaceManager.os')
-    @patch.object(CommandManager, 'run_command')
-    def test_setup_workspace_directory_happy_path(self, mock_run_command, mock_os, mock_logger):
+    def test_setup_workspace_directory_happy_path(self, mock_os, mock_logger, mock_open_held_lock, mock_move_to_trash,
+                                                  mock_start_trash_reaper):
         # arrange
         mock_os.path.expanduser.return_value = 'home-dir'
+        mock_move_to_trash.return_value = False
         provisioned_product_descriptor = 'pp-descriptor'
 
         # act
@@ -20,23 +25,239 @@ class TestWorkspaceManager(unittest.TestCase):
         workspace_manager.setup_workspace_directory()
 
         # assert
-        mock_run_command.assert_called_once_with(['rm', '-f', '-r', workspace_manager.get_workspace_directory()])
+        mock_move_to_trash.assert_called_once_with(workspace_manager.get_workspace_directory(),
+                                                   'home-dir/workspaces/.trash')
+        mock_start_trash_reaper.assert_not_called()
         mock_os.makedirs.assert_called_once_with(workspace_manager.get_workspace_directory())
+        mock_open_held_lock.assert_called_once_with('home-dir/workspaces/.locks/pp-descriptor.lock')
 
+    @patch('terraform_runner.WorkspaceManager.start_trash_reaper')
     @patch('terraform_runner.WorkspaceManager.CustomLogger')
-    @patch('terraform_runner.WorkspaceManager.os')
-    @patch.object(CommandManager, 'run_command')
-    def test_remove_workspace_directory_happy_path(self, mock_run_command, mock_os, mock_logger):
-        # arrange
-        mock_os.path.expanduser.return_value = 'home-dir'
-        provisioned_product_descriptor = 'pp-descriptor'
+    def test_remove_workspace_directory_moves_it_to_trash(self, mock_logger, mock_start_trash_reaper):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            with patch('terraform_runner.WorkspaceManager.os.path.expanduser', return_value=home_directory):
+                workspace_manager = WorkspaceManager(mock_logger, 'account/pp-id')
+            os.makedirs(f'{workspace_manager.get_workspace_directory()}/.terraform')
 
-        # act
-        workspace_manager = WorkspaceManager(mock_logger, provisioned_product_descriptor)
-        workspace_manager.remove_workspace_directory()
+            # act
+            workspace_manager.remove_workspace_directory()
 
-        # assert
-        mock_run_command.assert_called_once_with(['rm', '-f', '-r', workspace_manager.get_workspace_directory()])
+            # assert
+            self.assertFalse(os.path.exists(workspace_manager.get_workspace_directory()))
+            self.assertEqual(1, len(os.listdir(workspace_manager.get_trash_directory())))
+            mock_start_trash_reaper.assert_called_once_with(workspace_manager.get_trash_directory())
+
+    def test_plugin_cache_install_lock_evicts_unused_providers(self):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            plugin_cache_directory = f'{home_directory}/cache/plugins'
+            used_package = f'{plugin_cache_directory}/registry.terraform.io/hashicorp/aws/5.0.0/linux_amd64'
+            unused_package = f'{plugin_cache_directory}/registry.terraform.io/hashicorp/null/3.0.0/linux_amd64'
+            for package in [used_package, unused_package]:
+                os.makedirs(package)
+                with open(f'{package}/provider', 'wb') as provider_file:
+                    provider_file.write(b'x' * 100)
+                os.utime(package, (0, 0))
+
+            with patch('terraform_runner.WorkspaceManager.os.path.expanduser', return_value=home_directory):
+                workspace_manager = WorkspaceManager(Mock(), 'account/pp-id', plugin_cache_directory, 150)
+            workspace_dir = workspace_manager.get_workspace_directory()
+            link_parent = f'{workspace_dir}/.terraform/providers/registry.terraform.io/hashicorp/aws/5.0.0'
+            os.makedirs(link_parent)
+            os.symlink(used_package, f'{link_parent}/linux_amd64')
+
+            # act
+            workspace_manager.setup_plugin_cache_directory()
+            with workspace_manager.plugin_cache_install_lock():
+                pass
+
+            # assert
+            self.assertTrue(os.path.isdir(used_package))
+            self.assertFalse(os.path.exists(unused_package))
+
+    def test_plugin_cache_install_lock_keeps_providers_linked_from_other_workspaces(self):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            plugin_cache_directory = f'{home_directory}/cache/plugins'
+            package = f'{plugin_cache_directory}/registry.terraform.io/hashicorp/aws/5.0.0/linux_amd64'
+            os.makedirs(package)
+            with open(f'{package}/provider', 'wb') as provider_file:
+                provider_file.write(b'x' * 100)
+            link_parent = f'{home_directory}/workspaces/account/other-pp/.terraform/providers/registry.terraform.io/hashicorp/aws/5.0.0'
+            os.makedirs(link_parent)
+            os.symlink(package, f'{link_parent}/linux_amd64')
+
+            with patch('terraform_runner.WorkspaceManager.os.path.expanduser', return_value=home_directory):
+                workspace_manager = WorkspaceManager(Mock(), 'account/pp-id', plugin_cache_directory, 10)
+
+            # act
+            with workspace_manager.plugin_cache_install_lock():
+                pass
+
+            # assert
+            self.assertTrue(os.path.isdir(package))
+
+    def __create_retained_workspace_manager(self, home_directory, provisioned_product_descriptor='account/pp-id'):
+        with patch('terraform_runner.WorkspaceManager.os.path.expanduser', return_value=home_directory):
+            return WorkspaceManager(Mock(), provisioned_product_descriptor, retain_workspace=True)
+
+    def __write_file(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file_handle:
+            file_handle.write(content)
+
+    def test_retained_workspace_syncs_only_changed_files(self):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            workspace_manager = self.__create_retained_workspace_manager(home_directory)
+            workspace_manager.setup_workspace_directory()
+            workspace_dir = workspace_manager.get_workspace_directory()
+            artifact_dir = workspace_manager.get_artifact_directory()
+            self.__write_file(f'{artifact_dir}/main.tf', 'first')
+            self.__write_file(f'{artifact_dir}/removed.tf', 'removed')
+            self.__write_file(f'{artifact_dir}/artifact.local', 'archive')
+            workspace_manager.sync_artifact_directory()
+            self.__write_file(f'{workspace_dir}/.terraform/terraform.tfstate', 'state')
+            workspace_manager.release_workspace_directory()
+
+            # act
+            workspace_manager.setup_workspace_directory()
+            self.__write_file(f'{artifact_dir}/main.tf', 'second')
+            workspace_manager.sync_artifact_directory()
+            workspace_manager.release_workspace_directory()
+
+            # assert
+            with open(f'{workspace_dir}/main.tf', 'r') as file_handle:
+                self.assertEqual(file_handle.read(), 'second')
+            self.assertFalse(os.path.exists(f'{workspace_dir}/removed.tf'))
+            self.assertFalse(os.path.exists(f'{workspace_dir}/artifact.local'))
+            self.assertTrue(os.path.exists(f'{workspace_dir}/.terraform/terraform.tfstate'))
+
+    def test_retained_workspace_removes_init_lock_file_when_configuration_changes(self):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            workspace_manager = self.__create_retained_workspace_manager(home_directory)
+            workspace_manager.setup_workspace_directory()
+            workspace_dir = workspace_manager.get_workspace_directory()
+            artifact_dir = workspace_manager.get_artifact_directory()
+            self.__write_file(f'{artifact_dir}/main.tf', 'first')
+            workspace_manager.sync_artifact_directory()
+            self.__write_file(f'{workspace_dir}/.terraform.lock.hcl', 'written by init')
+            workspace_manager.release_workspace_directory()
+
+            # act
+            workspace_manager.setup_workspace_directory()
+            self.__write_file(f'{artifact_dir}/main.tf', 'first')
+            workspace_manager.sync_artifact_directory()
+            unchanged_lock_file_exists = os.path.exists(f'{workspace_dir}/.terraform.lock.hcl')
+            workspace_manager.release_workspace_directory()
+            workspace_manager.setup_workspace_directory()
+            self.__write_file(f'{artifact_dir}/main.tf', 'second')
+            workspace_manager.sync_artifact_directory()
+            workspace_manager.release_workspace_directory()
+
+            # assert
+            self.assertTrue(unchanged_lock_file_exists)
+            self.assertFalse(os.path.exists(f'{workspace_dir}/.terraform.lock.hcl'))
+
+    def test_release_workspace_directory_without_lock_leaves_staging_directory(self):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            workspace_manager = self.__create_retained_workspace_manager(home_directory)
+            workspace_manager.setup_workspace_directory()
+            # A second run for the same product that failed before taking the workspace lock
+            refused_workspace_manager = self.__create_retained_workspace_manager(home_directory)
+
+            # act
+            refused_workspace_manager.release_workspace_directory()
+
+            # assert
+            self.assertTrue(workspace_manager.holds_workspace_lock())
+            self.assertFalse(refused_workspace_manager.holds_workspace_lock())
+            self.assertTrue(os.path.isdir(workspace_manager.get_artifact_directory()))
+            workspace_manager.release_workspace_directory()
+            self.assertFalse(workspace_manager.holds_workspace_lock())
+
+    def test_needs_init_only_when_configuration_changes(self):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            workspace_manager = self.__create_retained_workspace_manager(home_directory)
+            workspace_manager.setup_workspace_directory()
+            workspace_dir = workspace_manager.get_workspace_directory()
+            self.__write_file(f'{workspace_dir}/main.tf', 'config')
+            self.__write_file(f'{workspace_dir}/.terraform.lock.hcl', 'lock')
+
+            # act and assert
+            self.assertTrue(workspace_manager.needs_init())
+            workspace_manager.mark_initialized()
+            self.__write_file(f'{workspace_dir}/variable_override.tf.json', '{}')
+            self.assertFalse(workspace_manager.needs_init())
+            self.__write_file(f'{workspace_dir}/.terraform.lock.hcl', 'changed lock')
+            self.assertTrue(workspace_manager.needs_init())
+            workspace_manager.release_workspace_directory()
+
+    @patch('terraform_runner.WorkspaceManager.start_trash_reaper')
+    def test_reap_retained_workspaces_removes_expired_and_unlocked_only(self, mock_start_trash_reaper):
+        with tempfile.TemporaryDirectory() as home_directory:
+            # arrange
+            expired_manager = self.__create_retained_workspace_manager(home_directory, 'account/expired')
+            busy_manager = self.__create_retained_workspace_manager(home_directory, 'account/busy')
+            for manager in [expired_manager, busy_manager]:
+                manager.setup_workspace_directory()
+                manager.sync_artifact_directory()
+                manifest_file = f'{manager.get_workspace_directory()}/.runner-retained-workspace.json'
+                os.utime(manifest_file, (0, 0))
+            expired_manager.release_workspace_directory()
+            current_manager = self.__create_retained_workspace_manager(home_directory, 'account/current')
+            current_manager.setup_workspace_directory()
+
+            # act
+            current_manager.reap_retained_workspaces(3600, 10)
+
+            # assert
+            self.assertFalse(os.path.exists(expired_manager.get_workspace_directory()))
+            self.assertTrue(os.path.exists(busy_manager.get_workspace_directory()))
+            self.assertTrue(os.path.exists(current_manager.get_workspace_directory()))
+            mock_start_trash_reaper.assert_called_once_with(current_manager.get_trash_directory())
+            busy_manager.release_workspace_directory()
+            current_manager.release_workspace_directory()
+
+    def test_check_disk_quota_fails_when_workspace_grows_beyond_quota(self):
+        with tempfile.TemporaryDirectory() as workspaces_root:
+            # arrange
+            workspace_manager = WorkspaceManager(Mock(), 'account/pp-id', workspaces_root=workspaces_root,
+                                                 disk_quota_bytes=1000)
+            workspace_manager.setup_workspace_directory()
+            workspace_dir = workspace_manager.get_workspace_directory()
+            with open(f'{workspace_dir}/main.tf', 'wb') as file_handle:
+                file_handle.write(b'x' * 600)
+            workspace_manager.check_disk_quota()
+            with open(f'{workspace_dir}/other.tf', 'wb') as file_handle:
+                file_handle.write(b'x' * 600)
+
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                workspace_manager.check_disk_quota()
+
+            # assert
+            self.assertEqual(f'Workspace {workspace_dir} uses 1200 bytes of disk space, more than its quota of 1000 bytes',
+                             str(context.exception))
+            workspace_manager.release_workspace_directory()
+
+    def test_setup_workspace_directory_fails_fast_without_room_for_quota(self):
+        with tempfile.TemporaryDirectory() as workspaces_root:
+            # arrange
+            workspace_manager = WorkspaceManager(Mock(), 'account/pp-id', workspaces_root=workspaces_root,
+                                                 disk_quota_bytes=1 << 60)
+
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                workspace_manager.setup_workspace_directory()
+
+            # assert
+            self.assertIn(f'Workspaces root {workspaces_root} has', str(context.exception))
+            self.assertFalse(os.path.exists(workspace_manager.get_workspace_directory()))
 
 
 if __name__ == '__main__':
@@ -1,6 +1,62 @@
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
 import unittest
-from unittest.mock import Mock, patch
-from terraform_runner.artifact_manager import download_artifact, ROLE_SESSION_NAME
+from unittest.mock import ANY, Mock, patch
+from terraform_runner.artifact_manager import download_artifact, DOWNLOAD_MODE_STREAM, EXTRACT_ARGUMENTS, \
+    ROLE_SESSION_NAME
+from terraform_runner.ExtractedTreeStore import ExtractedTreeStore
+
+
+def create_tar_gz(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar_file:
+        for name, content in files.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            tar_file.addfile(member, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def create_tar_zst(files):
+    uncompressed = io.BytesIO()
+    with tarfile.open(fileobj=uncompressed, mode='w') as tar_file:
+        for name, content in files.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            tar_file.addfile(member, io.BytesIO(content))
+    return subprocess.run(['zstd', '-c', '-q'], input=uncompressed.getvalue(), stdout=subprocess.PIPE, check=True).stdout
+
+
+def create_tar_gz_with_symlink_chain():
+    # a resolves to the parent of the extraction directory, although a -> b/.. looks like it stays inside it
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar_file:
+        tar_file.addfile(tarfile.TarInfo('main.tf'), io.BytesIO(b''))
+        for name, linkname in [('b', '.'), ('a', 'b/..')]:
+            link = tarfile.TarInfo(name)
+            link.type = tarfile.SYMTYPE
+            link.linkname = linkname
+            tar_file.addfile(link)
+        escaped = tarfile.TarInfo('a/escaped.txt')
+        escaped.size = 7
+        tar_file.addfile(escaped, io.BytesIO(b'escaped'))
+    return buffer.getvalue()
+
+
+def create_mock_clients(mock_client):
+    mock_sts = Mock()
+    mock_s3 = Mock()
+    mock_client.side_effect = [mock_sts, mock_s3]
+    mock_sts.assume_role.return_value = {'Credentials': {
+        'AccessKeyId': 'access-key',
+        'SecretAccessKey': 'secret-key',
+        'SessionToken': 'session-token'
+    }}
+    return mock_s3
 
 
 class TestArtifactManager(unittest.TestCase):
@@ -29,6 +85,8 @@ class TestArtifactManager(unittest.TestCase):
         local_file = f'{workspace_dir}/artifact.local'
 
         mock_glob.return_value = ['mock.tf']
+        mock_tar_file = mock_tarfile_open.return_value.__enter__.return_value
+        mock_tar_file.__iter__.return_value = [tarfile.TarInfo('main.tf')]
 
         # act
         download_artifact(launch_role_arn, artifact_path, workspace_dir)
@@ -41,8 +99,65 @@ class TestArtifactManager(unittest.TestCase):
                                        aws_secret_access_key=mock_credentials['SecretAccessKey'],
                                        aws_session_token=mock_credentials['SessionToken'])
         mock_s3.download_file.assert_called_once_with(artifact_bucket, artifact_key,
-                                                      local_file)
-        mock_tarfile_open.assert_called_once_with('artifact.local')
+                                                      local_file, ExtraArgs=None, Callback=ANY)
+        mock_tarfile_open.assert_called_once_with(local_file)
+        mock_tar_file.extract.assert_called_once_with(mock_tar_file.__iter__.return_value[0], workspace_dir,
+                                                      **EXTRACT_ARGUMENTS)
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    @patch('tarfile.open')
+    @patch('terraform_runner.artifact_manager.glob')
+    def test_download_artifact_with_run_credentials(self, mock_glob, mock_tarfile_open, mock_client):
+        # arrange
+        mock_s3 = Mock()
+        mock_client.return_value = mock_s3
+        credentials = {
+            'AccessKeyId': 'access-key',
+            'SecretAccessKey': 'secret-key',
+            'SessionToken': 'session-token'
+        }
+        mock_glob.return_value = ['mock.tf']
+        mock_tar_file = mock_tarfile_open.return_value.__enter__.return_value
+        mock_tar_file.__iter__.return_value = [tarfile.TarInfo('main.tf')]
+
+        # act
+        download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', 'workspace/dir', credentials=credentials)
+
+        # assert
+        mock_client.assert_called_once_with('s3',
+                                            aws_access_key_id=credentials['AccessKeyId'],
+                                            aws_secret_access_key=credentials['SecretAccessKey'],
+                                            aws_session_token=credentials['SessionToken'])
+        mock_s3.download_file.assert_called_once()
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    @patch('tarfile.open')
+    @patch('terraform_runner.artifact_manager.glob')
+    def test_download_artifact_with_artifact_cache(self, mock_glob, mock_tarfile_open, mock_client):
+        # arrange
+        mock_sts = Mock()
+        mock_s3 = Mock()
+        mock_client.side_effect = [mock_sts, mock_s3]
+        mock_sts.assume_role.return_value = {'Credentials': {
+            'AccessKeyId': 'access-key',
+            'SecretAccessKey': 'secret-key',
+            'SessionToken': 'session-token'
+        }}
+        mock_artifact_cache = Mock()
+        mock_artifact_cache.get_artifact.return_value = 'cache/entries/abc/artifact'
+        mock_artifact_cache.get_bytes_downloaded.return_value = 0
+        mock_glob.return_value = ['mock.tf']
+        mock_tar_file = mock_tarfile_open.return_value.__enter__.return_value
+        mock_tar_file.__iter__.return_value = [tarfile.TarInfo('main.tf')]
+
+        # act
+        download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', 'workspace/dir', mock_artifact_cache)
+
+        # assert
+        mock_artifact_cache.get_artifact.assert_called_once()
+        self.assertEqual(mock_artifact_cache.get_artifact.call_args[0][:3], (mock_s3, 'artifact-bucket', 'artifact'))
+        mock_s3.download_file.assert_not_called()
+        mock_tarfile_open.assert_called_once_with('cache/entries/abc/artifact')
 
     @patch('terraform_runner.artifact_manager.boto3.client')
     @patch('tarfile.open')
@@ -80,8 +195,8 @@ class TestArtifactManager(unittest.TestCase):
                                        aws_secret_access_key=mock_credentials['SecretAccessKey'],
                                        aws_session_token=mock_credentials['SessionToken'])
         mock_s3.download_file.assert_called_once_with(artifact_bucket, artifact_key,
-                                                      local_file)
-        mock_tarfile_open.assert_called_once_with('artifact.local')
+                                                      local_file, ExtraArgs=None, Callback=ANY)
+        mock_tarfile_open.assert_called_once_with(local_file)
         self.assertEqual(context.expected, RuntimeError)
         self.assertEqual(context.exception.args[0], f'Could not extract files from {artifact_path}: mock exception')
 
@@ -148,12 +263,338 @@ class TestArtifactManager(unittest.TestCase):
                                        aws_secret_access_key=mock_credentials['SecretAccessKey'],
                                        aws_session_token=mock_credentials['SessionToken'])
         mock_s3.download_file.assert_called_once_with(artifact_bucket, artifact_key,
-                                                      local_file)
-        mock_tarfile_open.assert_called_once_with('artifact.local')
+                                                      local_file, ExtraArgs=None, Callback=ANY)
+        mock_tarfile_open.assert_called_once_with(local_file)
 
         self.assertEqual(context.expected, RuntimeError)
         self.assertEqual(str(context.exception), 'No .tf files found. Nothing to parse. Make sure the root directory of the Terraform open source configuration file contains the .tf files for the root module.')
 
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_extracts_object_body(self, mock_client):
+        # arrange
+        mock_sts = Mock()
+        mock_s3 = Mock()
+        mock_client.side_effect = [mock_sts, mock_s3]
+        mock_sts.assume_role.return_value = {'Credentials': {
+            'AccessKeyId': 'access-key',
+            'SecretAccessKey': 'secret-key',
+            'SessionToken': 'session-token'
+        }}
+        archive = create_tar_gz({'main.tf': b'resource {}', 'modules/module.tf': b'variable {}'})
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(archive)}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', workspace_dir,
+                              download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            mock_s3.get_object.assert_called_once_with(Bucket='artifact-bucket', Key='artifact')
+            mock_s3.download_file.assert_not_called()
+            self.assertFalse(os.path.exists(f'{workspace_dir}/artifact.local'))
+            with open(f'{workspace_dir}/modules/module.tf', 'rb') as file_handle:
+                self.assertEqual(file_handle.read(), b'variable {}')
+
+    @patch('terraform_runner.artifact_manager.MAX_MEMBER_COUNT', 1)
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_too_many_members(self, mock_client):
+        # arrange
+        mock_sts = Mock()
+        mock_s3 = Mock()
+        mock_client.side_effect = [mock_sts, mock_s3]
+        mock_sts.assume_role.return_value = {'Credentials': {
+            'AccessKeyId': 'access-key',
+            'SecretAccessKey': 'secret-key',
+            'SessionToken': 'session-token'
+        }}
+        artifact_path = 's3://artifact-bucket/artifact'
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(create_tar_gz({'main.tf': b'', 'other.tf': b''}))}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                download_artifact('launch-role-arn', artifact_path, workspace_dir, download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            self.assertEqual(str(context.exception),
+                             f'Could not extract files from {artifact_path}: Artifact contains more than 1 files')
+            self.assertFalse(os.path.exists(f'{workspace_dir}/other.tf'))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_exceeds_max_uncompressed_size(self, mock_client):
+        # arrange
+        mock_sts = Mock()
+        mock_s3 = Mock()
+        mock_client.side_effect = [mock_sts, mock_s3]
+        mock_sts.assume_role.return_value = {'Credentials': {
+            'AccessKeyId': 'access-key',
+            'SecretAccessKey': 'secret-key',
+            'SessionToken': 'session-token'
+        }}
+        artifact_path = 's3://artifact-bucket/artifact'
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(create_tar_gz({'main.tf': b'x' * 100}))}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                download_artifact('launch-role-arn', artifact_path, workspace_dir, download_mode=DOWNLOAD_MODE_STREAM,
+                                  max_uncompressed_size_bytes=50)
+
+            # assert
+            self.assertEqual(str(context.exception),
+                             f'Could not extract files from {artifact_path}: Artifact uncompressed size exceeds 50 bytes')
+            self.assertFalse(os.path.exists(f'{workspace_dir}/main.tf'))
+
+    @unittest.skipUnless(shutil.which('zstd'), 'requires the zstd command')
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_extracts_zstd_artifact(self, mock_client):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        archive = create_tar_zst({'main.tf': b'resource {}', 'modules/module.tf': b'variable {}'})
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(archive)}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            statistics = download_artifact('launch-role-arn', 's3://artifact-bucket/artifact.tar.zst', workspace_dir,
+                                           download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            self.assertEqual(len(archive), statistics['bytes_downloaded'])
+            with open(f'{workspace_dir}/modules/module.tf', 'rb') as file_handle:
+                self.assertEqual(file_handle.read(), b'variable {}')
+
+    @unittest.skipUnless(shutil.which('zstd'), 'requires the zstd command')
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_extracts_zstd_artifact_file(self, mock_client):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        archive = create_tar_zst({'main.tf': b'resource {}'})
+
+        def download_file(bucket, key, destination, ExtraArgs=None, Callback=None):
+            with open(destination, 'wb') as file_handle:
+                file_handle.write(archive)
+        mock_s3.download_file.side_effect = download_file
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            download_artifact('launch-role-arn', 's3://artifact-bucket/artifact.tar.zst', workspace_dir)
+
+            # assert
+            with open(f'{workspace_dir}/main.tf', 'rb') as file_handle:
+                self.assertEqual(file_handle.read(), b'resource {}')
+
+    @unittest.skipUnless(shutil.which('zstd'), 'requires the zstd command')
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_truncated_zstd_artifact(self, mock_client):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        archive = create_tar_zst({'main.tf': os.urandom(64 * 1024)})
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(archive[:len(archive) // 2])}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act / assert
+            with self.assertRaises(RuntimeError):
+                download_artifact('launch-role-arn', 's3://artifact-bucket/artifact.tar.zst', workspace_dir,
+                                  download_mode=DOWNLOAD_MODE_STREAM)
+
+    @patch('terraform_runner.artifact_manager.shutil.which')
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_zstd_artifact_without_zstd_command(self, mock_client, mock_which):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        mock_which.return_value = None
+        artifact_path = 's3://artifact-bucket/artifact.tar.zst'
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(b'\x28\xb5\x2f\xfd' + b'\x00' * 100)}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                download_artifact('launch-role-arn', artifact_path, workspace_dir, download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            self.assertEqual(f'Could not extract files from {artifact_path}: Artifact is compressed with zstd, which '
+                             'requires the zstd command on the instance', str(context.exception))
+
+    @unittest.skipUnless(shutil.which('gzip'), 'requires the gzip command')
+    @patch('terraform_runner.artifact_manager.DECOMPRESSION_COMMANDS', [(b'\x1f\x8b', ['gzip', '-d', '-c'])])
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_uses_decompression_command(self, mock_client):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        files = {'main.tf': b'resource {}'}
+        files.update({f'modules/file-{index}.tf': os.urandom(16 * 1024) for index in range(32)})
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(create_tar_gz(files))}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            with patch('terraform_runner.artifact_manager.gzip.GzipFile') as mock_gzip_file:
+                download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', workspace_dir,
+                                  download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            mock_gzip_file.assert_not_called()
+            with open(f'{workspace_dir}/modules/file-31.tf', 'rb') as file_handle:
+                self.assertEqual(file_handle.read(), files['modules/file-31.tf'])
+
+    def __download_archive_file(self, mock_client, archive, workspace_dir, tree_store=None):
+        create_mock_clients(mock_client)
+        artifact_cache = Mock()
+        # The artifact is kept out of the workspace so that only extracted files end up there
+        artifact_cache.get_artifact.return_value = f'{workspace_dir}.artifact'
+        artifact_cache.get_bytes_downloaded.return_value = 0
+        with open(f'{workspace_dir}.artifact', 'wb') as file_handle:
+            file_handle.write(archive)
+        download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', workspace_dir, artifact_cache,
+                          tree_store=tree_store)
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_with_tree_store_links_extracted_files(self, mock_client):
+        # arrange
+        archive = create_tar_gz({'main.tf': b'resource {}', 'modules/module.tf': b'variable {}'})
+
+        with tempfile.TemporaryDirectory() as directory:
+            tree_store = ExtractedTreeStore(Mock(), f'{directory}/store', 1024 * 1024)
+            first_workspace_dir = f'{directory}/first'
+            second_workspace_dir = f'{directory}/second'
+            os.makedirs(first_workspace_dir)
+            os.makedirs(second_workspace_dir)
+
+            # act
+            self.__download_archive_file(mock_client, archive, first_workspace_dir, tree_store)
+            self.__download_archive_file(mock_client, archive, second_workspace_dir, tree_store)
+            tree_store.release()
+
+            # assert
+            self.assertEqual(tree_store.get_miss_count(), 1)
+            self.assertEqual(tree_store.get_hit_count(), 1)
+            self.assertTrue(os.path.samefile(f'{first_workspace_dir}/modules/module.tf',
+                                             f'{second_workspace_dir}/modules/module.tf'))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_without_root_configuration_extracts_nothing(self, mock_client):
+        # arrange
+        archive = create_tar_gz({'modules/module.tf': b'variable {}', 'README.md': b'readme'})
+
+        with tempfile.TemporaryDirectory() as directory:
+            workspace_dir = f'{directory}/workspace'
+            os.makedirs(workspace_dir)
+
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                self.__download_archive_file(mock_client, archive, workspace_dir)
+
+            # assert
+            self.assertTrue(str(context.exception).startswith('No .tf files found.'))
+            self.assertEqual([], os.listdir(workspace_dir))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_with_unsafe_path_extracts_nothing(self, mock_client):
+        # arrange
+        archive = create_tar_gz({'main.tf': b'resource {}', 'modules/../../escaped.tf': b'variable {}'})
+
+        with tempfile.TemporaryDirectory() as directory:
+            workspace_dir = f'{directory}/workspace'
+            os.makedirs(workspace_dir)
+
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                self.__download_archive_file(mock_client, archive, workspace_dir)
+
+            # assert
+            self.assertTrue(str(context.exception).endswith(
+                'Artifact member modules/../../escaped.tf has a path outside the artifact root'))
+            self.assertEqual([], os.listdir(workspace_dir))
+            self.assertFalse(os.path.exists(f'{directory}/escaped.tf'))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_with_symlink_outside_root_extracts_nothing(self, mock_client):
+        # arrange
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar_file:
+            member = tarfile.TarInfo('main.tf')
+            tar_file.addfile(member, io.BytesIO(b''))
+            link = tarfile.TarInfo('modules/credentials')
+            link.type = tarfile.SYMTYPE
+            link.linkname = '../../.aws/credentials'
+            tar_file.addfile(link)
+
+        with tempfile.TemporaryDirectory() as directory:
+            workspace_dir = f'{directory}/workspace'
+            os.makedirs(workspace_dir)
+
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                self.__download_archive_file(mock_client, buffer.getvalue(), workspace_dir)
+
+            # assert
+            self.assertIn('links to ../../.aws/credentials outside the artifact root', str(context.exception))
+            self.assertEqual([], os.listdir(workspace_dir))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_with_symlink_chain_outside_root_extracts_nothing(self, mock_client):
+        with tempfile.TemporaryDirectory() as directory:
+            workspace_dir = f'{directory}/workspace'
+            os.makedirs(workspace_dir)
+
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                self.__download_archive_file(mock_client, create_tar_gz_with_symlink_chain(), workspace_dir)
+
+            # assert
+            self.assertIn('Artifact member a links to b/.. through another symlink', str(context.exception))
+            self.assertEqual([], os.listdir(workspace_dir))
+            self.assertFalse(os.path.exists(f'{directory}/escaped.txt'))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_rejects_symlink_chain_outside_root(self, mock_client):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(create_tar_gz_with_symlink_chain())}
+
+        with tempfile.TemporaryDirectory() as directory:
+            workspace_dir = f'{directory}/workspace'
+            os.makedirs(workspace_dir)
+
+            # act
+            with self.assertRaises(RuntimeError):
+                download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', workspace_dir,
+                                  download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            self.assertFalse(os.path.exists(f'{directory}/escaped.txt'))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_with_root_configuration_extracts_all_members(self, mock_client):
+        # arrange
+        archive = create_tar_gz({'modules/module.tf': b'variable {}', './main.tf': b'resource {}'})
+
+        with tempfile.TemporaryDirectory() as directory:
+            workspace_dir = f'{directory}/workspace'
+            os.makedirs(workspace_dir)
+
+            # act
+            self.__download_archive_file(mock_client, archive, workspace_dir)
+
+            # assert
+            self.assertEqual(['main.tf', 'modules'], sorted(os.listdir(workspace_dir)))
+
+    @patch('terraform_runner.artifact_manager.boto3.client')
+    def test_download_artifact_stream_mode_rejects_unsafe_path_before_writing_it(self, mock_client):
+        # arrange
+        mock_s3 = create_mock_clients(mock_client)
+        archive = create_tar_gz({'main.tf': b'resource {}', '/tmp/absolute.tf': b'variable {}'})
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(archive)}
+
+        with tempfile.TemporaryDirectory() as workspace_dir:
+            # act
+            with self.assertRaises(RuntimeError) as context:
+                download_artifact('launch-role-arn', 's3://artifact-bucket/artifact', workspace_dir,
+                                  download_mode=DOWNLOAD_MODE_STREAM)
+
+            # assert
+            self.assertIn('has a path outside the artifact root', str(context.exception))
+            self.assertEqual(['main.tf'], os.listdir(workspace_dir))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from terraform_runner import credential_manager
+
+
+class TestCredentialManager(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.credentials_directory = self.__temporary_directory.name
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def create_sts(self, *expirations):
+        sts = Mock()
+        sts.assume_role.side_effect = [{'Credentials': {
+            'AccessKeyId': f'access-key-id-{index}',
+            'SecretAccessKey': 'secret-access-key',
+            'SessionToken': 'session-token',
+            'Expiration': expiration
+        }} for index, expiration in enumerate(expirations)]
+        return sts
+
+    @patch('terraform_runner.credential_manager.boto3.client')
+    def test_get_credentials_assumes_role_once(self, mock_client):
+        # arrange
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        mock_sts = self.create_sts(expiration)
+        mock_client.return_value = mock_sts
+
+        # act
+        first_credentials = credential_manager.get_credentials('role-arn', 'pp-id', self.credentials_directory)
+        second_credentials = credential_manager.get_credentials('role-arn', 'pp-id', self.credentials_directory)
+
+        # assert
+        mock_sts.assume_role.assert_called_once_with(RoleArn='role-arn', RoleSessionName='pp-id')
+        self.assertEqual(first_credentials, second_credentials)
+        self.assertEqual({
+            'Version': 1,
+            'AccessKeyId': 'access-key-id-0',
+            'SecretAccessKey': 'secret-access-key',
+            'SessionToken': 'session-token',
+            'Expiration': expiration.isoformat()
+        }, second_credentials)
+        credentials_file = os.path.join(self.credentials_directory, credential_manager.CREDENTIALS_FILE_NAME)
+        self.assertEqual(0o600, os.stat(credentials_file).st_mode & 0o777)
+
+    @patch('terraform_runner.credential_manager.boto3.client')
+    def test_get_credentials_refreshes_expiring_credentials(self, mock_client):
+        # arrange
+        expiring = datetime.now(timezone.utc) + timedelta(seconds=credential_manager.REFRESH_MARGIN_SECONDS - 60)
+        mock_sts = self.create_sts(expiring, expiring + timedelta(hours=1))
+        mock_client.return_value = mock_sts
+        credential_manager.get_credentials('role-arn', 'pp-id', self.credentials_directory)
+
+        # act
+        credentials = credential_manager.get_credentials('role-arn', 'pp-id', self.credentials_directory)
+
+        # assert
+        self.assertEqual(2, mock_sts.assume_role.call_count)
+        self.assertEqual('access-key-id-1', credentials['AccessKeyId'])
+
+    @patch('terraform_runner.credential_manager.boto3.client')
+    def test_get_credentials_assume_role_failure(self, mock_client):
+        # arrange
+        mock_client.return_value.assume_role.side_effect = Exception('AccessDenied')
+
+        # act
+        with self.assertRaises(RuntimeError) as context:
+            credential_manager.get_credentials('role-arn', 'pp-id', self.credentials_directory)
+
+        # assert
+        self.assertEqual('Could not assume launch role role-arn: AccessDenied', str(context.exception))
+
+    def test_write_credential_process_config(self):
+        # act
+        config_file = credential_manager.write_credential_process_config('role-arn', 'pp-id', self.credentials_directory)
+
+        # assert
+        with open(config_file, 'r') as file_handle:
+            lines = file_handle.read().splitlines()
+        self.assertEqual(f'[profile {credential_manager.LAUNCH_ROLE_PROFILE}]', lines[0])
+        self.assertTrue(lines[1].startswith('credential_process = '))
+        self.assertIn(f'-m {credential_manager.CREDENTIAL_PROCESS_MODULE} --launch-role role-arn --session-name pp-id '
+                      f'--credentials-directory {self.credentials_directory}', lines[1])
+
+    def test_format_session_name(self):
+        # act
+        session_name = credential_manager.format_session_name('account-id/pp-id')
+        long_session_name = credential_manager.format_session_name('p' * 1000)
+
+        # assert
+        self.assertEqual('account-id-pp-id', session_name)
+        self.assertEqual('p' * credential_manager.MAX_SESSION_NAME_LENGTH, long_session_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
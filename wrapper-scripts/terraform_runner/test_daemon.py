@@ -0,0 +1,135 @@
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+from terraform_runner import daemon
+from terraform_runner.daemon_client import submit_job
+
+FAILING_ARGUMENT = '--fail'
+WAITING_ARGUMENT = '--wait'
+STARTUP_TIMEOUT_SECONDS = 10
+JOB_TIMEOUT_SECONDS = 30
+HOST_WORKSPACES_ROOT = '/mnt/host/workspaces'
+
+
+def fake_run(argv):
+    print(f'job output {argv} {os.environ.get("JOB_VARIABLE")}')
+    if FAILING_ARGUMENT in argv:
+        return 'job failed'
+    if WAITING_ARGUMENT in argv:
+        # Waits to be cancelled, and records the start and the cancellation in the directory after the argument
+        marker_directory = argv[argv.index(WAITING_ARGUMENT) + 1]
+        open(os.path.join(marker_directory, 'started'), 'w').close()
+        try:
+            time.sleep(JOB_TIMEOUT_SECONDS)
+        except RuntimeError as e:
+            with open(os.path.join(marker_directory, 'cancelled'), 'w') as file_handle:
+                file_handle.write(str(e))
+            raise
+    return 0
+
+
+def wait_for_file(path):
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return os.path.exists(path)
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.__temporary_directory.name, 'run', 'daemon.sock')
+        self.daemon_pid = os.fork()
+        if self.daemon_pid == 0:
+            # The daemon logs would otherwise mix with the test output
+            with open(os.devnull, 'w') as devnull:
+                os.dup2(devnull.fileno(), sys.stdout.fileno())
+            try:
+                daemon.serve(self.socket_path, fake_run, [(daemon.WORKSPACES_ROOT_OPTION, HOST_WORKSPACES_ROOT)])
+            finally:
+                os._exit(0)
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while not os.path.exists(self.socket_path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def tearDown(self):
+        os.kill(self.daemon_pid, signal.SIGTERM)
+        os.waitpid(self.daemon_pid, 0)
+        self.__temporary_directory.cleanup()
+
+    def __submit_job(self, argv):
+        with tempfile.TemporaryFile('w+') as stdout, tempfile.TemporaryFile('w+') as stderr:
+            status = submit_job(argv, self.socket_path, stdout, stderr)
+            stdout.seek(0)
+            stderr.seek(0)
+            return status, stdout.read(), stderr.read()
+
+    def test_submit_job_runs_in_daemon_with_client_output_and_environment(self):
+        # arrange
+        os.environ['JOB_VARIABLE'] = 'from-client'
+
+        # act
+        try:
+            status, stdout, stderr = self.__submit_job(['--action=apply'])
+        finally:
+            del os.environ['JOB_VARIABLE']
+
+        # assert
+        self.assertEqual(0, status)
+        self.assertEqual(f"job output ['--workspaces-root', '{HOST_WORKSPACES_ROOT}', '--action=apply'] from-client\n",
+                         stdout)
+        self.assertEqual('', stderr)
+
+    def test_submit_job_keeps_its_own_workspaces_root(self):
+        # act
+        status, stdout, _ = self.__submit_job(['--action=apply', '--workspaces-root=/mnt/job/workspaces'])
+
+        # assert
+        self.assertEqual(0, status)
+        self.assertEqual("job output ['--action=apply', '--workspaces-root=/mnt/job/workspaces'] None\n", stdout)
+
+    def test_submit_job_failure_reports_message_and_status(self):
+        # act
+        status, stdout, stderr = self.__submit_job(['--action=apply', FAILING_ARGUMENT])
+
+        # assert
+        self.assertEqual(1, status)
+        self.assertEqual('job failed\n', stderr)
+
+    def test_job_is_cancelled_when_client_disconnects(self):
+        # arrange
+        marker_directory = self.__temporary_directory.name
+        client_pid = os.fork()
+        if client_pid == 0:
+            with open(os.devnull, 'w') as devnull:
+                try:
+                    submit_job([WAITING_ARGUMENT, marker_directory], self.socket_path, devnull, devnull)
+                finally:
+                    os._exit(0)
+        self.assertTrue(wait_for_file(os.path.join(marker_directory, 'started')))
+
+        # act
+        os.kill(client_pid, signal.SIGKILL)
+        os.waitpid(client_pid, 0)
+
+        # assert
+        self.assertTrue(wait_for_file(os.path.join(marker_directory, 'cancelled')))
+        with open(os.path.join(marker_directory, 'cancelled'), 'r') as file_handle:
+            self.assertEqual(daemon.CANCELLED_JOB_MESSAGE, file_handle.read())
+
+    def test_submit_job_without_daemon(self):
+        # act
+        status = submit_job(['--action=apply'], os.path.join(self.__temporary_directory.name, 'missing.sock'))
+
+        # assert
+        self.assertIsNone(status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from terraform_runner.host_resources import find_usable_directory, get_disk_usage
+
+
+class TestHostResources(unittest.TestCase):
+
+    def test_find_usable_directory_returns_first_usable_candidate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # arrange
+            not_a_directory = f'{directory}/file'
+            with open(not_a_directory, 'w'):
+                pass
+            candidates = [f'{not_a_directory}/workspaces', f'{directory}/nvme/workspaces', f'{directory}/ebs/workspaces']
+
+            # act
+            usable_directory = find_usable_directory(candidates, 0)
+
+            # assert
+            self.assertEqual(f'{directory}/nvme/workspaces', usable_directory)
+            self.assertTrue(os.path.isdir(usable_directory))
+
+    def test_find_usable_directory_skips_candidates_without_free_space(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # act
+            usable_directory = find_usable_directory([f'{directory}/workspaces'], 1 << 60)
+
+            # assert
+            self.assertIsNone(usable_directory)
+
+    def test_get_disk_usage_of_missing_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # act
+            disk_usage = get_disk_usage(f'{directory}/missing/workspaces')
+
+            # assert
+            self.assertEqual(shutil.disk_usage(directory).total, disk_usage.total)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,18 +37,15 @@ class TestOverrideManager(unittest.TestCase):
 
     def test_write_provider_override_happy_path(self):
         # arrange
-        provisioned_product_descriptor = 'account-id/pp-id'
-        launch_role_arn = 'role-arn'
+        profile = 'launch-role-profile'
         region = 'us-east-1'
         tags = [{'key': 'k1', 'value': 'v1'}, {'key': 'k2', 'value': 'v2'}]
         expected_provider_override = {
             'provider': {
                 'aws': {
                     'region': f'{region}',
-                    'assume_role': {
-                        'role_arn': f'{launch_role_arn}',
-                        'session_name': f'{provisioned_product_descriptor}'.replace('/', '-')
-                    },
+                    'profile': f'{profile}',
+                    'assume_role': {'role_arn': ''},
                     'default_tags': {
                         'tags': {'k1': 'v1', 'k2': 'v2'}
                     }
@@ -57,67 +54,43 @@ class TestOverrideManager(unittest.TestCase):
         }
 
         # act
-        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR,
-                                                 provisioned_product_descriptor, launch_role_arn, region, tags)
+        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR, profile, region, tags)
         with open(f'{self.TMP_WORKSPACE_DIR}/{override_manager.PROVIDER_FILE_NAME}', 'r') as json_file:
             actual_provider_override = json.load(json_file)
 
         # assert
         self.assertEqual(expected_provider_override, actual_provider_override)
 
-    def test_write_provider_override_long_pp_descriptor(self):
-        # arrange
-        provisioned_product_descriptor = 'p' * 1000
-        expected_session_name = 'p' * override_manager.MAX_SESSION_NAME_LENGTH
-        launch_role_arn = 'role-arn'
-        region = 'us-east-1'
-        tags = [{'key': 'k1', 'value': 'v1'}, {'key': 'k2', 'value': 'v2'}]
-        expected_provider_override = {
-            'provider': {
-                'aws': {
-                    'region': f'{region}',
-                    'assume_role': {
-                        'role_arn': f'{launch_role_arn}',
-                        'session_name': f'{expected_session_name}'
-                    },
-                    'default_tags': {
-                        'tags': {'k1': 'v1', 'k2': 'v2'}
-                    }
-                }
-            }
-        }
-
+    def test_write_provider_override_clears_assume_role(self):
         # act
-        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR,
-                                                 provisioned_product_descriptor, launch_role_arn, region, tags)
+        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR, 'launch-role-profile', 'us-east-1', None)
         with open(f'{self.TMP_WORKSPACE_DIR}/{override_manager.PROVIDER_FILE_NAME}', 'r') as json_file:
             actual_provider_override = json.load(json_file)
 
         # assert
-        self.assertEqual(expected_provider_override, actual_provider_override)
+        # The override replaces an assume_role block of the artifact, and an empty role_arn assumes no role, so the
+        # provider uses the launch role credentials of the profile as they are
+        self.assertEqual({'role_arn': ''}, actual_provider_override['provider']['aws']['assume_role'])
+        self.assertEqual('launch-role-profile', actual_provider_override['provider']['aws']['profile'])
 
     def test_write_provider_override_no_tags(self):
         # arrange
-        provisioned_product_descriptor = 'account-id/pp-id'
-        launch_role_arn = 'role-arn'
+        profile = 'launch-role-profile'
         region = 'us-east-1'
         tags = None
         expected_provider_override = {
             'provider': {
                 'aws': {
                     'region': f'{region}',
-                    'assume_role': {
-                        'role_arn': f'{launch_role_arn}',
-                        'session_name': f'{provisioned_product_descriptor}'.replace('/', '-')
-                    },
+                    'profile': f'{profile}',
+                    'assume_role': {'role_arn': ''},
                     'default_tags': {'tags': {}}
                 }
             }
         }
 
         # act
-        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR,
-                                                 provisioned_product_descriptor, launch_role_arn, region, tags)
+        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR, profile, region, tags)
         with open(f'{self.TMP_WORKSPACE_DIR}/{override_manager.PROVIDER_FILE_NAME}', 'r') as json_file:
             actual_provider_override = json.load(json_file)
 
@@ -126,26 +99,22 @@ class TestOverrideManager(unittest.TestCase):
 
     def test_write_provider_override_empty_tags(self):
         # arrange
-        provisioned_product_descriptor = 'account-id/pp-id'
-        launch_role_arn = 'role-arn'
+        profile = 'launch-role-profile'
         region = 'us-east-1'
         tags = {}
         expected_provider_override = {
             'provider': {
                 'aws': {
                     'region': f'{region}',
-                    'assume_role': {
-                        'role_arn': f'{launch_role_arn}',
-                        'session_name': f'{provisioned_product_descriptor}'.replace('/', '-')
-                    },
+                    'profile': f'{profile}',
+                    'assume_role': {'role_arn': ''},
                     'default_tags': {'tags': {}}
                 }
             }
         }
 
         # act
-        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR,
-                                                 provisioned_product_descriptor, launch_role_arn, region, tags)
+        override_manager.write_provider_override(self.TMP_WORKSPACE_DIR, profile, region, tags)
         with open(f'{self.TMP_WORKSPACE_DIR}/{override_manager.PROVIDER_FILE_NAME}', 'r') as json_file:
             actual_provider_override = json.load(json_file)
 
@@ -220,6 +189,17 @@ class TestOverrideManager(unittest.TestCase):
         self.assertFalse(
             os.path.exists(f'{self.TMP_WORKSPACE_DIR}/{override_manager.VARIABLE_FILE_NAME}'))
 
+    def test_write_variable_override_no_variables_removes_previous_override(self):
+        # arrange
+        override_manager.write_variable_override(self.TMP_WORKSPACE_DIR, [{'key': 'name', 'value': 'value'}])
+
+        # act
+        override_manager.write_variable_override(self.TMP_WORKSPACE_DIR, [])
+
+        # assert
+        self.assertFalse(
+            os.path.exists(f'{self.TMP_WORKSPACE_DIR}/{override_manager.VARIABLE_FILE_NAME}'))
+
     def tearDown(self):
         # Remove temp files after each test
         override_files = glob.glob(f'{self.TMP_WORKSPACE_DIR}/{self.OVERRIDE_FILES_PATTERN}')
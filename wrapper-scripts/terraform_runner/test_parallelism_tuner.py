@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from terraform_runner import parallelism_tuner
+
+MB = 1024 * 1024
+
+
+class TestParallelismTuner(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.overrides_file = os.path.join(self.__temporary_directory.name, 'parallelism.json')
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __write_overrides(self, overrides):
+        with open(self.overrides_file, 'w') as json_file:
+            json.dump({'overrides': overrides}, json_file)
+
+    def test_calculate_parallelism_idle_host(self):
+        # act
+        parallelism = parallelism_tuner.calculate_parallelism(8, 16 * 1024 * MB, 1, 64 * MB)
+
+        # assert
+        self.assertEqual(32, parallelism)
+
+    def test_calculate_parallelism_idle_small_host_keeps_terraform_default(self):
+        # act
+        parallelism = parallelism_tuner.calculate_parallelism(2, 3 * 1024 * MB, 1, 64 * MB)
+
+        # assert
+        self.assertEqual(10, parallelism)
+
+    def test_calculate_parallelism_shares_cpus_between_active_runs(self):
+        # act
+        parallelism = parallelism_tuner.calculate_parallelism(8, 16 * 1024 * MB, 4, 64 * MB)
+
+        # assert
+        self.assertEqual(8, parallelism)
+
+    def test_calculate_parallelism_limited_by_memory(self):
+        # act
+        parallelism = parallelism_tuner.calculate_parallelism(8, 320 * MB, 1, 64 * MB)
+
+        # assert
+        self.assertEqual(5, parallelism)
+
+    def test_calculate_parallelism_bounds(self):
+        # act
+        busy_parallelism = parallelism_tuner.calculate_parallelism(1, None, 16, 64 * MB)
+        large_host_parallelism = parallelism_tuner.calculate_parallelism(96, None, 1, 64 * MB)
+
+        # assert
+        self.assertEqual(parallelism_tuner.MIN_PARALLELISM, busy_parallelism)
+        self.assertEqual(parallelism_tuner.MAX_PARALLELISM, large_host_parallelism)
+
+    def test_find_parallelism_override_matches_all_patterns(self):
+        # arrange
+        self.__write_overrides([
+            {'artifact_path': 's3://artifacts/network-*', 'provisioned_product_descriptor': 'other/*', 'parallelism': 5},
+            {'artifact_path': 's3://artifacts/network-*', 'parallelism': 30},
+            {'provisioned_product_descriptor': '*', 'parallelism': 10}
+        ])
+
+        # act
+        network_override = parallelism_tuner.find_parallelism_override(
+            self.overrides_file, 's3://artifacts/network-v2.tar.gz', '111122223333/pp-1')
+        destroy_override = parallelism_tuner.find_parallelism_override(self.overrides_file, None, '111122223333/pp-1')
+
+        # assert
+        self.assertEqual(30, network_override)
+        self.assertEqual(10, destroy_override)
+
+    def test_find_parallelism_override_without_file(self):
+        # act
+        override = parallelism_tuner.find_parallelism_override(self.overrides_file, 's3://artifacts/a.tar.gz', 'pp')
+
+        # assert
+        self.assertIsNone(override)
+
+    @patch('terraform_runner.parallelism_tuner.get_available_memory')
+    @patch('terraform_runner.parallelism_tuner.get_cpu_count')
+    def test_choose_parallelism_from_host(self, mock_get_cpu_count, mock_get_available_memory):
+        # arrange
+        mock_get_cpu_count.return_value = 2
+        mock_get_available_memory.return_value = 4096 * MB
+        mock_logger = Mock()
+
+        # act
+        parallelism = parallelism_tuner.choose_parallelism(mock_logger, self.overrides_file,
+                                                           's3://artifacts/a.tar.gz', 'pp', 2, 64 * MB)
+
+        # assert
+        self.assertEqual(4, parallelism)
+        mock_logger.info.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+from terraform_runner.plugin_prewarm import generate_manifest, prewarm_plugin_cache, read_manifest
+
+
+class TestPluginPrewarm(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.plugin_cache_directory = os.path.join(self.__temporary_directory.name, 'plugins')
+        self.mock_logger = Mock()
+        self.mock_metrics = MagicMock()
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __create_package(self, source, version, os_arch='linux_amd64', last_used=None):
+        package = os.path.join(self.plugin_cache_directory, *source.split('/'), version, os_arch)
+        os.makedirs(package)
+        if last_used is not None:
+            os.utime(package, (last_used, last_used))
+
+    def __get_required_providers(self, call):
+        # The configuration is read while terraform init would run, before its directory is removed
+        configuration_directory = call[0][0][1][len('-chdir='):]
+        with open(os.path.join(configuration_directory, 'main.tf.json'), 'r') as json_file:
+            return json.load(json_file)['terraform']['required_providers']
+
+    def test_read_manifest_returns_providers(self):
+        # arrange
+        manifest_file = os.path.join(self.__temporary_directory.name, 'providers.json')
+        with open(manifest_file, 'w') as json_file:
+            json.dump({'providers': [{'source': 'registry.terraform.io/hashicorp/aws', 'version': '5.31.0'}]},
+                      json_file)
+
+        # act
+        providers = read_manifest(manifest_file)
+
+        # assert
+        self.assertEqual(providers, [('registry.terraform.io/hashicorp/aws', '5.31.0')])
+
+    def test_read_manifest_with_invalid_manifest_raises(self):
+        # arrange
+        manifest_file = os.path.join(self.__temporary_directory.name, 'providers.json')
+        with open(manifest_file, 'w') as json_file:
+            json.dump({'providers': [{'source': 'registry.terraform.io/hashicorp/aws'}]}, json_file)
+
+        # act
+        with self.assertRaises(RuntimeError) as context:
+            read_manifest(manifest_file)
+
+        # assert
+        self.assertTrue(str(context.exception).startswith('Invalid provider prewarm manifest'))
+
+    def test_generate_manifest_includes_recently_used_packages(self):
+        # arrange
+        self.__create_package('registry.terraform.io/hashicorp/aws', '5.31.0')
+        self.__create_package('registry.terraform.io/hashicorp/aws', '4.0.0', last_used=time.time() - 30 * 86400)
+        self.__create_package('registry.terraform.io/hashicorp/random', '3.6.0')
+
+        # act
+        manifest = generate_manifest(self.plugin_cache_directory, 7 * 86400)
+
+        # assert
+        self.assertEqual(manifest, {'providers': [
+            {'source': 'registry.terraform.io/hashicorp/aws', 'version': '5.31.0'},
+            {'source': 'registry.terraform.io/hashicorp/random', 'version': '3.6.0'}]})
+
+    @patch('terraform_runner.plugin_prewarm.platform')
+    def test_prewarm_plugin_cache_installs_missing_providers_in_rounds(self, mock_platform):
+        # arrange
+        mock_platform.system.return_value = 'Linux'
+        mock_platform.machine.return_value = 'x86_64'
+        self.__create_package('registry.terraform.io/hashicorp/random', '3.6.0')
+        mock_command_manager = Mock()
+        required_providers = []
+        mock_command_manager.run_command.side_effect = \
+            lambda *args, **kwargs: required_providers.append(self.__get_required_providers((args, kwargs)))
+        providers = [('registry.terraform.io/hashicorp/aws', '5.31.0'),
+                     ('registry.terraform.io/hashicorp/aws', '4.0.0'),
+                     ('registry.terraform.io/hashicorp/random', '3.6.0')]
+
+        # act
+        with patch.dict(os.environ):
+            failed_providers = prewarm_plugin_cache(self.mock_logger, mock_command_manager, providers,
+                                                    self.plugin_cache_directory, self.mock_metrics)
+
+        # assert
+        self.assertEqual(failed_providers, [])
+        self.assertEqual(required_providers, [
+            {'provider_0': {'source': 'registry.terraform.io/hashicorp/aws', 'version': '= 4.0.0'}},
+            {'provider_0': {'source': 'registry.terraform.io/hashicorp/aws', 'version': '= 5.31.0'}}])
+        self.mock_metrics.add_counter.assert_any_call('providers_cached')
+
+    def test_prewarm_plugin_cache_installs_providers_one_by_one_after_failure(self):
+        # arrange
+        mock_command_manager = Mock()
+        # Providers are installed in order of source, and the one by one installs follow the failed round
+        mock_command_manager.run_command.side_effect = [RuntimeError('failed'), RuntimeError('not found'), None]
+        providers = [('registry.terraform.io/hashicorp/aws', '5.31.0'),
+                     ('registry.terraform.io/example/missing', '1.0.0')]
+
+        # act
+        with patch.dict(os.environ):
+            failed_providers = prewarm_plugin_cache(self.mock_logger, mock_command_manager, providers,
+                                                    self.plugin_cache_directory, self.mock_metrics)
+
+        # assert
+        self.assertEqual(failed_providers, [('registry.terraform.io/example/missing', '1.0.0')])
+        self.assertEqual(mock_command_manager.run_command.call_count, 3)
+        self.mock_metrics.add_counter.assert_any_call('providers_failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from terraform_runner.provider_mirror import publish_mirror, sync_mirror, write_cli_config
+
+PACKAGE_PATH = 'registry.terraform.io/hashicorp/aws/terraform-provider-aws_5.0.0_linux_amd64.zip'
+INDEX_PATH = 'registry.terraform.io/hashicorp/aws/index.json'
+
+
+class TestProviderMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.mirror_directory = os.path.join(self.__temporary_directory.name, 'mirror')
+        self.mock_logger = Mock()
+        self.mock_s3 = Mock()
+        self.bucket_objects = {}
+        self.mock_s3.get_paginator.return_value.paginate.side_effect = lambda **kwargs: [{'Contents': [
+            {'Key': key, 'ETag': etag} for key, (etag, _) in self.bucket_objects.items()]}]
+        self.mock_s3.download_file.side_effect = self.__download_file
+
+    def tearDown(self):
+        self.__temporary_directory.cleanup()
+
+    def __download_file(self, bucket, key, file_name):
+        with open(file_name, 'w') as file_handle:
+            file_handle.write(self.bucket_objects[key][1])
+
+    def __read_file(self, path):
+        with open(path, 'r') as file_handle:
+            return file_handle.read()
+
+    def test_sync_mirror_downloads_new_and_changed_files_only(self):
+        # arrange
+        self.bucket_objects = {f'provider-mirror/{PACKAGE_PATH}': ('"1"', 'package'),
+                               f'provider-mirror/{INDEX_PATH}': ('"1"', 'index')}
+        sync_mirror(self.mock_logger, self.mock_s3, 'bucket', 'provider-mirror/', self.mirror_directory)
+        self.bucket_objects[f'provider-mirror/{INDEX_PATH}'] = ('"2"', 'new index')
+
+        # act
+        statistics = sync_mirror(self.mock_logger, self.mock_s3, 'bucket', 'provider-mirror/', self.mirror_directory)
+
+        # assert
+        self.assertEqual(statistics, {'downloaded': 1, 'removed': 0, 'unchanged': 1})
+        self.assertEqual(self.mock_s3.download_file.call_count, 3)
+        self.assertEqual(self.__read_file(os.path.join(self.mirror_directory, INDEX_PATH)), 'new index')
+
+    def test_sync_mirror_removes_files_no_longer_in_bucket(self):
+        # arrange
+        self.bucket_objects = {f'provider-mirror/{PACKAGE_PATH}': ('"1"', 'package'),
+                               f'provider-mirror/{INDEX_PATH}': ('"1"', 'index')}
+        sync_mirror(self.mock_logger, self.mock_s3, 'bucket', 'provider-mirror/', self.mirror_directory)
+        del self.bucket_objects[f'provider-mirror/{PACKAGE_PATH}']
+
+        # act
+        statistics = sync_mirror(self.mock_logger, self.mock_s3, 'bucket', 'provider-mirror/', self.mirror_directory)
+
+        # assert
+        self.assertEqual(statistics, {'downloaded': 0, 'removed': 1, 'unchanged': 1})
+        self.assertFalse(os.path.exists(os.path.join(self.mirror_directory, PACKAGE_PATH)))
+
+    def test_sync_mirror_with_path_outside_mirror_raises_error(self):
+        # arrange
+        self.bucket_objects = {'provider-mirror/../escape.zip': ('"1"', 'package')}
+
+        # act / assert
+        with self.assertRaises(RuntimeError):
+            sync_mirror(self.mock_logger, self.mock_s3, 'bucket', 'provider-mirror/', self.mirror_directory)
+        self.mock_s3.download_file.assert_not_called()
+
+    def test_publish_mirror_uploads_new_packages_and_all_index_files(self):
+        # arrange
+        self.bucket_objects = {f'provider-mirror/{PACKAGE_PATH}': ('"1"', 'package'),
+                               f'provider-mirror/{INDEX_PATH}': ('"1"', 'index')}
+        new_package_path = 'registry.terraform.io/hashicorp/aws/terraform-provider-aws_5.1.0_linux_amd64.zip'
+
+        def mirror_providers(command, stream_output):
+            # terraform providers mirror adds the package and updates the index
+            for relative_path in (new_package_path, INDEX_PATH):
+                with open(os.path.join(command[-1], relative_path), 'w') as file_handle:
+                    file_handle.write('mirrored')
+
+        mock_command_manager = Mock()
+        mock_command_manager.run_command.side_effect = mirror_providers
+
+        # act
+        uploaded_count = publish_mirror(self.mock_logger, mock_command_manager, self.mock_s3, 'bucket',
+                                        'provider-mirror/', [('registry.terraform.io/hashicorp/aws', '5.1.0')],
+                                        ['linux_amd64', 'linux_arm64'], self.mirror_directory)
+
+        # assert
+        self.assertEqual(uploaded_count, 2)
+        command = mock_command_manager.run_command.call_args[0][0]
+        self.assertEqual(command[2:6], ['providers', 'mirror', '-platform=linux_amd64', '-platform=linux_arm64'])
+        uploaded_keys = sorted(call[0][2] for call in self.mock_s3.upload_file.call_args_list)
+        self.assertEqual(uploaded_keys, [f'provider-mirror/{INDEX_PATH}', f'provider-mirror/{new_package_path}'])
+
+    def test_write_cli_config_includes_mirrored_providers(self):
+        # arrange
+        os.makedirs(os.path.join(self.mirror_directory, 'registry.terraform.io', 'hashicorp', 'aws'))
+        cli_config_file = os.path.join(self.__temporary_directory.name, 'mirror.tfrc')
+
+        # act
+        written = write_cli_config(cli_config_file, self.mirror_directory, exclusive=True)
+
+        # assert
+        self.assertTrue(written)
+        cli_config = self.__read_file(cli_config_file)
+        self.assertIn(f'path    = "{self.mirror_directory}"', cli_config)
+        self.assertIn('include = ["registry.terraform.io/hashicorp/aws"]', cli_config)
+        self.assertIn('exclude = ["registry.terraform.io/hashicorp/aws"]', cli_config)
+
+    def test_write_cli_config_with_empty_mirror_removes_config(self):
+        # arrange
+        os.makedirs(self.mirror_directory)
+        cli_config_file = os.path.join(self.__temporary_directory.name, 'mirror.tfrc')
+        with open(cli_config_file, 'w') as file_handle:
+            file_handle.write('stale')
+
+        # act
+        written = write_cli_config(cli_config_file, self.mirror_directory)
+
+        # assert
+        self.assertFalse(written)
+        self.assertFalse(os.path.exists(cli_config_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
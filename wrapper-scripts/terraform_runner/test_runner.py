@@ -0,0 +1,221 @@
+import os
+import tempfile
+import unittest
+from argparse import Namespace
+from unittest.mock import MagicMock, Mock, patch
+
+from terraform_runner import runner
+from terraform_runner.RunMetrics import RunMetrics
+from terraform_runner.WorkspaceManager import PLAN_FILE_NAME
+
+# Module-level names are not mangled, unlike the same names in a class body
+perform_terraform_apply = runner.__perform_terraform_apply
+perform_destroy = runner.__perform_destroy
+
+PARALLELISM_FLAG = '-parallelism=10'
+PLAN_FAILED_RETURN_CODE = 1
+MANAGED_RESOURCE = {'mode': 'managed', 'type': 'aws_s3_bucket', 'name': 'bucket', 'instances': [{'attributes': {}}]}
+DATA_SOURCE = {'mode': 'data', 'type': 'aws_caller_identity', 'name': 'current', 'instances': [{'attributes': {}}]}
+
+
+def create_args(operation):
+    return Namespace(operation=operation, terraform_state_bucket='state-bucket',
+                     provisioned_product_descriptor='111122223333/pp-1234', region='us-east-1')
+
+
+def create_command_manager(plan_return_code=0):
+    """Returns a CommandManager stand-in whose plan ends with the given return code. Like CommandManager, it raises
+    when the return code is not allowed, and terraform plan writes the plan file.
+    """
+    def run_command(command, log_stdout=False, stream_output=False, allowed_return_codes=(0,)):
+        return_code = 0
+        if command[1] == 'plan':
+            open(PLAN_FILE_NAME, 'w').close()
+            return_code = plan_return_code
+        if return_code not in allowed_return_codes:
+            raise RuntimeError(f'Error: {command[1]} failed')
+        return return_code
+
+    command_manager = Mock()
+    command_manager.run_command.side_effect = run_command
+    return command_manager
+
+
+def get_commands(command_manager):
+    return [call[0][0] for call in command_manager.run_command.call_args_list]
+
+
+class TestRunner(unittest.TestCase):
+
+    def setUp(self):
+        # Terraform runs in the workspace directory, where the plan file is written
+        self.__temporary_directory = tempfile.TemporaryDirectory()
+        self.__original_directory = os.getcwd()
+        os.chdir(self.__temporary_directory.name)
+        self.metrics = RunMetrics(Mock(), 'apply', '111122223333/pp-1234')
+
+    def tearDown(self):
+        os.chdir(self.__original_directory)
+        self.__temporary_directory.cleanup()
+
+    def test_update_without_changes_skips_apply(self):
+        # arrange
+        command_manager = create_command_manager(runner.PLAN_NO_CHANGES_RETURN_CODE)
+
+        # act
+        perform_terraform_apply(Mock(), command_manager, create_args(runner.UPDATE_PROVISIONED_PRODUCT_OPERATION),
+                                PARALLELISM_FLAG, self.metrics)
+
+        # assert
+        commands = get_commands(command_manager)
+        self.assertEqual(1, len(commands))
+        self.assertEqual(['terraform', 'plan', '-detailed-exitcode'], commands[0][:3])
+        self.assertIn(f'-out={PLAN_FILE_NAME}', commands[0])
+        self.assertEqual(1, self.metrics.get_summary(0)['counters']['no_change_updates'])
+        self.assertFalse(os.path.exists(PLAN_FILE_NAME))
+
+    def test_update_with_changes_applies_saved_plan(self):
+        # arrange
+        command_manager = create_command_manager(runner.PLAN_CHANGES_PRESENT_RETURN_CODE)
+
+        # act
+        perform_terraform_apply(Mock(), command_manager, create_args(runner.UPDATE_PROVISIONED_PRODUCT_OPERATION),
+                                PARALLELISM_FLAG, self.metrics)
+
+        # assert
+        commands = get_commands(command_manager)
+        self.assertEqual(2, len(commands))
+        self.assertEqual(['terraform', 'apply'], commands[1][:2])
+        self.assertEqual(PLAN_FILE_NAME, commands[1][-1])
+        self.assertIn(PARALLELISM_FLAG, commands[1])
+        self.assertNotIn('-auto-approve', commands[1])
+        self.assertNotIn('no_change_updates', self.metrics.get_summary(0)['counters'])
+        self.assertFalse(os.path.exists(PLAN_FILE_NAME))
+
+    def test_update_with_failed_plan_raises_error(self):
+        # arrange
+        command_manager = create_command_manager(PLAN_FAILED_RETURN_CODE)
+
+        # act
+        with self.assertRaises(RuntimeError):
+            perform_terraform_apply(Mock(), command_manager, create_args(runner.UPDATE_PROVISIONED_PRODUCT_OPERATION),
+                                    PARALLELISM_FLAG, self.metrics)
+
+        # assert
+        self.assertEqual(1, len(get_commands(command_manager)))
+        self.assertFalse(os.path.exists(PLAN_FILE_NAME))
+
+    @patch('terraform_runner.runner.state_exists')
+    def test_first_provision_applies_without_refresh(self, mock_state_exists):
+        # arrange
+        mock_state_exists.return_value = False
+        command_manager = create_command_manager()
+
+        # act
+        perform_terraform_apply(Mock(), command_manager, create_args(runner.PROVISION_PRODUCT_OPERATION),
+                                PARALLELISM_FLAG, self.metrics)
+
+        # assert
+        mock_state_exists.assert_called_once_with('state-bucket', '111122223333/pp-1234', 'us-east-1')
+        commands = get_commands(command_manager)
+        self.assertEqual(1, len(commands))
+        self.assertEqual(['terraform', 'apply', '-auto-approve'], commands[0][:3])
+        self.assertIn('-refresh=false', commands[0])
+        self.assertEqual(1, self.metrics.get_summary(0)['counters']['refresh_skipped'])
+
+    @patch('terraform_runner.runner.state_exists')
+    def test_provision_with_existing_state_applies_with_refresh(self, mock_state_exists):
+        for state_exists_result in [True, RuntimeError('Could not check Terraform state: AccessDenied')]:
+            with self.subTest(state_exists=state_exists_result):
+                # arrange
+                mock_state_exists.side_effect = [state_exists_result]
+                command_manager = create_command_manager()
+
+                # act
+                perform_terraform_apply(Mock(), command_manager, create_args(runner.PROVISION_PRODUCT_OPERATION),
+                                        PARALLELISM_FLAG, self.metrics)
+
+                # assert
+                commands = get_commands(command_manager)
+                self.assertEqual(['terraform', 'apply', '-auto-approve'], commands[0][:3])
+                self.assertNotIn('-refresh=false', commands[0])
+        self.assertNotIn('refresh_skipped', self.metrics.get_summary(0)['counters'])
+
+    @patch('terraform_runner.runner.state_exists')
+    def test_update_plans_and_applies_with_refresh(self, mock_state_exists):
+        # arrange
+        command_manager = create_command_manager(runner.PLAN_CHANGES_PRESENT_RETURN_CODE)
+
+        # act
+        perform_terraform_apply(Mock(), command_manager, create_args(runner.UPDATE_PROVISIONED_PRODUCT_OPERATION),
+                                PARALLELISM_FLAG, self.metrics)
+
+        # assert
+        mock_state_exists.assert_not_called()
+        for command in get_commands(command_manager):
+            self.assertNotIn('-refresh=false', command)
+        self.assertNotIn('refresh_skipped', self.metrics.get_summary(0)['counters'])
+
+    def __perform_destroy(self, command_manager):
+        perform_destroy(Mock(), command_manager, MagicMock(), create_args(None), None, None, PARALLELISM_FLAG,
+                        self.metrics)
+
+    @patch('terraform_runner.runner.read_state')
+    def test_destroy_with_empty_state_is_skipped(self, mock_read_state):
+        for state in [None, {'version': 4, 'resources': []}]:
+            with self.subTest(state=state):
+                # arrange
+                mock_read_state.return_value = state
+                command_manager = create_command_manager()
+
+                # act
+                self.__perform_destroy(command_manager)
+
+                # assert
+                command_manager.run_command.assert_not_called()
+        mock_read_state.assert_called_with('state-bucket', '111122223333/pp-1234', 'us-east-1')
+        self.assertEqual(2, self.metrics.get_summary(0)['counters']['empty_state_destroys'])
+
+    @patch('terraform_runner.runner.read_state')
+    def test_destroy_with_data_sources_only_is_skipped(self, mock_read_state):
+        # arrange
+        mock_read_state.return_value = {'version': 4, 'resources': [DATA_SOURCE]}
+        command_manager = create_command_manager()
+
+        # act
+        self.__perform_destroy(command_manager)
+
+        # assert
+        command_manager.run_command.assert_not_called()
+
+    @patch('terraform_runner.runner.read_state')
+    def test_destroy_with_managed_resources_runs_destroy(self, mock_read_state):
+        # arrange
+        mock_read_state.return_value = {'version': 4, 'resources': [DATA_SOURCE, MANAGED_RESOURCE]}
+        command_manager = create_command_manager()
+
+        # act
+        self.__perform_destroy(command_manager)
+
+        # assert
+        commands = get_commands(command_manager)
+        self.assertEqual(['terraform', 'destroy', '-auto-approve'], commands[-1][:3])
+        self.assertNotIn('empty_state_destroys', self.metrics.get_summary(0)['counters'])
+
+    @patch('terraform_runner.runner.read_state')
+    def test_destroy_when_state_cannot_be_read_runs_destroy(self, mock_read_state):
+        # arrange
+        mock_read_state.side_effect = RuntimeError('Could not read Terraform state: AccessDenied')
+        command_manager = create_command_manager()
+
+        # act
+        self.__perform_destroy(command_manager)
+
+        # assert
+        commands = get_commands(command_manager)
+        self.assertEqual(['terraform', 'init'], commands[0][:2])
+        self.assertEqual(['terraform', 'destroy', '-auto-approve'], commands[-1][:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import io
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+from terraform_runner.s3_downloader import download_file_in_parts
+
+
+class LocalS3:
+    """An in-memory stand-in for the S3 HeadObject and ranged GetObject APIs"""
+
+    def __init__(self, objects, version_id=None):
+        self.objects = objects
+        self.version_id = version_id
+        self.ranges = []
+        self.extra_args = []
+        self.__lock = threading.Lock()
+
+    def head_object(self, Bucket, Key, **kwargs):
+        response = {'ContentLength': len(self.objects[(Bucket, Key)]), 'ETag': '"head-etag"'}
+        if self.version_id:
+            response['VersionId'] = self.version_id
+        return response
+
+    def get_object(self, Bucket, Key, Range, **kwargs):
+        start, end = (int(value) for value in re.fullmatch(r'bytes=(\d+)-(\d+)', Range).groups())
+        with self.__lock:
+            self.ranges.append((start, end))
+            self.extra_args.append(kwargs)
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)][start:end + 1])}
+
+
+class TestS3Downloader(unittest.TestCase):
+
+    def test_download_file_in_parts_reassembles_object(self):
+        # arrange
+        content = os.urandom(10 * 1024 + 17)
+        s3 = LocalS3({('bucket', 'key'): content})
+
+        with tempfile.TemporaryDirectory() as directory:
+            destination = f'{directory}/artifact'
+
+            # act
+            size = download_file_in_parts(s3, 'bucket', 'key', destination, 1024, 4, {'IfMatch': '"etag"'})
+
+            # assert
+            with open(destination, 'rb') as file_handle:
+                self.assertEqual(file_handle.read(), content)
+        self.assertEqual(size, len(content))
+        self.assertEqual(len(s3.ranges), 11)
+        self.assertEqual(sorted(s3.ranges)[-1], (10 * 1024, 10 * 1024 + 16))
+        self.assertTrue(all(extra_args == {'IfMatch': '"etag"'} for extra_args in s3.extra_args))
+
+    def test_download_file_in_parts_without_validator_pins_parts_to_head_etag(self):
+        # arrange
+        s3 = LocalS3({('bucket', 'key'): b'x' * 4096})
+
+        with tempfile.TemporaryDirectory() as directory:
+            # act
+            download_file_in_parts(s3, 'bucket', 'key', f'{directory}/artifact', 1024, 4, {})
+
+        # assert
+        self.assertEqual(len(s3.extra_args), 4)
+        self.assertTrue(all(extra_args == {'IfMatch': '"head-etag"'} for extra_args in s3.extra_args))
+
+    def test_download_file_in_parts_without_validator_pins_parts_to_head_version(self):
+        # arrange
+        s3 = LocalS3({('bucket', 'key'): b'x' * 4096}, version_id='version-1')
+
+        with tempfile.TemporaryDirectory() as directory:
+            # act
+            download_file_in_parts(s3, 'bucket', 'key', f'{directory}/artifact', 1024, 4)
+
+        # assert
+        self.assertTrue(all(extra_args == {'VersionId': 'version-1'} for extra_args in s3.extra_args))
+
+    def test_download_file_in_parts_empty_object(self):
+        # arrange
+        s3 = LocalS3({('bucket', 'key'): b''})
+
+        with tempfile.TemporaryDirectory() as directory:
+            destination = f'{directory}/artifact'
+
+            # act
+            size = download_file_in_parts(s3, 'bucket', 'key', destination, 1024, 4)
+
+            # assert
+            self.assertEqual(os.path.getsize(destination), 0)
+        self.assertEqual(size, 0)
+        self.assertEqual(s3.ranges, [])
+
+    def test_download_file_in_parts_short_part_raises(self):
+        # arrange
+        s3 = LocalS3({('bucket', 'key'): b'x' * 2048})
+        s3.head_object = lambda Bucket, Key, **kwargs: {'ContentLength': 4096, 'ETag': '"head-etag"'}
+
+        with tempfile.TemporaryDirectory() as directory:
+            # act and assert
+            with self.assertRaises(RuntimeError):
+                download_file_in_parts(s3, 'bucket', 'key', f'{directory}/artifact', 1024, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+from botocore.exceptions import ClientError
+
+from terraform_runner.state_manager import read_state, state_exists, count_managed_resources
+
+
+def create_client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'GetObject')
+
+
+class TestStateManager(unittest.TestCase):
+
+    @patch('terraform_runner.state_manager.boto3.client')
+    def test_read_state_happy_path(self, mock_client):
+        # arrange
+        state = {'version': 4, 'resources': []}
+        mock_s3 = Mock()
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(json.dumps(state).encode())}
+        mock_client.return_value = mock_s3
+
+        # act
+        actual = read_state('state-bucket', '111122223333/pp-1234', 'us-east-1')
+
+        # assert
+        self.assertEqual(state, actual)
+        mock_client.assert_called_once_with('s3', region_name='us-east-1')
+        mock_s3.get_object.assert_called_once_with(Bucket='state-bucket', Key='111122223333/pp-1234')
+
+    @patch('terraform_runner.state_manager.boto3.client')
+    def test_read_state_missing_object(self, mock_client):
+        # arrange
+        mock_s3 = Mock()
+        mock_s3.get_object.side_effect = create_client_error('NoSuchKey')
+        mock_client.return_value = mock_s3
+
+        # act
+        actual = read_state('state-bucket', '111122223333/pp-1234', 'us-east-1')
+
+        # assert
+        self.assertIsNone(actual)
+
+    @patch('terraform_runner.state_manager.boto3.client')
+    def test_read_state_access_denied_raises(self, mock_client):
+        # arrange
+        mock_s3 = Mock()
+        mock_s3.get_object.side_effect = create_client_error('AccessDenied')
+        mock_client.return_value = mock_s3
+
+        # act
+        with self.assertRaises(RuntimeError) as context:
+            read_state('state-bucket', '111122223333/pp-1234', 'us-east-1')
+
+        # assert
+        self.assertIn('s3://state-bucket/111122223333/pp-1234', str(context.exception))
+
+    @patch('terraform_runner.state_manager.boto3.client')
+    def test_read_state_invalid_json_raises(self, mock_client):
+        # arrange
+        mock_s3 = Mock()
+        mock_s3.get_object.return_value = {'Body': io.BytesIO(b'not json')}
+        mock_client.return_value = mock_s3
+
+        # act / assert
+        with self.assertRaises(RuntimeError):
+            read_state('state-bucket', '111122223333/pp-1234', 'us-east-1')
+
+    @patch('terraform_runner.state_manager.boto3.client')
+    def test_state_exists(self, mock_client):
+        # arrange
+        mock_s3 = Mock()
+        mock_client.return_value = mock_s3
+
+        # act
+        actual = state_exists('state-bucket', '111122223333/pp-1234', 'us-east-1')
+
+        # assert
+        self.assertTrue(actual)
+        mock_s3.head_object.assert_called_once_with(Bucket='state-bucket', Key='111122223333/pp-1234')
+
+    @patch('terraform_runner.state_manager.boto3.client')
+    def test_state_exists_missing_object(self, mock_client):
+        # arrange
+        mock_s3 = Mock()
+        mock_s3.head_object.side_effect = create_client_error('404')
+        mock_client.return_value = mock_s3
+
+        # act
+        actual = state_exists('state-bucket', '111122223333/pp-1234', 'us-east-1')
+
+        # assert
+        self.assertFalse(actual)
+
+    def test_count_managed_resources_ignores_data_sources(self):
+        # arrange
+        state = {'resources': [
+            {'mode': 'data', 'type': 'aws_caller_identity', 'instances': [{}]},
+            {'mode': 'managed', 'type': 'aws_s3_bucket', 'instances': [{}, {}]},
+            {'mode': 'managed', 'type': 'aws_sqs_queue', 'instances': []}
+        ]}
+
+        # act
+        actual = count_managed_resources(state)
+
+        # assert
+        self.assertEqual(2, actual)
+
+    def test_count_managed_resources_without_state(self):
+        # act / assert
+        self.assertEqual(0, count_managed_resources(None))
+        self.assertEqual(0, count_managed_resources({'version': 4}))
+
+
+if __name__ == '__main__':
+    unittest.main()
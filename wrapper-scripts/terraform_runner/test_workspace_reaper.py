@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import ANY, Mock, patch
+
+from terraform_runner.file_lock import acquire_lock
+from terraform_runner.workspace_reaper import empty_trash, get_trash_directories, get_workspaces_roots, move_to_trash, \
+    reap_orphaned_workspaces, start_trash_reaper, DEFAULT_WORKSPACES_ROOT
+
+
+class TestWorkspaceReaper(unittest.TestCase):
+
+    def test_move_to_trash_renames_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # arrange
+            workspace_directory = f'{directory}/account/pp-id'
+            trash_directory = f'{directory}/.trash'
+            os.makedirs(f'{workspace_directory}/.terraform')
+
+            # act
+            moved = move_to_trash(workspace_directory, trash_directory)
+
+            # assert
+            self.assertTrue(moved)
+            self.assertFalse(os.path.exists(workspace_directory))
+            trash_entries = os.listdir(trash_directory)
+            self.assertEqual(1, len(trash_entries))
+            self.assertTrue(os.path.isdir(f'{trash_directory}/{trash_entries[0]}/.terraform'))
+
+    def test_move_to_trash_missing_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # act
+            moved = move_to_trash(f'{directory}/missing', f'{directory}/.trash')
+
+            # assert
+            self.assertFalse(moved)
+
+    def test_empty_trash_deletes_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # arrange
+            trash_directory = f'{directory}/.trash'
+            for name in ['first', 'second']:
+                os.makedirs(f'{trash_directory}/{name}/.terraform/providers')
+                with open(f'{trash_directory}/{name}/main.tf', 'w') as file_handle:
+                    file_handle.write('terraform {}')
+
+            # act
+            empty_trash(trash_directory)
+
+            # assert
+            self.assertEqual([], os.listdir(trash_directory))
+
+    def test_empty_trash_leaves_entries_to_running_reaper(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # arrange
+            trash_directory = f'{directory}/.trash'
+            os.makedirs(f'{trash_directory}/entry')
+
+            # act
+            with acquire_lock(f'{trash_directory}.lock'):
+                empty_trash(trash_directory)
+
+            # assert
+            self.assertEqual(['entry'], os.listdir(trash_directory))
+
+    def test_empty_trash_missing_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # act / assert
+            empty_trash(f'{directory}/.trash')
+
+    @patch('terraform_runner.workspace_reaper.shutil.which')
+    @patch('terraform_runner.workspace_reaper.subprocess.Popen')
+    def test_start_trash_reaper_runs_detached_at_low_priority(self, mock_popen, mock_which):
+        # arrange
+        mock_which.return_value = '/usr/bin/found'
+
+        # act
+        start_trash_reaper('trash-dir')
+
+        # assert
+        mock_popen.assert_called_once_with(
+            ['ionice', '-c', '3', 'nice', '-n', '19', sys.executable, '-m', 'terraform_runner.workspace_reaper',
+             '--trash-directory', 'trash-dir'],
+            stdin=ANY, stdout=ANY, stderr=ANY, start_new_session=True)
+
+    def test_get_workspaces_roots_ends_with_default_root(self):
+        # act
+        workspaces_roots = get_workspaces_roots(['/mnt/nvme/workspaces', DEFAULT_WORKSPACES_ROOT, '/dev/shm/workspaces'])
+
+        # assert
+        self.assertEqual(['/mnt/nvme/workspaces', DEFAULT_WORKSPACES_ROOT, '/dev/shm/workspaces'], workspaces_roots)
+        self.assertEqual([DEFAULT_WORKSPACES_ROOT], get_workspaces_roots(None))
+
+    def test_get_trash_directories_includes_configured_roots_and_tree_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # arrange
+            for trash_directory in [f'{directory}/nvme/.trash', f'{directory}/trees/.trash']:
+                os.makedirs(trash_directory)
+
+            # act
+            with patch('terraform_runner.workspace_reaper.DEFAULT_WORKSPACES_ROOT', f'{directory}/default'):
+                trash_directories = get_trash_directories([f'{directory}/nvme', f'{directory}/missing'],
+                                                          f'{directory}/trees')
+
+            # assert
+            self.assertEqual([f'{directory}/nvme/.trash', f'{directory}/trees/.trash'], trash_directories)
+
+    def test_reap_orphaned_workspaces_removes_unlocked_workspaces_only(self):
+        with tempfile.TemporaryDirectory() as workspaces_root:
+            # arrange
+            for descriptor in ['account/orphaned', 'account/running', 'account/retained', 'account/unlocked']:
+                os.makedirs(f'{workspaces_root}/{descriptor}/.terraform')
+                os.makedirs(f'{workspaces_root}/.locks/account', exist_ok=True)
+            os.makedirs(f'{workspaces_root}/.staging/account/retained')
+            with open(f'{workspaces_root}/account/retained/.runner-retained-workspace.json', 'w') as file_handle:
+                file_handle.write('{}')
+            for descriptor in ['account/orphaned', 'account/retained']:
+                with open(f'{workspaces_root}/.locks/{descriptor}.lock', 'w'):
+                    pass
+
+            # act
+            with acquire_lock(f'{workspaces_root}/.locks/account/running.lock'):
+                reaped_count = reap_orphaned_workspaces(Mock(), workspaces_root)
+
+            # assert
+            self.assertEqual(3, reaped_count)
+            self.assertEqual(['retained', 'running'], sorted(os.listdir(f'{workspaces_root}/account')))
+            self.assertFalse(os.path.exists(f'{workspaces_root}/.staging/account/retained'))
+            self.assertEqual(3, len(os.listdir(f'{workspaces_root}/.trash')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import argparse
+import os
+from glob import glob
+import shutil
+import subprocess
+import sys
+import uuid
+
+from terraform_runner.CustomLogger import CustomLogger
+from terraform_runner.file_lock import try_acquire_lock
+from terraform_runner.host_resources import get_disk_usage
+
+# Constants
+LOG_PREFIX = 'terraform_runner_reaper'
+TRASH_DIRECTORY_NAME = '.trash'
+LOCKS_DIRECTORY_NAME = '.locks'
+STAGING_DIRECTORY_NAME = '.staging'
+LOCK_FILE_SUFFIX = '.lock'
+# Written in retained workspaces only. Records the files that came from the artifact, and its mtime is the last use.
+RETAINED_WORKSPACE_MANIFEST_FILE_NAME = '.runner-retained-workspace.json'
+# Workspaces are named after provisioned product descriptors, which are <account id>/<provisioned product id>
+WORKSPACE_DIRECTORY_PATTERN = '*/*'
+BYTES_PER_MB = 1024 * 1024
+DEFAULT_WORKSPACES_ROOT = os.path.join(os.path.expanduser('~'), 'workspaces')
+REAPER_MODULE = 'terraform_runner.workspace_reaper'
+# The reaper only uses disk time no run is asking for, and the least CPU priority
+IONICE_COMMAND = ['ionice', '-c', '3']
+NICE_COMMAND = ['nice', '-n', '19']
+
+
+def move_to_trash(directory: str, trash_directory: str) -> bool:
+    """Moves a directory into the trash with a single rename, so it is gone from its path without waiting for its
+    files to be deleted. Returns False when the directory does not exist.
+
+    Parameters:
+
+    directory: str
+        The directory to remove
+    trash_directory: str
+        The trash directory, which must be on the same file system as the directory
+    """
+    os.makedirs(trash_directory, exist_ok=True)
+    try:
+        os.rename(directory, os.path.join(trash_directory, uuid.uuid4().hex))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def empty_trash(trash_directory: str):
+    """Deletes everything in the trash. Only one process empties a trash directory at a time, and the others return
+    immediately. Whatever is moved into the trash while it is being emptied is deleted before the function returns.
+    """
+    while True:
+        with try_acquire_lock(f'{trash_directory}.lock') as acquired:
+            if not acquired:
+                return
+            for entry_name in __list_entries(trash_directory):
+                shutil.rmtree(os.path.join(trash_directory, entry_name), ignore_errors=True)
+
+        # A process that found the lock held while this one was deleting relies on it to delete its entries too
+        if not __list_entries(trash_directory):
+            return
+
+
+def start_trash_reaper(trash_directory: str):
+    """Empties the trash in a detached background process at low CPU and I/O priority, so the caller neither waits
+    for it nor keeps it alive
+    """
+    command = [sys.executable, '-m', REAPER_MODULE, '--trash-directory', trash_directory]
+    if shutil.which(NICE_COMMAND[0]):
+        command = NICE_COMMAND + command
+    if shutil.which(IONICE_COMMAND[0]):
+        command = IONICE_COMMAND + command
+    # The reaper must not hold the output of the run open, or the SSM command would wait for it
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+
+def get_workspaces_roots(configured_roots: list) -> list:
+    """Returns the directories a runner given these workspaces roots can create workspaces in, in order of preference.
+    Runs fall back to the default workspaces root, so it is always the last.
+    """
+    workspaces_roots = []
+    for workspaces_root in (configured_roots or []) + [DEFAULT_WORKSPACES_ROOT]:
+        if workspaces_root not in workspaces_roots:
+            workspaces_roots.append(workspaces_root)
+    return workspaces_roots
+
+
+def get_trash_directories(workspaces_roots: list, extracted_tree_store_directory: str) -> list:
+    """Returns the trash directories of the workspaces roots and of the extracted tree store that exist and that the
+    current user can empty
+
+    Parameters:
+
+    workspaces_roots: list of str
+        The workspaces roots the runs are configured with. The default workspaces root is always included.
+    extracted_tree_store_directory: str
+        The extracted tree store the runs are configured with, or None
+    """
+    directories = get_workspaces_roots(workspaces_roots) + ([extracted_tree_store_directory]
+                                                            if extracted_tree_store_directory else [])
+    trash_directories = [os.path.join(directory, TRASH_DIRECTORY_NAME) for directory in directories]
+    return [trash_directory for trash_directory in trash_directories
+            if os.path.isdir(trash_directory) and os.access(trash_directory, os.W_OK | os.X_OK)]
+
+
+def reap_orphaned_workspaces(log: CustomLogger, workspaces_root: str) -> int:
+    """Moves the workspaces and staging directories left behind by runs that ended without cleaning up, for example
+    when the host or the SSM agent died, to the trash. Returns the number of directories moved.
+
+    Every run holds the lock of its workspace until it has cleaned up, so a workspace whose lock is free belongs to no
+    live run. Retained workspaces are kept, since their time to live is enforced by the runs.
+
+    Parameters:
+
+    log: CustomLogger
+        The object used to write logs
+    workspaces_root: str
+        The directory the workspaces are created in
+    """
+    locks_directory = os.path.join(workspaces_root, LOCKS_DIRECTORY_NAME)
+    descriptors = set()
+    for lock_file in glob(os.path.join(locks_directory, '**', f'*{LOCK_FILE_SUFFIX}'), recursive=True):
+        descriptors.add(os.path.relpath(lock_file, locks_directory)[:-len(LOCK_FILE_SUFFIX)])
+    # Hidden directories such as the trash do not match
+    for workspace_directory in glob(os.path.join(workspaces_root, WORKSPACE_DIRECTORY_PATTERN)):
+        if os.path.isdir(workspace_directory):
+            descriptors.add(os.path.relpath(workspace_directory, workspaces_root))
+
+    trash_directory = os.path.join(workspaces_root, TRASH_DIRECTORY_NAME)
+    reaped_count = 0
+    for descriptor in sorted(descriptors):
+        workspace_directory = os.path.join(workspaces_root, descriptor)
+        staging_directory = os.path.join(workspaces_root, STAGING_DIRECTORY_NAME, descriptor)
+        with try_acquire_lock(os.path.join(locks_directory, f'{descriptor}{LOCK_FILE_SUFFIX}')) as acquired:
+            if not acquired:
+                continue
+            orphaned_directories = [staging_directory]
+            if not os.path.isfile(os.path.join(workspace_directory, RETAINED_WORKSPACE_MANIFEST_FILE_NAME)):
+                orphaned_directories.append(workspace_directory)
+            for directory in orphaned_directories:
+                if move_to_trash(directory, trash_directory):
+                    log.info(f'Reaped orphaned directory {directory}')
+                    reaped_count += 1
+    return reaped_count
+
+
+def log_disk_pressure(log: CustomLogger, path: str):
+    disk_usage = get_disk_usage(path)
+    log.info(f'{path} has {disk_usage.free // BYTES_PER_MB} MB free of {disk_usage.total // BYTES_PER_MB} MB '
+             f'({disk_usage.used * 100 // disk_usage.total}% used)')
+
+
+def __list_entries(trash_directory):
+    try:
+        return os.listdir(trash_directory)
+    except FileNotFoundError:
+        return []
+
+
+def __parse_arguments():
+    parser = argparse.ArgumentParser(
+        description = 'Removes orphaned terraform_runner workspaces and deletes the workspaces moved to the trash')
+    parser.add_argument('--workspaces-root', action = 'append',
+        help = f'A directory workspaces are created in. Repeat for several. {DEFAULT_WORKSPACES_ROOT} is always included.')
+    parser.add_argument('--trash-directory',
+        help = 'Only empty this trash directory, without looking for orphaned workspaces')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = __parse_arguments()
+    if args.trash_directory:
+        empty_trash(args.trash_directory)
+    else:
+        log = CustomLogger(LOG_PREFIX)
+        # Runs fall back to the default workspaces root, so its orphans are reaped whatever roots are given
+        for workspaces_root in get_workspaces_roots(args.workspaces_root):
+            if not os.path.isdir(workspaces_root):
+                continue
+            reap_orphaned_workspaces(log, workspaces_root)
+            empty_trash(os.path.join(workspaces_root, TRASH_DIRECTORY_NAME))
+            log_disk_pressure(log, workspaces_root)